@@ -0,0 +1,74 @@
+# adaptive.py - 自适应帧率与舵机移动时间：按实测耗时决定处理节奏，按实际命令间隔决定 move_time
+import time
+import numpy as np
+from config import FPS, FPS_MIN, RATE_HEADROOM, RATE_WINDOW, MOVE_TIME_MIN, MOVE_TIME_MAX
+
+
+class AdaptiveRate:
+    """
+    根据实测的每帧处理耗时选择能持续跑满的最高帧率（不超过 max_fps，不低于 min_fps）
+    并行的各阶段（例如推理线程和主线程）分别记录耗时，吞吐由最慢的阶段决定:
+        间隔 = max(各阶段最近 window 帧耗时的 p90) × headroom
+    每个阶段只应由一个线程调用 record；interval 可以在任意线程读取
+    """
+
+    def __init__(self, stages=('detect', 'main'), min_fps=FPS_MIN, max_fps=FPS,
+                 headroom=RATE_HEADROOM, window=RATE_WINDOW):
+        self.min_interval = 1 / max_fps
+        self.max_interval = 1 / min_fps
+        self.headroom = headroom
+        self.samples = {stage: np.zeros(window) for stage in stages}
+        self.counts = dict.fromkeys(stages, 0)
+        self.interval = self.min_interval
+        # 统计
+        self.skipped = 0
+
+    def record(self, stage, seconds):
+        """记录一帧在 stage 阶段的耗时（秒），每记录 10 帧重新估算一次间隔"""
+        samples = self.samples[stage]
+        samples[self.counts[stage] % len(samples)] = seconds
+        self.counts[stage] += 1
+        if self.counts[stage] % 10 == 0:
+            self._update()
+
+    def _update(self):
+        busy = max(np.percentile(samples[:min(self.counts[stage], len(samples))], 90)
+                   for stage, samples in self.samples.items() if self.counts[stage])
+        target = min(max(busy * self.headroom, self.min_interval), self.max_interval)
+        # 变慢立即跟上，变快缓慢恢复，避免在两个帧率之间来回跳
+        self.interval = target if target > self.interval else 0.8 * self.interval + 0.2 * target
+
+    def set_max_fps(self, max_fps):
+        """运行中修改帧率上限（配置热加载），当前间隔随之限制到新的下限"""
+        self.min_interval = 1 / max_fps
+        self.interval = max(self.interval, self.min_interval)
+
+    @property
+    def fps(self):
+        return 1 / self.interval
+
+    def stats(self):
+        return f"当前 {self.fps:.1f} FPS, 跳过 {self.skipped} 帧"
+
+
+class MoveTimeEstimator:
+    """
+    舵机移动时间跟随实际的命令间隔：新命令到达时上一段动作刚好走完，不会停顿也不会被打断
+    间隔取指数平滑值，限制在 [min_ms, max_ms]；两次命令相隔过久（例如暂停后）按 max_ms 计
+    """
+
+    def __init__(self, initial_ms=int(1000 / FPS), min_ms=MOVE_TIME_MIN, max_ms=MOVE_TIME_MAX, alpha=0.3):
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.alpha = alpha
+        self.interval_ms = float(initial_ms)
+        self._last = None
+
+    def update(self, now=None):
+        """记录一次命令发送，返回本次应使用的 move_time（毫秒，整数）"""
+        now = time.monotonic() if now is None else now
+        if self._last is not None:
+            elapsed = min((now - self._last) * 1000, self.max_ms)
+            self.interval_ms += self.alpha * (elapsed - self.interval_ms)
+        self._last = now
+        return int(min(max(self.interval_ms, self.min_ms), self.max_ms))
@@ -0,0 +1,264 @@
+# batch.py - 离线批量提取：多进程把视频逐帧转换成 BlendShape 时间线、把图片集转换成 BlendShape 和舵机角度（无窗口）
+import glob
+import os
+import time
+import multiprocessing as mp_proc
+import cv2
+import numpy as np
+import mediapipe as mp
+from config import (BS_NAMES, BATCH_OUTPUT_DIR, VIDEO_EXTENSIONS, IMAGE_EXTENSIONS, CALIBRATION_PROFILE,
+                    DETECTION_CACHE_ENABLED)
+from mapping import NUM_BLENDSHAPES, NUM_SERVOS, blendshapes_to_vector
+from landmarker import create_detector, RunningMode
+from calibration import load_mapper
+from detection_cache import DetectionCache, cached_detect
+
+# 每个工作进程各自持有一个检测器，在进程初始化时创建（图片模式下第一次缓存未命中时才创建）
+_detector = None
+_cache = None
+
+
+def _init_worker():
+    """工作进程初始化：创建本进程专用的 FaceLandmarker"""
+    global _detector
+    # 各段互相独立、可能乱序交给同一进程，用 IMAGE 模式避免跨段的跟踪状态
+    _detector = create_detector(RunningMode.IMAGE)
+
+
+def _seek(cap, start):
+    """按帧号跳转到第 start 帧，跳转后的位置不是 start 时返回 False"""
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    return int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == start
+
+
+def _seeks_precisely(cap, total):
+    """切分前在视频中间试跳一次：很多编码按帧号跳转并不精确，这种视频不能分段并行"""
+    probe = total // 2
+    return _seek(cap, probe) and cap.grab() and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == probe + 1
+
+
+def _extract_segment(task):
+    """
+    处理视频中 [start, stop) 帧
+    返回 (视频序号, 起始帧, blendshapes(N,52), 是否检测到人脸(N,), 每帧时间戳(N,) 毫秒)
+    时间戳取解码器给出的该帧播放时间（CAP_PROP_POS_MSEC），可变帧率的视频也是真实时间
+    """
+    video_idx, video_path, start, stop = task
+    cap = cv2.VideoCapture(video_path)
+    if start and not _seek(cap, start):
+        print(f'  警告: {video_path} 跳转到第 {start} 帧不准确')
+    rows, detected, timestamps = [], [], []
+    empty = np.zeros(NUM_BLENDSHAPES, dtype=np.float32)
+    # stop 为 None 表示一直读到视频结尾
+    while stop is None or start + len(rows) < stop:
+        ret, frame_bgr = cap.read()
+        if not ret:
+            break
+        timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+        result = _detector.detect(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb))
+        if result.face_blendshapes:
+            rows.append(blendshapes_to_vector(result.face_blendshapes[0]))
+            detected.append(True)
+        else:
+            rows.append(empty)
+            detected.append(False)
+    cap.release()
+    blendshapes = np.array(rows, dtype=np.float32).reshape(-1, NUM_BLENDSHAPES)
+    return video_idx, start, blendshapes, np.array(detected, dtype=bool), np.array(timestamps, dtype=np.float64)
+
+
+def list_videos(path):
+    """单个视频文件直接返回，目录则返回其中所有视频文件（按文件名排序）"""
+    if os.path.isdir(path):
+        return [os.path.join(path, f) for f in sorted(os.listdir(path))
+                if os.path.splitext(f)[1].lower() in VIDEO_EXTENSIONS]
+    return [path]
+
+
+def _split_video(video_idx, video_path, workers):
+    """
+    按帧数把视频切成若干段，段数约为进程数的4倍以均衡负载，返回 (帧率, 报告的帧数, 各段)
+    容器报告的帧数常常只是估计值，所以最后一段不设终点、一直读到视频结尾
+    不能按帧号精确跳转的视频不切分：每段都从头逐帧 grab 到起点的话总解码量随段数平方增长
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f'错误: 无法打开视频文件: {video_path}')
+        return 0, 0, []
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    precise = total > 0 and _seeks_precisely(cap, total)
+    cap.release()
+    if total <= 0:
+        # 帧数未知时不切分，整段读到结尾
+        return fps, 0, [(video_idx, video_path, 0, None)]
+    if not precise:
+        print(f'  {video_path} 不支持按帧号精确跳转，整段顺序处理')
+        return fps, total, [(video_idx, video_path, 0, None)]
+    seg_len = max(30, -(-total // (workers * 4)))
+    starts = list(range(0, total, seg_len))
+    stops = starts[1:] + [None]
+    return fps, total, [(video_idx, video_path, start, stop) for start, stop in zip(starts, stops)]
+
+
+def _save_timeline(out_path, fps, expected, parts, video_path):
+    """
+    按帧顺序拼接各段并保存：timestamps_ms(N,) / blendshapes(N,52) / detected(N,)
+    parts 为 [(起始帧, 终止帧, blendshapes, detected, timestamps_ms)]
+    解码出的帧数与报告的帧数不同、某段没读满或时间戳不递增（跳转不准）时打印警告
+    """
+    blendshapes = np.concatenate([p[2] for p in parts]) if parts else np.zeros((0, NUM_BLENDSHAPES), np.float32)
+    detected = np.concatenate([p[3] for p in parts]) if parts else np.zeros(0, bool)
+    timestamps_ms = np.concatenate([p[4] for p in parts]) if parts else np.zeros(0)
+    for start, stop, segment, _, _ in parts:
+        if stop is not None and len(segment) != stop - start:
+            print(f'  警告: {video_path} 第 {start}~{stop} 帧只解码出 {len(segment)} 帧')
+    if expected and len(blendshapes) != expected:
+        print(f'  警告: {video_path} 解码出 {len(blendshapes)} 帧，视频报告 {expected} 帧')
+    if len(timestamps_ms) > 1 and not timestamps_ms.any():
+        # 个别后端不提供播放时间，只能按标称帧率推算
+        print(f'  警告: {video_path} 读不到帧时间戳，按 {fps:.2f} FPS 推算')
+        timestamps_ms = np.arange(len(blendshapes), dtype=np.float64) * (1000.0 / fps)
+    elif np.any(np.diff(timestamps_ms) <= 0):
+        print(f'  警告: {video_path} 帧时间戳不递增（分段跳转可能不准），请用 workers=1 重新提取核对')
+    np.savez(out_path, timestamps_ms=timestamps_ms, blendshapes=blendshapes,
+             detected=detected, names=np.array(BS_NAMES), fps=fps)
+    return len(blendshapes)
+
+
+def extract_blendshapes(path, out_dir=BATCH_OUTPUT_DIR, workers=None):
+    """
+    批量提取入口：path 为视频文件或目录，每个视频输出 out_dir/<文件名>.npz
+    各段并行处理，imap 保证结果按提交顺序返回，因此即使后面的段先完成也按帧顺序写出
+    """
+    videos = list_videos(path)
+    if not videos:
+        print(f'错误: 没有找到视频文件 - {path}')
+        return
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+
+    tasks, fps_list, expected, remaining = [], [], [], []
+    for idx, video_path in enumerate(videos):
+        fps, total, segments = _split_video(idx, video_path, workers)
+        fps_list.append(fps)
+        expected.append(total)
+        remaining.append(len(segments))
+        tasks.extend(segments)
+    print(f'[Batch] {len(videos)} 个视频, {len(tasks)} 段, {workers} 个进程')
+
+    start_time = time.time()
+    total_frames = 0
+    parts = [[] for _ in videos]
+    with mp_proc.Pool(workers, initializer=_init_worker) as pool:
+        for task, (video_idx, start, blendshapes, detected, timestamps) in zip(tasks, pool.imap(_extract_segment, tasks)):
+            parts[video_idx].append((start, task[3], blendshapes, detected, timestamps))
+            remaining[video_idx] -= 1
+            if remaining[video_idx] == 0:
+                name = os.path.splitext(os.path.basename(videos[video_idx]))[0]
+                out_path = os.path.join(out_dir, name + '.npz')
+                frames = _save_timeline(out_path, fps_list[video_idx], expected[video_idx],
+                                        parts[video_idx], videos[video_idx])
+                parts[video_idx] = None
+                total_frames += frames
+                print(f'  {videos[video_idx]} → {out_path} ({frames} 帧)')
+
+    total_time = time.time() - start_time
+    fps = total_frames / total_time if total_time > 0 else 0
+    print(f'[Batch] 完成: {total_frames} 帧, 耗时 {total_time:.2f} 秒, {fps:.1f} 帧/秒')
+
+
+# ------------------ 图片集 ------------------
+def _init_image_worker():
+    """图片工作进程初始化：打开检测缓存，检测器等到第一张未命中的图片才创建"""
+    global _cache
+    _cache = DetectionCache() if DETECTION_CACHE_ENABLED else None
+
+
+def _detect(path):
+    global _detector
+    if _detector is None:
+        _detector = create_detector(RunningMode.IMAGE)
+    return _detector.detect(mp.Image.create_from_file(path))
+
+
+def _extract_image(path):
+    """
+    处理一张图片，返回 (blendshapes(52,), 是否检测到人脸, 是否来自缓存, 错误信息)
+    读取失败的图片不中断整批，记为未检测到并返回错误信息
+    """
+    empty = np.zeros(NUM_BLENDSHAPES, dtype=np.float32)
+    try:
+        result, hit = cached_detect(path, lambda: _detect(path), _cache)
+    except Exception as e:
+        return empty, False, False, str(e)
+    if not result.face_blendshapes:
+        return empty, False, hit, ''
+    return blendshapes_to_vector(result.face_blendshapes[0]), True, hit, ''
+
+
+def list_images(path):
+    """单个图片文件、目录（递归，按路径排序）或通配符（如 'photos/**/*.jpg'）"""
+    if os.path.isdir(path):
+        images = [os.path.join(root, f) for root, _, files in os.walk(path) for f in files]
+    elif glob.has_magic(path):
+        images = glob.glob(path, recursive=True)
+    else:
+        return [path] if os.path.isfile(path) else []
+    return sorted(p for p in images if os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS)
+
+
+def default_image_output(path):
+    """目录 photos/ → output/photos.npz，通配符或单个文件 → output/images.npz"""
+    name = os.path.basename(os.path.normpath(path)) if os.path.isdir(path) else 'images'
+    return os.path.join(BATCH_OUTPUT_DIR, name + '.npz')
+
+
+def extract_images(path, out_path=None, workers=None):
+    """
+    批量处理图片集：path 为目录或通配符，结果按列保存到一个 .npz:
+      paths(N,) 相对路径 / blendshapes(N,52) / servo_angles(N,20) / detected(N,) / names(52,)
+    未检测到人脸的图片 BlendShape 和舵机角度都为 0；检测在进程池中并行（imap 保持输入顺序），舵机角度在主进程按当前映射（含 CALIBRATION_PROFILE）计算
+    """
+    images = list_images(path)
+    if not images:
+        print(f'错误: 没有找到图片 - {path}')
+        return
+    out_path = out_path or default_image_output(path)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(images)))
+    chunksize = max(1, min(64, len(images) // (workers * 8)))
+    print(f'[Batch] {len(images)} 张图片, {workers} 个进程')
+
+    mapper = load_mapper(CALIBRATION_PROFILE)
+    blendshapes = np.zeros((len(images), NUM_BLENDSHAPES), dtype=np.float32)
+    angles = np.zeros((len(images), NUM_SERVOS), dtype=np.int16)
+    detected = np.zeros(len(images), dtype=bool)
+    hits = 0
+    errors = []
+
+    start_time = time.time()
+    with mp_proc.Pool(workers, initializer=_init_image_worker) as pool:
+        for i, (vector, found, hit, error) in enumerate(pool.imap(_extract_image, images, chunksize)):
+            blendshapes[i] = vector
+            detected[i] = found
+            hits += hit
+            if error:
+                errors.append((images[i], error))
+            if found:
+                mapper.compute(vector, out=angles[i])
+    total_time = time.time() - start_time
+
+    root = path if os.path.isdir(path) else os.path.commonpath([os.path.dirname(p) or '.' for p in images])
+    paths = np.array([os.path.relpath(p, root) for p in images])
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    np.savez(out_path, paths=paths, blendshapes=blendshapes, servo_angles=angles, detected=detected,
+             names=np.array(BS_NAMES), servo_ids=np.arange(1, NUM_SERVOS + 1))
+
+    for image, error in errors[:5]:
+        print(f'  读取失败: {image}: {error}')
+    if len(errors) > 5:
+        print(f'  ……共 {len(errors)} 张读取失败')
+    rate = len(images) / total_time if total_time > 0 else 0
+    print(f'[Batch] 完成: {len(images)} 张, 检测到人脸 {int(detected.sum())} 张, 缓存命中 {hits} 张, '
+          f'耗时 {total_time:.2f} 秒, {rate:.1f} 张/秒 → {out_path}')
@@ -0,0 +1,226 @@
+# e2e_latency.py - 端到端延迟基准：画面出现 → 检测 → 映射 → 发送 → 舵机控制器收到命令
+#
+# 无窗口、只用CPU，可在服务器上定期运行跟踪回归:
+#   python benchmarks/e2e_latency.py [--frames 600] [--fps 30] [--transport tcp|udp] [--json out.json]
+#
+# 控制器用进程内的替身：直接复用 服务器.py 的连接处理/帧解析代码，收到每一帧时按帧头里的
+# 画面（采集）时间戳计算端到端延迟，按发送时间戳计算其中的传输延迟。画面序列在 张嘴/闭嘴 与 睁眼/闭眼 之间交替，检测不到人脸的图片会被跳过。
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+import mediapipe as mp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # 模型和测试图片都按项目根目录的相对路径查找
+
+import tools
+import 服务器 as controller
+from landmarker import create_detector, RunningMode
+from profiler import StageProfiler
+from sender import ServoSender
+
+# 张嘴/闭嘴、睁眼/闭眼 交替
+DEFAULT_IMAGES = ['tests/张嘴.png', 'tests/闭嘴.png', 'tests/睁眼.png', 'tests/闭眼.png']
+# 上面的图片都检测不到人脸时改用这些
+FALLBACK_IMAGES = 'tests/test_image*'
+
+
+class StandInController(threading.Thread):
+    """进程内的舵机控制器替身：在后台事件循环里跑 服务器.py 的 TCP/UDP 接收代码，端口自动分配"""
+
+    def __init__(self, host='127.0.0.1'):
+        super().__init__(name='StandInController', daemon=True)
+        self.host = host
+        self.port = None
+        self.targets = controller.PendingTargets()
+        self.tcp_latency = controller.LatencyStats()
+        self.udp_latency = controller.LatencyStats()
+        self.udp = None
+        self._ready = threading.Event()
+        self._loop = None
+        self._done = None
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._done = self._loop.create_future()
+        server = await asyncio.start_server(
+            lambda r, w: controller.handle_client(r, w, self.targets, self.tcp_latency), self.host, 0)
+        self.port = server.sockets[0].getsockname()[1]
+        transport, self.udp = await self._loop.create_datagram_endpoint(
+            lambda: controller.UdpServoProtocol(self.targets, self.udp_latency), local_addr=(self.host, self.port))
+        self._ready.set()
+        try:
+            await self._done
+        finally:
+            transport.close()
+            server.close()
+
+    def start(self):
+        super().start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(lambda: self._done.done() or self._done.set_result(None))
+        self.join(5)
+
+
+def load_frames(paths):
+    """读取图片并用 IMAGE 模式试检测一次，只保留检测得到人脸的，返回 [(路径, rgb)]"""
+    frames = []
+    detector = create_detector(RunningMode.IMAGE)
+    try:
+        for path in paths:
+            bgr = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if bgr is None:
+                print(f'  跳过 {path}: 无法读取')
+                continue
+            rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+            if not detector.detect(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)).face_blendshapes:
+                print(f'  跳过 {path}: 未检测到人脸')
+                continue
+            frames.append((path, rgb))
+    finally:
+        detector.close()
+    return frames
+
+
+def percentiles_ms(stats, samples):
+    """LatencyStats 中的一组样本（stats.end_to_end / stats.transport）→ {count, p50, p95, p99, max}（ms）"""
+    data = stats.recent(samples) * 1000
+    if not len(data):
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(data, [50, 95, 99])
+    return {'count': stats.count, 'p50': round(p50, 3), 'p95': round(p95, 3),
+            'p99': round(p99, 3), 'max': round(data.max(), 3)}
+
+
+def run_benchmark(frames, count, fps, transport):
+    """
+    按 fps 节奏（0 表示尽可能快）依次"呈现"画面并走完整条处理路径
+    画面出现的时间写入帧头，替身收到后计算端到端延迟
+    """
+    controller.VERBOSE = False
+    server = StandInController().start()
+    sender = ServoSender(server.host, server.port, tools.ACTIVE_SERVOS, transport=transport, verbose=False)
+    sender.start()
+    tools.servo_sender = sender
+    # 等待连接和协议协商完成，避免把建连时间算进第一帧
+    deadline = time.monotonic() + 5
+    while not sender.connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    profiler = StageProfiler('e2e', dump_interval=0)
+    sender.profiler = profiler
+    detector = create_detector(RunningMode.VIDEO)
+    interval = 1 / fps if fps else 0
+    no_face = 0
+    t0 = time.monotonic()
+    try:
+        for i in range(count):
+            # 按节奏等到下一帧"出现"
+            delay = t0 + i * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            t_glass = time.time()
+            t = time.monotonic()
+            _, rgb = frames[i % len(frames)]
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
+            result = detector.detect_for_video(mp_image, int(i * 1000 / (fps or 30)))
+            t = profiler.lap('detect', t)
+            if not result.face_blendshapes:
+                no_face += 1
+                continue
+            bs_dict = {b.category_name: b.score for b in result.face_blendshapes[0]}
+            angles = tools.process_all_servos(bs_dict)
+            t = profiler.lap('map', t)
+            tools.send_servo_commands(angles, capture_time=t_glass)
+            profiler.lap('send', t)
+        elapsed = time.monotonic() - t0
+        # 等发送队列清空、替身收完最后几帧
+        time.sleep(0.2)
+    finally:
+        detector.close()
+        sender.close()
+        tools.servo_sender = None
+        server.stop()
+
+    latency = server.udp_latency if transport == 'udp' else server.tcp_latency
+    result = {
+        'frames': count,
+        'target_fps': fps,
+        'transport': transport,
+        'protocol': 'binary' if sender.use_binary else 'text',
+        'sustained_fps': round(count / elapsed, 2) if elapsed > 0 else 0,
+        'no_face_frames': no_face,
+        'sent': sender.frames_sent,
+        'dropped_in_queue': sender.dropped,
+        'end_to_end_ms': percentiles_ms(latency, latency.end_to_end),
+        'transport_ms': percentiles_ms(latency, latency.transport),
+        'stages_ms': profiler.snapshot(),
+    }
+    if transport == 'udp':
+        result['udp'] = {'accepted': server.udp.accepted, 'lost': server.udp.lost, 'reordered': server.udp.reordered}
+    return result
+
+
+def print_result(result):
+    e2e = result['end_to_end_ms']
+    print(f"\n传输 {result['transport']}/{result['protocol']}, {result['frames']} 帧, 目标 {result['target_fps'] or '不限'} FPS")
+    print(f"持续处理帧率: {result['sustained_fps']} FPS, 未检测到人脸: {result['no_face_frames']} 帧, "
+          f"发送 {result['sent']} 帧, 队列丢弃 {result['dropped_in_queue']} 帧")
+    if e2e['count']:
+        print(f"端到端延迟 (收到 {e2e['count']} 帧): p50 {e2e['p50']:.2f} ms, p95 {e2e['p95']:.2f} ms, "
+              f"p99 {e2e['p99']:.2f} ms, max {e2e['max']:.2f} ms")
+        link = result['transport_ms']
+        print(f"  其中传输 (发送→接收): p50 {link['p50']:.2f} ms, p95 {link['p95']:.2f} ms, "
+              f"p99 {link['p99']:.2f} ms, max {link['max']:.2f} ms")
+    else:
+        print("端到端延迟: 控制器没有收到带时间戳的帧（文本协议不带时间戳）")
+    for stage, row in result['stages_ms'].items():
+        print(f"  {stage:<8} p50 {row['p50']:8.2f}  p95 {row['p95']:8.2f}  p99 {row['p99']:8.2f}  max {row['max']:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端（画面→舵机控制器）延迟基准')
+    parser.add_argument('--frames', type=int, default=600, help='呈现的帧数')
+    parser.add_argument('--fps', type=float, default=30, help='画面节奏，0 表示尽可能快（测持续帧率）')
+    parser.add_argument('--transport', choices=('tcp', 'udp'), default='tcp')
+    parser.add_argument('--images', nargs='*', default=DEFAULT_IMAGES, help='交替呈现的图片')
+    parser.add_argument('--json', help='把结果另存为 JSON，便于跟踪回归')
+    args = parser.parse_args()
+
+    print('加载测试图片:')
+    frames = load_frames(args.images)
+    if len(frames) < 2:
+        fallback = sorted(glob.glob(FALLBACK_IMAGES))
+        print(f'可用图片不足两张，改用 {FALLBACK_IMAGES}:')
+        frames = load_frames(fallback)
+    if not frames:
+        print('错误: 没有可检测到人脸的测试图片')
+        sys.exit(1)
+    print('画面序列: ' + ' → '.join(os.path.basename(p) for p, _ in frames))
+
+    result = run_benchmark(frames, args.frames, args.fps, args.transport)
+    result['images'] = [p for p, _ in frames]
+    print_result(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f'结果已保存: {args.json}')
+
+
+if __name__ == '__main__':
+    main()
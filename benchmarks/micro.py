@@ -0,0 +1,240 @@
+# micro.py - 每帧热路径的微基准：映射、平滑、编码、服务器解析
+#
+#   python benchmarks/micro.py [--frames 2000] [--recording x.rfrec] [--only 名字...]
+#   python benchmarks/micro.py --save          # 保存为基线 benchmarks/baseline.json
+#   python benchmarks/micro.py --compare       # 与基线对比，变慢超过阈值的标出来
+#
+# 输入是一串 52 维 BlendShape 字典：默认随机生成（相邻帧缓慢变化，接近真实表情），
+# 也可以用录制文件里的原始 BlendShape。每个用例按帧轮流喂入，报告 ns/op 和每帧分配的内存。
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import tools
+import 服务器 as controller
+from config import BS_NAMES
+from mapping import ServoMapper, blendshapes_to_vector, NUM_BLENDSHAPES
+from protocol import FrameEncoder, TextEncoder
+from recording import open_recording
+from sender import DeadbandFilter
+from calibration import build_profile
+from prediction import Predictor
+from smoothing import create_smoother
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+REGRESSION_THRESHOLD = 0.10  # 比基线慢 10% 以上视为回归
+
+
+def random_frames(n, seed=0):
+    """随机游走生成 n 帧 BlendShape 向量，每帧在 [0,1] 内小幅变化"""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 0.05, (n, NUM_BLENDSHAPES))
+    vectors = np.clip(rng.random(NUM_BLENDSHAPES) + np.cumsum(steps, axis=0), 0, 1)
+    return vectors.astype(np.float32)
+
+
+def recorded_frames(path):
+    """录制文件中平滑前的原始 BlendShape"""
+    return np.array(open_recording(path)['blendshapes'], dtype=np.float32)
+
+
+def to_dicts(vectors):
+    """转成 FaceLandmarker 结果经 blendshapes_to_dict 之后的形式"""
+    return [dict(zip(BS_NAMES, v.tolist())) for v in vectors]
+
+
+# ---------- 用例：每个函数接收输入数据，返回 op(i)，i 为帧号 ----------
+def smoothing_bench(kind):
+    def bench(data):
+        smoother, vectors = create_smoother(kind), data['vectors64']
+        out = np.zeros(NUM_BLENDSHAPES)
+        return lambda i: smoother(vectors[i], i / 30, out)
+    return bench
+
+
+def bench_predict(data):
+    predictor, vectors = Predictor(), data['vectors64']
+    out = np.zeros(NUM_BLENDSHAPES)
+    return lambda i: predictor(vectors[i], i / 30, 0.1, out)
+
+
+def bench_process_all_servos(data):
+    tools.smoother.reset()
+    tools.predictor.reset()
+    dicts = data['dicts']
+    return lambda i: tools.process_all_servos(dicts[i], timestamp=i / 30)
+
+
+def bench_blendshapes_to_vector(data):
+    dicts, out = data['dicts'], np.zeros(NUM_BLENDSHAPES, dtype=np.float32)
+    return lambda i: blendshapes_to_vector(dicts[i], out=out)
+
+
+def bench_mapper_compute(data):
+    mapper, vectors = ServoMapper(), data['vectors']
+    out = np.zeros(20, dtype=np.int16)
+    return lambda i: mapper.compute(vectors[i], out=out)
+
+
+def bench_lut_compute(data):
+    lut, vectors = build_profile(np.zeros(NUM_BLENDSHAPES), np.ones(NUM_BLENDSHAPES)), data['vectors']
+    out = np.zeros(20, dtype=np.int16)
+    return lambda i: lut.compute(vectors[i], out=out)
+
+
+def bench_map_value(data):
+    values = data['vectors'][:, BS_NAMES.index('jawOpen')].tolist()
+    return lambda i: tools.map_value(values[i], 0.01, 0.8, 0, 58)
+
+
+def bench_text_encode(data):
+    encoder, angles = TextEncoder(tools.ACTIVE_SERVOS), data['angles']
+    return lambda i: encoder.encode(i, 0.0, angles[i], 33)
+
+
+def bench_frame_encode(data):
+    encoder, angles = FrameEncoder(tools.ACTIVE_SERVOS), data['angles']
+    return lambda i: encoder.encode(i, 0.0, angles[i], 33)
+
+
+def bench_deadband_select(data):
+    deadband, angles = DeadbandFilter(tools.ACTIVE_SERVOS), data['angles']
+    return lambda i: deadband.select(angles[i])
+
+
+def bench_server_parse_data(data):
+    encoder = TextEncoder(tools.ACTIVE_SERVOS)
+    lines = [encoder.encode(i, 0.0, a, 33).decode() for i, a in enumerate(data['angles'])]
+    return lambda i: controller.parse_data(lines[i])
+
+
+def bench_server_parse_frames(data):
+    encoder = FrameEncoder(tools.ACTIVE_SERVOS)
+    frames = [encoder.encode(i, 0.0, a, 33) for i, a in enumerate(data['angles'])]
+    return lambda i: controller.parse_frames(frames[i])
+
+
+BENCHMARKS = {
+    'smooth.ema': smoothing_bench('ema'),
+    'smooth.one_euro': smoothing_bench('one_euro'),
+    'smooth.kalman': smoothing_bench('kalman'),
+    'predict': bench_predict,
+    'process_all_servos': bench_process_all_servos,
+    'blendshapes_to_vector': bench_blendshapes_to_vector,
+    'mapper.compute': bench_mapper_compute,
+    'lut.compute': bench_lut_compute,
+    'map_value': bench_map_value,
+    'text_encode': bench_text_encode,
+    'frame_encode': bench_frame_encode,
+    'deadband.select': bench_deadband_select,
+    'server.parse_data': bench_server_parse_data,
+    'server.parse_frames': bench_server_parse_frames,
+}
+
+
+def measure(make_op, data, frames, repeat=5):
+    """
+    返回 (ns/op, 每帧分配字节数)
+    时间取 repeat 轮中最快的一轮；内存用 tracemalloc 逐帧统计峰值减去起点（临时分配的上界）
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        op = make_op(data)
+        start = time.perf_counter_ns()
+        for i in range(frames):
+            op(i)
+        best = min(best, (time.perf_counter_ns() - start) / frames)
+
+    op = make_op(data)
+    sample = min(frames, 200)
+    allocated = 0
+    tracemalloc.start()
+    try:
+        for i in range(sample):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            op(i)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return best, allocated / sample
+
+
+def run(names, vectors):
+    data = {
+        'vectors': vectors,
+        'vectors64': vectors.astype(np.float64),
+        'dicts': to_dicts(vectors),
+        'angles': [ServoMapper().compute(v).copy() for v in vectors],
+    }
+    results = {}
+    for name in names:
+        ns, alloc = measure(BENCHMARKS[name], data, len(vectors))
+        results[name] = {'ns_per_op': round(ns, 1), 'bytes_per_op': round(alloc, 1)}
+        print(f"{name:<24}{ns:>12,.0f} ns/op{alloc:>12,.0f} B/op")
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """打印与基线的对比，返回回归的用例名"""
+    print(f"\n与基线对比 ({baseline.get('created', '?')}):")
+    regressions = []
+    for name, row in results.items():
+        base = baseline['results'].get(name)
+        if not base:
+            print(f"  {name:<24}基线中没有该用例")
+            continue
+        change = row['ns_per_op'] / base['ns_per_op'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  ← 变慢'
+            regressions.append(name)
+        print(f"  {name:<24}{base['ns_per_op']:>12,.0f} → {row['ns_per_op']:>10,.0f} ns/op ({change:+.1%})"
+              f"  {base['bytes_per_op']:>8,.0f} → {row['bytes_per_op']:>8,.0f} B/op{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='热路径微基准')
+    parser.add_argument('--frames', type=int, default=2000, help='随机输入的帧数')
+    parser.add_argument('--recording', help='用录制文件中的 BlendShape 作为输入')
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help='只运行指定用例')
+    parser.add_argument('--save', action='store_true', help='把结果保存为基线')
+    parser.add_argument('--compare', action='store_true', help='与基线对比，有回归时返回非零退出码')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    vectors = recorded_frames(args.recording) if args.recording else random_frames(args.frames)
+    if not len(vectors):
+        print('错误: 录制文件中没有帧')
+        sys.exit(1)
+    source = args.recording or f'随机 {len(vectors)} 帧'
+    print(f"输入: {source}\n")
+    results = run(args.only or list(BENCHMARKS), vectors)
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'input': source,
+                       'python': sys.version.split()[0], 'numpy': np.__version__, 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {args.baseline}")
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"错误: 基线文件不存在 - {args.baseline}")
+            sys.exit(1)
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print(f"\n{len(regressions)} 个用例比基线慢 {REGRESSION_THRESHOLD:.0%} 以上")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
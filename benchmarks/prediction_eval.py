@@ -0,0 +1,147 @@
+# prediction_eval.py - 用录制文件评估延迟补偿：外推前后舵机相对人脸的滞后还剩多少
+#
+#   python benchmarks/prediction_eval.py <录制文件...> [--latency 60] [--filter one_euro] [--json out.json]
+#
+# 录制文件里是平滑前的原始 BlendShape 和采集时间。按实际管线重放：平滑 → (外推) ，
+# 第 i 帧的输出在 t_i + lead 时刻到达舵机（lead = 处理延迟 latency + 舵机移动时间，移动时间取帧间隔）。
+# 对每组通道求使 “舵机轨迹” 与 “人脸轨迹往后平移 lag” 误差最小的 lag，即舵机实际滞后人脸的时间:
+#   不平滑不外推时 lag ≈ lead，外推得越准 lag 越接近 0
+# 同时给出 lag=0 时的误差（舵机到位时与人脸当时表情的差距）和过冲量（超出人脸附近一段时间取值范围的部分）。
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import BS_NAMES, SMOOTHING_FILTER, SMOOTHING_GROUPS
+from prediction import Predictor
+from recording import open_recording
+from smoothing import FILTERS, create_smoother
+
+LAG_STEP = 0.002      # 滞后搜索步长（秒）
+ACTIVE_STD = 0.02     # 标准差低于此值的通道几乎不动，不参与评估
+
+
+def channel_groups():
+    """{组名: 通道下标}，未归组的通道归入 other"""
+    groups = {group: [] for group in SMOOTHING_GROUPS}
+    groups['other'] = []
+    for i, name in enumerate(BS_NAMES):
+        for group, prefixes in SMOOTHING_GROUPS.items():
+            if name.startswith(tuple(prefixes)):
+                groups[group].append(i)
+                break
+        else:
+            groups['other'].append(i)
+    return {group: np.array(index, dtype=int) for group, index in groups.items()}
+
+
+def replay(raw, times, filter_kind, latency, move_time, predict):
+    """逐帧重放平滑（和外推），返回每帧输出"""
+    smoother = create_smoother(filter_kind) if filter_kind != 'none' else None
+    predictor = Predictor() if predict else None
+    out = np.empty_like(raw)
+    vector = np.zeros(raw.shape[1])
+    for i in range(len(raw)):
+        vector[:] = raw[i]
+        if smoother:
+            smoother(vector, times[i], vector)
+        if predictor:
+            predictor(vector, times[i], latency + move_time, vector)
+        out[i] = vector
+    return out
+
+
+def shifted(raw, times, at):
+    """人脸在 at 时刻的各通道取值（线性插值），返回 (len(at), 通道数)"""
+    return np.stack([np.interp(at, times, raw[:, c]) for c in range(raw.shape[1])], axis=1)
+
+
+def evaluate(raw, times, out, lead, channels, max_lag):
+    """返回 {'lag_ms', 'rmse', 'overshoot'}：舵机轨迹 out(t_i + lead) 对比人脸轨迹 raw"""
+    # 舵机在 t_i + lead 到位；两端留出余量，避免插值越界
+    valid = (times + lead - max_lag >= times[0]) & (times + lead + max_lag <= times[-1])
+    arrive = times[valid] + lead
+    robot = out[valid][:, channels]
+    face = raw[:, channels]
+    lags = np.arange(-max_lag, max_lag + LAG_STEP / 2, LAG_STEP)
+    errors = [np.mean((robot - shifted(face, times, arrive - lag)) ** 2) for lag in lags]
+    best = int(np.argmin(errors))
+    # 过冲：超出人脸在 [到位前 2·lead, 到位后 lead] 内取值范围的部分
+    span = max(1, int(round(lead / np.median(np.diff(times)))))
+    index = np.searchsorted(times, arrive)
+    overshoot = 0.0
+    for k, i in enumerate(index):
+        window = face[max(0, i - 2 * span):i + span + 1]
+        overshoot += np.sum(np.maximum(robot[k] - window.max(axis=0), 0) + np.maximum(window.min(axis=0) - robot[k], 0))
+    return {
+        'lag_ms': round(lags[best] * 1000, 1),
+        'rmse': round(float(np.sqrt(np.interp(0, lags, errors))), 4),
+        'overshoot': round(overshoot / robot.size, 4),
+    }
+
+
+def evaluate_recording(path, filter_kind, latency):
+    rec = open_recording(path)
+    if len(rec) < 10:
+        raise ValueError(f'帧数太少: {path} ({len(rec)} 帧)')
+    raw = np.array(rec['blendshapes'], dtype=np.float64)
+    times = np.array(rec['timestamp'], dtype=np.float64)
+    move_time = float(np.median(np.diff(times)))
+    lead = latency + move_time
+    max_lag = lead + 0.1
+    outputs = {
+        'raw': raw,
+        'smoothed': replay(raw, times, filter_kind, latency, move_time, False),
+        'predicted': replay(raw, times, filter_kind, latency, move_time, True),
+    }
+    active = raw.std(axis=0) >= ACTIVE_STD
+    results = {}
+    for group, channels in channel_groups().items():
+        channels = channels[active[channels]]
+        if not len(channels):
+            continue
+        results[group] = {name: evaluate(raw, times, out, lead, channels, max_lag)
+                          for name, out in outputs.items()}
+    return {'path': path, 'frames': len(rec), 'lead_ms': round(lead * 1000, 1), 'groups': results}
+
+
+def print_result(result):
+    print(f"\n{result['path']}: {result['frames']} 帧, 外推时间 {result['lead_ms']} ms")
+    print(f"  {'group':<8}{'':>10}{'lag ms':>10}{'rmse':>10}{'overshoot':>11}")
+    for group, rows in result['groups'].items():
+        for k, (name, row) in enumerate(rows.items()):
+            print(f"  {group if k == 0 else '':<8}{name:>10}{row['lag_ms']:>10.1f}{row['rmse']:>10.4f}{row['overshoot']:>11.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用录制文件评估延迟补偿（外推）')
+    parser.add_argument('recordings', nargs='+', help='录制文件 (.rfrec)')
+    parser.add_argument('--latency', type=float, default=60, help='采集到发出命令的处理延迟（毫秒）')
+    parser.add_argument('--filter', choices=['none'] + list(FILTERS), default=SMOOTHING_FILTER, help='平滑滤波器')
+    parser.add_argument('--json', help='把结果另存为 JSON')
+    args = parser.parse_args()
+
+    results = []
+    for path in args.recordings:
+        try:
+            result = evaluate_recording(path, args.filter, args.latency / 1000)
+        except (OSError, ValueError) as e:
+            print(f"跳过 {path}: {e}")
+            continue
+        print_result(result)
+        results.append(result)
+    if not results:
+        sys.exit(1)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'filter': args.filter, 'latency_ms': args.latency, 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f'结果已保存: {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+# calibration.py - 演员校准：由中性表情和夸张表情两段录制求出每个通道的基线和峰值，
+#                 把整条 BlendShape→舵机角度 的传递函数编译成量化查找表，保存到磁盘
+#
+# 校准后的通道值 x' = clip((x - 基线) / (峰值 - 基线), 0, 1)：演员放松时为 0、做到最大时为 1，
+# 之后照常套用 mapping.SERVO_RULES（权重、灵敏度、输入窗口、角度范围）。
+# 每个分支的每一层只依赖一个通道，所以按该通道原始值量化成 levels 级、逐级算好驱动值和角度，
+# 运行时每个舵机只需按通道值查表，再按驱动值挑出生效的那一行。
+#
+#   python calibration.py <演员名> <neutral.rfrec> <extreme.rfrec>   # 由已有录制编译
+#   python calibration.py --recompile calibration/<演员名>.npz      # 改了灵敏度/角度范围后按原基线重新编译
+import os
+import sys
+import time
+import numpy as np
+from config import (BS_NAMES, CALIBRATION_DIR, CALIBRATION_LEVELS, CALIBRATION_MIN_RANGE,
+                    CALIBRATION_PEAK_PERCENTILE)
+from mapping import ServoMapper, NUM_BLENDSHAPES, NUM_SERVOS
+from recording import open_recording
+
+PROFILE_VERSION = 1
+
+
+def derive_profile(neutral, extreme, peak_percentile=CALIBRATION_PEAK_PERCENTILE, min_range=CALIBRATION_MIN_RANGE):
+    """
+    neutral / extreme: (N,52) 原始 BlendShape
+    返回 (基线, 峰值, 是否覆盖)：基线取中性段中位数，峰值取两段合并后的 peak_percentile 分位数
+    峰值与基线相差不到 min_range 的通道视为校准时没有做到，保持原值（基线 0、峰值 1）
+    """
+    neutral = np.asarray(neutral, dtype=np.float64).reshape(-1, NUM_BLENDSHAPES)
+    extreme = np.asarray(extreme, dtype=np.float64).reshape(-1, NUM_BLENDSHAPES)
+    if not len(neutral) or not len(extreme):
+        raise ValueError('中性表情和夸张表情都至少需要一帧')
+    baseline = np.median(neutral, axis=0)
+    peak = np.percentile(np.concatenate([neutral, extreme]), peak_percentile, axis=0)
+    covered = peak - baseline >= min_range
+    return np.where(covered, baseline, 0.0), np.where(covered, peak, 1.0), covered
+
+
+def compile_tables(baseline, peak, levels=CALIBRATION_LEVELS, mapper=None):
+    """
+    把 “校准 → 映射规则” 编译成查找表，每个舵机 2×width 行：先反向分支各层，再主分支各层
+    返回 (channels, drive, angle)：第 r 行读取通道 channels[r]，
+    drive[r, q] / angle[r, q] 为该通道原始值落在第 q 级（中心 (q+0.5)/levels）时这一行的驱动值和舵机角度（截断取整）
+    """
+    mapper = mapper or ServoMapper()
+    cols = 2 * NUM_SERVOS
+    grid = (np.arange(levels) + 0.5) / levels
+    order = [k * cols + branch * NUM_SERVOS + servo
+             for servo in range(NUM_SERVOS) for branch in (1, 0) for k in range(mapper.width)]
+    channels = np.zeros(len(order), dtype=np.intp)
+    drive = np.empty((len(order), levels), dtype=np.float32)
+    angle = np.empty((len(order), levels), dtype=np.int16)
+    for r, row in enumerate(order):
+        col = row % cols
+        weights = mapper.weights[row]
+        channel = int(np.argmax(np.abs(weights)))
+        channels[r] = channel
+        x = np.clip((grid - baseline[channel]) / (peak[channel] - baseline[channel]), 0, 1)
+        drive[r] = weights[channel] * x + mapper.bias[row]
+        value = np.clip(drive[r].astype(np.float64) * mapper.scale[col] + mapper.offset[col],
+                        mapper.low[col], mapper.high[col])
+        angle[r] = value.astype(np.int16)
+    return channels, drive, angle
+
+
+class LutMapper:
+    """
+    查找表映射引擎，接口与 ServoMapper 相同（compute(52维向量, out) → 20个 int16 角度）
+    每个舵机的各行中驱动值最大者生效（并列时取排在前面的反向分支，与 ServoMapper 的比较规则一致），
+    每帧：量化通道值 → 查驱动值表 → 每个舵机取 argmax → 查角度表，全部写入预分配缓冲区
+    """
+
+    def __init__(self, channels, drive, angle, width, baseline=None, peak=None, performer=''):
+        self.levels = drive.shape[1]
+        self.width = width
+        self.baseline, self.peak, self.performer = baseline, peak, performer
+        self.channels = np.ascontiguousarray(channels, dtype=np.intp)
+        self.drive = np.ascontiguousarray(drive, dtype=np.float32).ravel()
+        self.angle = np.ascontiguousarray(angle, dtype=np.int16).ravel()
+        rows = len(self.channels)
+        group = rows // NUM_SERVOS
+        # 第 r 行的表在扁平数组里的起点；第 i 个舵机的第一行
+        self.row_offsets = np.arange(rows, dtype=np.intp) * self.levels
+        self.servo_rows = np.arange(NUM_SERVOS, dtype=np.intp) * group
+        # 量化用的常数先转成 float32 标量，避免每帧转换 Python 数
+        self._scale = np.float32(self.levels)
+        self._zero = np.float32(0)
+        self._top = np.float32(self.levels - 1)
+
+        # 预分配的中间缓冲区
+        self._scaled = np.empty(NUM_BLENDSHAPES, dtype=np.float32)
+        self._index = np.empty(NUM_BLENDSHAPES, dtype=np.intp)
+        self._lookup = np.empty(rows, dtype=np.intp)
+        self._terms = np.empty(rows, dtype=np.float32)
+        self._grouped = self._terms.reshape(NUM_SERVOS, group)
+        self._choice = np.empty(NUM_SERVOS, dtype=np.intp)
+        self._chosen = np.empty(NUM_SERVOS, dtype=np.intp)
+
+    @classmethod
+    def load(cls, path):
+        """读取 save_profile 保存的演员文件，格式或维数不对时抛出 ValueError"""
+        with np.load(path) as data:
+            if int(data['version']) != PROFILE_VERSION:
+                raise ValueError(f'校准文件版本不兼容: {path}')
+            if list(data['names']) != BS_NAMES:
+                raise ValueError(f'校准文件的 BlendShape 顺序与当前不一致: {path}')
+            return cls(data['channels'], data['drive'], data['angle'], int(data['width']),
+                       data['baseline'], data['peak'], str(data['performer']))
+
+    def compute(self, bs_vector, out=None):
+        """
+        输入: 52维 BlendShape 向量
+        返回: 20个舵机角度的 int16 数组，第 i 项对应舵机 i+1
+        """
+        scaled, index, lookup, choice = self._scaled, self._index, self._lookup, self._choice
+        # 通道值 → 量化级（截断取整，限制在表内）
+        np.multiply(bs_vector, self._scale, out=scaled)
+        np.maximum(scaled, self._zero, out=scaled)
+        np.minimum(scaled, self._top, out=scaled)
+        index[:] = scaled
+        # 每行按自己的通道查驱动值，每个舵机取驱动值最大的一行，再查该行的角度
+        index.take(self.channels, out=lookup)
+        lookup += self.row_offsets
+        self.drive.take(lookup, out=self._terms)
+        self._grouped.argmax(axis=1, out=choice)
+        choice += self.servo_rows
+        lookup.take(choice, out=self._chosen)
+        if out is None:
+            out = np.empty(NUM_SERVOS, dtype=np.int16)
+        self.angle.take(self._chosen, out=out)
+        return out
+
+
+def build_profile(baseline, peak, performer='', levels=CALIBRATION_LEVELS, mapper=None):
+    """按基线和峰值编译出 LutMapper；mapper 为编译好的固定规则，默认按当前 config 的灵敏度和角度范围"""
+    mapper = mapper or ServoMapper()
+    channels, drive, angle = compile_tables(baseline, peak, levels, mapper)
+    return LutMapper(channels, drive, angle, mapper.width, baseline, peak, performer)
+
+
+def save_profile(lut, path):
+    """保存为 .npz：查找表本身加上基线和峰值（便于之后按新的映射参数重新编译）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez_compressed(path, version=PROFILE_VERSION, performer=lut.performer, created=time.time(),
+                        names=np.array(BS_NAMES), width=lut.width, channels=lut.channels,
+                        drive=lut.drive.reshape(len(lut.channels), -1),
+                        angle=lut.angle.reshape(len(lut.channels), -1),
+                        baseline=lut.baseline, peak=lut.peak)
+
+
+def profile_path(performer):
+    return os.path.join(CALIBRATION_DIR, f'{performer}.npz')
+
+
+def load_mapper(path=None):
+    """
+    path 为空时返回按固定规则的 ServoMapper；否则读取演员校准文件
+    文件缺失或无效时打印原因并退回固定规则，不影响启动
+    """
+    if not path:
+        return ServoMapper()
+    try:
+        lut = LutMapper.load(path)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"读取校准文件失败，使用默认映射: {e}")
+        return ServoMapper()
+    print(f"已加载演员校准: {lut.performer or path} ({lut.levels} 级查找表)")
+    return lut
+
+
+def calibrate(performer, neutral, extreme, path=None):
+    """由两段原始 BlendShape 求基线和峰值、编译并保存，返回 (LutMapper, 保存路径, 是否覆盖)"""
+    baseline, peak, covered = derive_profile(neutral, extreme)
+    lut = build_profile(baseline, peak, performer)
+    path = path or profile_path(performer)
+    save_profile(lut, path)
+    return lut, path, covered
+
+
+def print_summary(lut, covered):
+    print(f"基线/峰值（只列出校准覆盖的 {int(covered.sum())} 个通道）:")
+    for i in np.flatnonzero(covered):
+        print(f"  {BS_NAMES[i]:<22}{lut.baseline[i]:8.3f} → {lut.peak[i]:.3f}")
+    missing = [BS_NAMES[i] for i in np.flatnonzero(~covered)]
+    if missing:
+        print(f"未覆盖（保持原值）: {', '.join(missing)}")
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--recompile':
+        try:
+            old = LutMapper.load(sys.argv[2])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        save_profile(build_profile(old.baseline, old.peak, old.performer, old.levels), sys.argv[2])
+        print(f"已按当前映射参数重新编译: {sys.argv[2]}")
+        return
+    if len(sys.argv) != 4:
+        print('Usage:')
+        print('  python calibration.py <演员名> <neutral.rfrec> <extreme.rfrec>')
+        print('  python calibration.py --recompile <profile.npz>')
+        sys.exit(1)
+    performer, neutral_path, extreme_path = sys.argv[1:]
+    try:
+        neutral = open_recording(neutral_path)['blendshapes']
+        extreme = open_recording(extreme_path)['blendshapes']
+        lut, path, covered = calibrate(performer, neutral, extreme)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    print_summary(lut, covered)
+    print(f"校准文件已保存: {path}（在 config.py 中设置 CALIBRATION_PROFILE 使用）")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,30 @@ ip = '127.0.0.1'  # 示例IP（根据需要调整）
 
 port = 8888  # 示例端口（根据需要调整）
 
+# 多人脸模式（run.py 6）：每个机器人头一个控制器地址，第 i 个被跟踪到的人脸驱动第 i 个头
+HEADS = [(ip, port)]
+# HEADS = [('192.168.31.118', 8888), ('192.168.31.119', 8888)]  # 示例：两个头
+FACE_MATCH_DISTANCE = 0.15  # 相邻帧人脸中心距离（归一化坐标）小于此值视为同一人
+FACE_MAX_MISSING = 15       # 连续这么多帧没出现的人脸释放其机器人头
+
+# 通讯格式: 'binary' 连接时尝试协商二进制帧（服务器不支持则自动退回文本），'text' 始终使用文本
+PROTOCOL = 'binary'
+NEGOTIATE_TIMEOUT = 0.5  # 等待服务器握手回复的秒数
+
+# 传输方式: 'tcp' 可靠有序；'udp' 每个数据报一整帧二进制命令（带序号和时间戳），服务器丢弃迟到的旧帧
+TRANSPORT = 'tcp'
+
+# 死区过滤：只发送角度变化超过 DEADBAND_DEGREES 的舵机，每 KEYFRAME_INTERVAL 帧发送一次全量关键帧
+DEADBAND_ENABLED = False
+DEADBAND_DEGREES = 1
+KEYFRAME_INTERVAL = 30
+
+# 发送线程：队列长度（满了丢弃最旧的帧）、连接超时、断线重连的退避间隔（秒）
+SEND_QUEUE_SIZE = 4
+CONNECT_TIMEOUT = 1.0
+RECONNECT_MIN_DELAY = 0.2
+RECONNECT_MAX_DELAY = 5.0
+
 # 模型路径
 MODEL_PATH = 'face_landmarker_v2_with_blendshapes.task'
 
@@ -13,14 +37,103 @@ MODEL_PATH = 'face_landmarker_v2_with_blendshapes.task'
 DEFAULT_IMG_PATH = 'tests/ZZ.jpg'      # 模式1默认测试图
 DEFAULT_VIDEO_PATH = 'tests/test_video.mp4'  # 模式3默认测试视频
 
-# 摄像头帧率
+# 离线批量处理输出目录及识别为视频的扩展名
+BATCH_OUTPUT_DIR = 'output'
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+# 静态图片检测结果缓存：按 图片内容 + 模型文件 + 检测参数 的哈希存放在 DETECTION_CACHE_DIR，
+# 同一张图再次处理时直接读取、不做推理；总大小超过上限时删除最久未用的条目
+DETECTION_CACHE_ENABLED = True
+DETECTION_CACHE_DIR = 'cache'
+DETECTION_CACHE_MAX_MB = 256
+
+# 摄像头帧率（ADAPTIVE_RATE 开启时为上限）
 FPS = 30
+# 自适应帧率：按实测每帧耗时的 p90 × RATE_HEADROOM 选择处理间隔，帧率不低于 FPS_MIN；跟不上时跳帧而不是积压
+ADAPTIVE_RATE = True
+FPS_MIN = 10
+RATE_HEADROOM = 1.2
+RATE_WINDOW = 60
+# 舵机移动时间跟随实际命令间隔，限制在这个范围内（毫秒）
+MOVE_TIME_MIN = 10
+MOVE_TIME_MAX = 200
+# 会话录制：开启后摄像头/视频模式把每帧的 BlendShape 和舵机角度写入 RECORD_DIR
+RECORD_ENABLED = False
+RECORD_DIR = 'recordings'
+# 演员校准（run.py 7 录制中性表情和夸张表情，编译成查找表保存到 CALIBRATION_DIR/<演员名>.npz）
+# CALIBRATION_PROFILE 为要使用的校准文件路径，None 时使用 mapping.py 中的固定规则
+CALIBRATION_PROFILE = None
+CALIBRATION_DIR = 'calibration'
+CALIBRATION_NEUTRAL_SECONDS = 5    # 中性表情录制时长
+CALIBRATION_EXTREME_SECONDS = 20   # 夸张表情录制时长
+CALIBRATION_PEAK_PERCENTILE = 98   # 峰值取该分位数，排除个别误检
+CALIBRATION_MIN_RANGE = 0.1        # 峰值与基线相差不到这么多的通道视为没做到，保持原值
+CALIBRATION_LEVELS = 1024          # 查找表量化级数
+
+# 视频流水线各级之间的队列长度（帧）
+PIPELINE_QUEUE_SIZE = 8
+# 分段耗时统计：每段保留最近 PROFILE_WINDOW 帧；每 PROFILE_DUMP_INTERVAL 秒导出到 PROFILE_DIR（0 不导出）
+PROFILE_WINDOW = 1000
+PROFILE_DUMP_INTERVAL = 10
+PROFILE_DIR = 'profiles'
+PROFILE_OVERLAY = False  # 在画面上叠加各阶段耗时
+# 人脸区域跟踪：按上一帧关键点框（放大 ROI_PADDING 倍）裁剪，缩小到边长不超过 ROI_TARGET_SIZE 再推理
+# 裁剪后 BlendShape 与整帧推理不完全一致（测试图上单通道最大差约 0.25，舵机最多差 7°），因此默认关闭，只在算力不够时打开
+# 没有人脸（第一帧或跟丢）时整帧推理，ROI_FALLBACK_SIZE 不为 None 时先缩小到长边不超过该值。
+# 缩小同样会改变输出（约 1200×900 的测试图缩到 640: 单通道 p99 差 0.077、最大 0.083，舵机最多差 3°；
+# 缩到 960: 最大 0.070，舵机最多差 2°），所以默认不缩小
+ROI_ENABLED = False
+ROI_PADDING = 1.6
+ROI_TARGET_SIZE = 512
+ROI_FALLBACK_SIZE = None
+ROI_MAX_MISSES = 2  # 区域里连续检测不到人脸这么多帧后才退回整帧
+# 关键点绘制: RENDER_LEVEL 为 'none' / 'contours'（轮廓+虹膜）/ 'full'（再加网格），每 RENDER_EVERY 帧画一次
+RENDER_LEVEL = 'full'
+RENDER_EVERY = 1
 # 窗口名称
 WIN_NAME = 'MediaPipe FaceLandmarker (' + str(FPS) + ' FPS)'
 
 # 时序平滑设置
 SMOOTHING_ENABLED = True  # 总开关，True启用平滑，False禁用
 SMOOTHING_ALPHA = 0.3    # 指数平滑系数，取值范围0.0-1.0，越小越平滑但响应变慢
+# 滤波器: 'ema' 指数平滑（默认，所有通道同一个 SMOOTHING_ALPHA）/ 'one_euro' 自适应截止频率 / 'kalman' 匀速模型卡尔曼
+SMOOTHING_FILTER = 'ema'
+# 通道分组：BlendShape 名称以这些前缀开头的归入该组，未归组的使用 default 参数
+SMOOTHING_GROUPS = {
+    'blink': ('eyeBlink',),
+    'gaze': ('eyeLook',),
+    'brow': ('brow',),
+    'jaw': ('jaw',),
+    'mouth': ('mouth',),
+}
+# 各组滤波参数（未写的键取 default）
+#   ema: alpha；one_euro: min_cutoff(Hz)、beta、d_cutoff(Hz)；kalman: q(过程噪声)、r(测量噪声方差)
+# ema 默认不分组（与 SMOOTHING_ALPHA 的行为一致），需要时在组里加 'alpha'，例如眨眼 0.7、注视 0.2
+SMOOTHING_PARAMS = {
+    'default': {'alpha': SMOOTHING_ALPHA, 'min_cutoff': 1.5, 'beta': 5.0, 'd_cutoff': 1.0, 'q': 100.0, 'r': 0.0025},
+    'blink': {'min_cutoff': 3.0, 'beta': 30.0, 'q': 2000.0},   # 眨眼：低延迟
+    'gaze': {'min_cutoff': 0.8, 'beta': 2.0, 'q': 20.0, 'r': 0.004},  # 注视：防抖
+    'jaw': {'min_cutoff': 2.0, 'beta': 10.0, 'q': 400.0},
+}
+
+# 延迟补偿：平滑之后按各通道速度外推 “处理延迟 + 舵机移动时间”，抵消舵机相对人脸的滞后
+PREDICTION_ENABLED = False
+PREDICTION_WINDOW = 4       # 用最近几帧估计速度
+PREDICTION_MAX_LEAD = 0.25  # 外推时间上限（秒）
+PREDICTION_MAX_GAP = 0.5    # 相邻两帧间隔超过这么多秒时重新开始估计
+# 各组外推参数（分组同 SMOOTHING_GROUPS，未写的键取 default）: enabled 是否外推、gain 外推比例、max_step 单帧外推上限
+PREDICTION_PARAMS = {
+    'default': {'enabled': True, 'gain': 0.8, 'max_step': 0.2},
+    'blink': {'gain': 1.0, 'max_step': 0.5},  # 眨眼：动作固定，全量外推
+    'gaze': {'enabled': False},               # 注视：跳动没有规律，不外推
+}
+
+# 映射参数热加载：运行中修改 LIVE_CONFIG_PATH（JSON，格式见 live_config.example.json）即时生效，
+# 文件里的 fps / sensitivity / servo_ranges / smoothing 覆盖本文件中的对应设置
+LIVE_CONFIG_ENABLED = True
+LIVE_CONFIG_PATH = 'live_config.json'
+LIVE_CONFIG_POLL_INTERVAL = 0.5  # 检查文件改动的间隔（秒）
 
 # 灵敏度设置
 SENSITIVITY = {
@@ -109,4 +222,23 @@ BS_CN = {
     "mouthUpperUpLeft": "左上唇上升", "mouthUpperUpRight": "右上唇上升",
     "noseSneerLeft": "左鼻皱", "noseSneerRight": "右鼻皱",
     "tongueOut": "吐舌"
-}
\ No newline at end of file
+}
+
+# ========== FaceLandmarker 输出的 52 维 BlendShape 顺序 ==========
+# 与 result.face_blendshapes[i] 的下标一一对应（注意第0维是 _neutral，没有 tongueOut）
+BS_NAMES = [
+    "_neutral",
+    "browDownLeft", "browDownRight", "browInnerUp", "browOuterUpLeft", "browOuterUpRight",
+    "cheekPuff", "cheekSquintLeft", "cheekSquintRight",
+    "eyeBlinkLeft", "eyeBlinkRight",
+    "eyeLookDownLeft", "eyeLookDownRight", "eyeLookInLeft", "eyeLookInRight",
+    "eyeLookOutLeft", "eyeLookOutRight", "eyeLookUpLeft", "eyeLookUpRight",
+    "eyeSquintLeft", "eyeSquintRight", "eyeWideLeft", "eyeWideRight",
+    "jawForward", "jawLeft", "jawOpen", "jawRight",
+    "mouthClose", "mouthDimpleLeft", "mouthDimpleRight", "mouthFrownLeft", "mouthFrownRight",
+    "mouthFunnel", "mouthLeft", "mouthLowerDownLeft", "mouthLowerDownRight",
+    "mouthPressLeft", "mouthPressRight", "mouthPucker", "mouthRight",
+    "mouthRollLower", "mouthRollUpper", "mouthShrugLower", "mouthShrugUpper",
+    "mouthSmileLeft", "mouthSmileRight", "mouthStretchLeft", "mouthStretchRight",
+    "mouthUpperUpLeft", "mouthUpperUpRight", "noseSneerLeft", "noseSneerRight",
+]
\ No newline at end of file
@@ -0,0 +1,228 @@
+# detection_cache.py - 静态图片检测结果的磁盘缓存（按内容寻址）
+#
+# 键 = sha256(图片文件内容哈希 | 模型文件哈希 | 检测参数)，同一张图换了文件名也能命中，
+# 图片、模型或检测参数任何一个变了都不会读到旧结果。每个条目一个文件 <键>.fdc:
+#   16 字节文件头: 魔数 b'RFDETECT', 版本, 人脸数, 每张脸的关键点数, BlendShape维数
+#   之后依次为 关键点 (F,L,3) float32、BlendShape (F,52) float32、变换矩阵 (F,4,4) float32
+# 命中时更新文件修改时间作为最近使用时间；写入后总大小超过上限则按修改时间删除最久未用的条目。
+#
+#   python detection_cache.py            # 查看缓存条目数和大小
+#   python detection_cache.py --clear    # 清空缓存
+import hashlib
+import os
+import struct
+import sys
+import time
+import numpy as np
+from mediapipe.tasks.python.components.containers.category import Category
+from mediapipe.tasks.python.components.containers.landmark import NormalizedLandmark
+from mediapipe.tasks.python.vision import FaceLandmarkerResult
+from config import BS_NAMES, MODEL_PATH, DETECTION_CACHE_DIR, DETECTION_CACHE_MAX_MB
+from landmarker import detector_signature
+from mapping import blendshapes_to_vector, NUM_BLENDSHAPES
+
+MAGIC = b'RFDETECT'
+VERSION = 1
+HEADER_FORMAT = '<8sHHHH'
+HEADER_SIZE = 16
+SUFFIX = '.fdc'
+EVICT_TO = 0.9   # 超过上限时删到上限的 90%，避免之后每次写入都要清理
+
+# 模型文件哈希：{(路径, 修改时间, 大小): 哈希}，模型文件改动后自动重新计算
+_model_digests = {}
+
+
+def file_digest(path):
+    """文件内容的 sha256（十六进制）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_digest(path=MODEL_PATH):
+    stat = os.stat(path)
+    stamp = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if stamp not in _model_digests:
+        _model_digests[stamp] = file_digest(path)
+    return _model_digests[stamp]
+
+
+def encode_result(result):
+    """FaceLandmarkerResult → 紧凑的二进制（文件头 + 三个 float32 数组）"""
+    faces = len(result.face_landmarks)
+    points = len(result.face_landmarks[0]) if faces else 0
+    landmarks = np.array([[(p.x, p.y, p.z) for p in face] for face in result.face_landmarks],
+                         dtype='<f4').reshape(faces, points, 3)
+    blendshapes = np.zeros((faces, NUM_BLENDSHAPES), dtype='<f4')
+    for i, categories in enumerate(result.face_blendshapes[:faces]):
+        blendshapes_to_vector(categories, out=blendshapes[i])
+    matrices = np.zeros((faces, 4, 4), dtype='<f4')
+    for i, matrix in enumerate(result.facial_transformation_matrixes[:faces]):
+        matrices[i] = matrix
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, faces, points, NUM_BLENDSHAPES)
+    return header + landmarks.tobytes() + blendshapes.tobytes() + matrices.tobytes()
+
+
+def decode_result(data):
+    """encode_result 的逆过程，格式不对时抛出 ValueError"""
+    if len(data) < HEADER_SIZE:
+        raise ValueError('缓存条目不完整')
+    magic, version, faces, points, num_bs = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != MAGIC or version != VERSION or num_bs != NUM_BLENDSHAPES:
+        raise ValueError('缓存条目格式不兼容')
+    sizes = (faces * points * 3, faces * num_bs, faces * 16)
+    if len(data) != HEADER_SIZE + 4 * sum(sizes):
+        raise ValueError('缓存条目不完整')
+    arrays = np.frombuffer(data, dtype='<f4', offset=HEADER_SIZE)
+    landmarks = arrays[:sizes[0]].reshape(faces, points, 3).tolist()
+    blendshapes = arrays[sizes[0]:sizes[0] + sizes[1]].reshape(faces, num_bs).tolist()
+    matrices = arrays[sizes[0] + sizes[1]:].reshape(faces, 4, 4).astype(np.float64)
+    return FaceLandmarkerResult(
+        face_landmarks=[[NormalizedLandmark(x=x, y=y, z=z, visibility=0.0, presence=0.0) for x, y, z in face]
+                        for face in landmarks],
+        face_blendshapes=[[Category(index=i, score=score, display_name='', category_name=BS_NAMES[i])
+                           for i, score in enumerate(scores)] for scores in blendshapes],
+        facial_transformation_matrixes=list(matrices))
+
+
+class DetectionCache:
+    """
+    get(key) 命中返回 FaceLandmarkerResult，未命中或条目损坏返回 None；put(key, result) 写入
+    写入先写临时文件再改名，多个进程共用同一个目录也不会读到写了一半的条目
+    """
+
+    def __init__(self, directory=DETECTION_CACHE_DIR, max_bytes=DETECTION_CACHE_MAX_MB * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._total = None   # 目录总大小，第一次写入时统计，之后累加
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def key(self, data, num_faces=1):
+        """图片文件内容 → 缓存键"""
+        parts = (hashlib.sha256(data).hexdigest(), model_digest(), detector_signature(num_faces=num_faces))
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = decode_result(f.read())
+            os.utime(path)   # 记为最近使用
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            print(f"缓存条目无效，重新检测: {path} ({e})")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        data = encode_result(result)
+        path = self.path(key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            old = os.path.getsize(path)   # 覆盖已有条目时只累加大小差
+        except OSError:
+            old = 0
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"写入检测缓存失败: {e}")
+            return
+        if self._total is None:
+            self._total = sum(size for _, size, _ in self.entries())
+        else:
+            self._total += len(data) - old
+        if self._total > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """[(路径, 大小, 最近使用时间)]"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue   # 其他进程刚删掉
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self, target=None):
+        """按最近使用时间从旧到新删除，直到总大小不超过 target（默认上限的 90%）"""
+        target = self.max_bytes * EVICT_TO if target is None else target
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evicted += 1
+        self._total = total
+
+    def clear(self):
+        self.evict(0)
+
+    def stats(self):
+        return f"命中 {self.hits} 次, 未命中 {self.misses} 次, 淘汰 {self.evicted} 个"
+
+
+def cached_detect(path, detect, cache=None, num_faces=1):
+    """
+    检测图片文件 path；detect() 在未命中时调用并返回检测结果（检测器可以在里面才创建，命中时就不用加载模型）
+    返回 (结果, 是否来自缓存)；cache 为 None 时直接调用 detect()
+    """
+    if cache is None:
+        return detect(), False
+    with open(path, 'rb') as f:
+        key = cache.key(f.read(), num_faces)
+    result = cache.get(key)
+    if result is not None:
+        return result, True
+    result = detect()
+    cache.put(key, result)
+    return result, False
+
+
+def main():
+    cache = DetectionCache()
+    if sys.argv[1:] == ['--clear']:
+        cache.clear()
+        print(f"已清空检测缓存: {cache.directory} (删除 {cache.evicted} 个条目)")
+        return
+    if sys.argv[1:]:
+        print('Usage: python detection_cache.py [--clear]')
+        sys.exit(1)
+    entries = cache.entries()
+    total = sum(size for _, size, _ in entries)
+    print(f"检测缓存 {cache.directory}: {len(entries)} 个条目, {total / 2**20:.2f} MB / 上限 {cache.max_bytes / 2**20:.0f} MB")
+    if entries:
+        oldest = min(e[2] for e in entries)
+        print(f"最久未用: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(oldest))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# faces.py - 多人脸跟踪：按人脸中心在相邻帧之间匹配，给每张脸分配一个稳定的槽位（即机器人头编号）
+import numpy as np
+from config import FACE_MATCH_DISTANCE, FACE_MAX_MISSING
+
+
+def face_center(face_landmarks):
+    """关键点外接框中心（归一化坐标）"""
+    xy = np.array([(landmark.x, landmark.y) for landmark in face_landmarks]).reshape(-1, 2)
+    return (xy.min(axis=0) + xy.max(axis=0)) / 2
+
+
+class FaceTracker:
+    """
+    每帧用 update() 传入检测到的人脸，返回每张脸对应的槽位（没有空闲槽位时为 -1）
+    - 与上一帧位置最近（距离小于 match_distance，归一化坐标）的槽位优先匹配
+    - 新出现的人脸占用编号最小的空闲槽位，并记入 new_slots，调用方据此清空该槽位的平滑状态
+    - 连续 max_missing 帧没有匹配到的槽位被释放
+    """
+
+    def __init__(self, slots, match_distance=FACE_MATCH_DISTANCE, max_missing=FACE_MAX_MISSING):
+        self.match_distance = match_distance
+        self.max_missing = max_missing
+        self.centers = np.zeros((slots, 2))
+        self.active = np.zeros(slots, dtype=bool)
+        self.missing = np.zeros(slots, dtype=np.int32)
+        self.new_slots = []
+
+    def update(self, face_landmarks_list):
+        self.new_slots = []
+        count = len(face_landmarks_list)
+        assigned = [-1] * count
+        if count:
+            centers = np.array([face_center(landmarks) for landmarks in face_landmarks_list])
+            # 贪心匹配：按距离从小到大，依次配对尚未使用的槽位和人脸
+            active = np.flatnonzero(self.active)
+            if len(active):
+                dist = np.linalg.norm(self.centers[active][:, None] - centers[None], axis=2)
+                used = set()
+                for k in np.argsort(dist, axis=None):
+                    i, j = divmod(int(k), count)
+                    if dist[i, j] > self.match_distance:
+                        break
+                    if active[i] in used or assigned[j] >= 0:
+                        continue
+                    used.add(active[i])
+                    assigned[j] = int(active[i])
+            # 未匹配的人脸占用空闲槽位
+            for j in range(count):
+                if assigned[j] < 0:
+                    free = np.flatnonzero(~self.active)
+                    if not len(free):
+                        continue
+                    slot = int(free[0])
+                    self.active[slot] = True
+                    self.new_slots.append(slot)
+                    assigned[j] = slot
+            for j, slot in enumerate(assigned):
+                if slot >= 0:
+                    self.centers[slot] = centers[j]
+                    self.missing[slot] = 0
+
+        # 本帧没有出现的槽位计数，超时释放
+        seen = np.zeros(len(self.active), dtype=bool)
+        seen[[slot for slot in assigned if slot >= 0]] = True
+        lost = self.active & ~seen
+        self.missing[lost] += 1
+        self.active[lost & (self.missing > self.max_missing)] = False
+        return assigned
@@ -0,0 +1,30 @@
+# landmarker.py - FaceLandmarker 检测器构造
+import mediapipe as mp
+from mediapipe.tasks import python
+from mediapipe.tasks.python import vision
+from config import MODEL_PATH
+
+# IMAGE: 单张图片；VIDEO: 视频帧（帧间跟踪，需递增时间戳）；LIVE_STREAM: 异步回调
+RunningMode = vision.RunningMode
+
+
+def create_detector(running_mode=RunningMode.IMAGE, num_faces=1, result_callback=None):
+    """
+    按运行模式创建 FaceLandmarker，失败时抛出异常由调用方处理
+    LIVE_STREAM 模式必须提供 result_callback(result, output_image, timestamp_ms)
+    """
+    base_options = python.BaseOptions(model_asset_path=MODEL_PATH)
+    options = vision.FaceLandmarkerOptions(
+        base_options=base_options,
+        running_mode=running_mode,
+        output_face_blendshapes=True,
+        output_facial_transformation_matrixes=True,
+        num_faces=num_faces,
+        result_callback=result_callback)
+    return vision.FaceLandmarker.create_from_options(options)
+
+
+def detector_signature(running_mode=RunningMode.IMAGE, num_faces=1):
+    """决定检测结果的参数（不含模型文件本身），用作缓存键的一部分；改动 create_detector 的选项时同步修改"""
+    return (f'mediapipe={mp.__version__};mode={running_mode.name};num_faces={num_faces};'
+            f'blendshapes=1;transformation_matrixes=1')
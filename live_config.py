@@ -0,0 +1,256 @@
+# live_config.py - 映射参数热加载：监视一个 JSON 数据文件，改动后在后台线程校验并编译，
+#                  处理线程在两帧之间原子切换，不用重启（不重新加载模型、不断开连接）
+#
+# 文件中的键都是可选的，写了的覆盖 config.py 中的默认值，删掉即恢复默认（格式见 live_config.example.json）:
+#   fps           帧率上限（自适应帧率的上限 / 固定帧率）以及非自适应时的舵机移动时间
+#   sensitivity   {名称: 灵敏度}，名称必须是 config.SENSITIVITY 中已有的
+#   servo_ranges  {"舵机ID": [最小角度, 最大角度]}
+#   smoothing     {"enabled": bool, "filter": "ema"/"one_euro"/"kalman", "alpha": 默认平滑系数,
+#                  "params": {分组: {参数: 值}}}，分组和参数同 config.SMOOTHING_PARAMS
+# 文件写坏（JSON 语法错误、键名拼错、数值越界）时打印原因并继续使用当前配置，修好保存后自动重新加载。
+import json
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from config import (BS_NAMES, FPS, SENSITIVITY, servo_ranges, SMOOTHING_ENABLED, SMOOTHING_FILTER,
+                    SMOOTHING_GROUPS, SMOOTHING_PARAMS, LIVE_CONFIG_POLL_INTERVAL)
+from mapping import ServoMapper, NUM_BLENDSHAPES, NUM_SERVOS
+from smoothing import FILTERS
+from calibration import build_profile
+
+FPS_LIMITS = (1, 120)
+SECTIONS = ('fps', 'sensitivity', 'servo_ranges', 'smoothing')
+SMOOTHING_KEYS = ('enabled', 'filter', 'alpha', 'params')
+SMOOTHING_PARAM_KEYS = ('alpha', 'min_cutoff', 'beta', 'd_cutoff', 'q', 'r')
+# 取 0 会让滤波器冻结（alpha、min_cutoff）、除零（d_cutoff）或失去测量噪声（r），必须大于 0
+POSITIVE_PARAM_KEYS = ('alpha', 'min_cutoff', 'd_cutoff', 'r')
+# 这两个舵机（左右嘴）必须同步，角度范围也必须相同
+LINKED_SERVOS = (6, 13)
+
+# 编译好的一份配置，由处理线程整体替换
+LiveSettings = namedtuple('LiveSettings', 'version fps mapper smoothing_enabled smoothing_filter smoothing_compiled')
+
+
+def _number(value, name, low=None, high=None, positive=False):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f'{name} 必须是数字: {value!r}')
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise ValueError(f'{name} 超出范围 [{low}, {high}]: {value}')
+    if positive and value <= 0:
+        raise ValueError(f'{name} 必须大于 0: {value}')
+    return float(value)
+
+
+def _section(data, key, allowed=None):
+    value = data.get(key, {})
+    if not isinstance(value, dict):
+        raise ValueError(f'{key} 必须是对象')
+    unknown = set(value) - set(allowed) if allowed is not None else set()
+    if unknown:
+        raise ValueError(f'{key} 中有未知的键: {sorted(unknown)}')
+    return value
+
+
+def validate(data):
+    """校验并与 config.py 的默认值合并，返回 (fps, 灵敏度, 角度范围, 是否平滑, 滤波器, 滤波参数)，有错抛出 ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('顶层必须是对象')
+    unknown = set(data) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f'未知的键: {sorted(unknown)}，可用 {list(SECTIONS)}')
+
+    fps = _number(data.get('fps', FPS), 'fps', *FPS_LIMITS)
+
+    sensitivity = dict(SENSITIVITY)
+    for name, value in _section(data, 'sensitivity', SENSITIVITY).items():
+        sensitivity[name] = _number(value, f'sensitivity.{name}', 0)
+
+    ranges = dict(servo_ranges)
+    for key, value in _section(data, 'servo_ranges').items():
+        servo_id = int(key) if str(key).isdigit() else None
+        if servo_id not in servo_ranges:
+            raise ValueError(f'servo_ranges 中的舵机ID无效: {key!r}，应为 1~{NUM_SERVOS}')
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            raise ValueError(f'servo_ranges.{key} 必须是 [最小角度, 最大角度]')
+        low, high = (_number(v, f'servo_ranges.{key}', -180, 180) for v in value)
+        if low > high:
+            raise ValueError(f'servo_ranges.{key} 最小角度大于最大角度: {value}')
+        ranges[servo_id] = (low, high)
+    if ranges[LINKED_SERVOS[0]] != ranges[LINKED_SERVOS[1]]:
+        raise ValueError(f'舵机 {LINKED_SERVOS[0]} 和 {LINKED_SERVOS[1]} 的角度范围必须相同')
+
+    smoothing = _section(data, 'smoothing', SMOOTHING_KEYS)
+    enabled = smoothing.get('enabled', SMOOTHING_ENABLED)
+    if not isinstance(enabled, bool):
+        raise ValueError(f'smoothing.enabled 必须是 true/false: {enabled!r}')
+    kind = smoothing.get('filter', SMOOTHING_FILTER)
+    if kind not in FILTERS:
+        raise ValueError(f'smoothing.filter 无效: {kind!r}，可选 {list(FILTERS)}')
+    params = {group: dict(values) for group, values in SMOOTHING_PARAMS.items()}
+    # 与 config.py 一致：SMOOTHING_ALPHA 即 default 组的 alpha（params.default.alpha 优先）
+    if 'alpha' in smoothing:
+        params['default']['alpha'] = _number(smoothing['alpha'], 'smoothing.alpha', 0, 1, positive=True)
+    for group, values in _section(smoothing, 'params', ['default', *SMOOTHING_GROUPS]).items():
+        if not isinstance(values, dict):
+            raise ValueError(f'smoothing.params.{group} 必须是对象')
+        for key, value in values.items():
+            if key not in SMOOTHING_PARAM_KEYS:
+                raise ValueError(f'smoothing.params.{group} 中有未知的参数: {key!r}')
+            high = 1 if key == 'alpha' else None
+            params.setdefault(group, {})[key] = _number(value, f'smoothing.params.{group}.{key}', 0, high,
+                                                        positive=key in POSITIVE_PARAM_KEYS)
+    return fps, sensitivity, ranges, enabled, kind, params
+
+
+def compile_settings(data, version=0, profile=None):
+    """校验并编译出 LiveSettings；profile 为当前使用的演员校准（LutMapper），按新参数重新编译它的查找表"""
+    fps, sensitivity, ranges, enabled, kind, params = validate(data)
+    mapper = ServoMapper(sensitivity=sensitivity, ranges=ranges)
+    if profile is not None:
+        mapper = build_profile(profile.baseline, profile.peak, profile.performer, profile.levels, mapper)
+    # 两端输入试算一遍，确保编译结果可用
+    for probe in (np.zeros(NUM_BLENDSHAPES, dtype=np.float32), np.ones(NUM_BLENDSHAPES, dtype=np.float32)):
+        mapper.compute(probe)
+    with np.errstate(all='raise'):
+        compiled = FILTERS[kind].compile_params(SMOOTHING_GROUPS, params)
+        _probe_filter(kind, compiled)
+    return LiveSettings(version, fps, mapper, enabled, kind, compiled)
+
+
+def _probe_filter(kind, compiled):
+    """用新参数建一个滤波器，喂几帧阶跃输入：输出必须有限，并且确实跟着输入变化（没有冻结）"""
+    smoother = FILTERS[kind](compiled=compiled)
+    out = np.zeros(NUM_BLENDSHAPES)
+    smoother(np.zeros(NUM_BLENDSHAPES), 0.0, out)
+    step = np.ones(NUM_BLENDSHAPES)
+    for i in range(1, 4):
+        smoother(step, i / FPS, out)
+    if not np.isfinite(out).all():
+        raise ValueError(f'{kind} 滤波器输出无效（NaN/inf），检查平滑参数')
+    frozen = out <= 0
+    if frozen.any():
+        raise ValueError(f'{kind} 滤波器在这些通道上不跟随输入，检查平滑参数: '
+                         f'{[BS_NAMES[i] for i in np.flatnonzero(frozen)][:5]}')
+
+
+class LiveConfig(threading.Thread):
+    """
+    每 poll_interval 秒检查一次文件的修改时间和大小，变化后读取、校验、编译（都在本线程中完成），
+    结果放入 pending；处理线程每帧开始时检查 pending，有则 take() 取走并整体替换，
+    因此一帧之内用到的映射、平滑参数总是同一个版本
+    切换演员也交给本线程：set_profile() 只登记并唤醒本线程，由它按最近一次有效的参数重新编译，
+    所有编译和版本号都只在这一个线程里产生
+    """
+
+    def __init__(self, path, profile=None, poll_interval=LIVE_CONFIG_POLL_INTERVAL):
+        super().__init__(name='LiveConfig', daemon=True)
+        self.path = path
+        self.profile = profile          # 演员校准（LutMapper），只在本线程中读写
+        self.poll_interval = poll_interval
+        self.pending = None
+        self.version = 0
+        self._data = {}                 # 最近一次有效的文件内容
+        self._stamp = None
+        self._next_profile = None       # set_profile 登记的新演员，由 check() 取走
+        self._profile_changed = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        # 统计
+        self.reloads = 0
+        self.failures = 0
+
+    def start(self):
+        """启动前先同步检查一次：文件已存在时第一帧就用上文件里的参数"""
+        self.check()
+        super().start()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.check()
+            except Exception as e:
+                print(f"\n[配置] 检查配置文件出错: {e}")
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self.is_alive():
+            self.join()
+
+    def set_profile(self, profile):
+        """切换演员（任意线程可调用）：本线程按当前参数重新编译它的查找表，之后在下一帧生效"""
+        with self._lock:
+            self._next_profile = profile
+            self._profile_changed = True
+        self._wake.set()
+
+    def check(self):
+        """文件有变化（包括被删除，此时恢复默认）或切换了演员则重新编译，返回是否产生了新版本"""
+        with self._lock:
+            profile_changed, self._profile_changed = self._profile_changed, False
+            if profile_changed:
+                self.profile = self._next_profile
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp != self._stamp:
+            self._stamp = stamp
+            if self.reload(stamp is not None):
+                return True
+        if profile_changed:
+            # 文件没变或者写坏了：新演员沿用最近一次有效的参数
+            return self._publish(self._data, '切换演员')
+        return False
+
+    def reload(self, exists=True):
+        """读取文件并编译；只在本线程（或启动前）调用"""
+        t0 = time.perf_counter()
+        try:
+            data = {}
+            if exists:
+                with open(self.path, encoding='utf-8') as f:
+                    data = json.load(f)
+        except Exception as e:
+            self.failures += 1
+            print(f"\n[配置] {self.path} 无效，继续使用当前配置: {e}")
+            return False
+        source = self.path if exists else f'{self.path} 已删除，恢复默认'
+        return self._publish(data, source, time.perf_counter() - t0)
+
+    def _publish(self, data, source, read_time=0.0):
+        t1 = time.perf_counter()
+        try:
+            settings = compile_settings(data, self.version + 1, self.profile)
+        except Exception as e:
+            # 任何错误（校验、编译、滤波器试算）都只影响这一次加载
+            self.failures += 1
+            print(f"\n[配置] {self.path} 无效，继续使用当前配置: {e}")
+            return False
+        t2 = time.perf_counter()
+        self._data = data
+        self.version = settings.version
+        self.reloads += 1
+        with self._lock:
+            self.pending = settings
+        print(f"\n[配置] v{settings.version} 已加载: {source}，读取 {read_time * 1000:.1f} ms，"
+              f"校验编译 {(t2 - t1) * 1000:.1f} ms，下一帧生效")
+        return True
+
+    def take(self):
+        """处理线程调用：取走待生效的配置（没有则返回 None）"""
+        with self._lock:
+            settings, self.pending = self.pending, None
+        return settings
+
+    def stats(self):
+        return f"加载 {self.reloads} 次, 无效 {self.failures} 次, 当前 v{self.version}"
@@ -0,0 +1,161 @@
+# mapping.py - 向量化的 BlendShape→舵机 映射引擎
+from collections import namedtuple
+import numpy as np
+from config import BS_NAMES, SENSITIVITY, servo_ranges
+
+NUM_BLENDSHAPES = len(BS_NAMES)
+NUM_SERVOS = 20
+BS_INDEX = {name: i for i, name in enumerate(BS_NAMES)}
+
+# 一个映射分支：
+#   驱动值 = max(权重 * 通道 + 偏置)，对多个通道取最大值
+#   再乘以灵敏度，裁剪到输入窗口，最后线性映射到输出端点
+#   输出端点里的 'min' / 'max' 取自 servo_ranges，数字则直接作为角度
+Branch = namedtuple('Branch', 'channels weight bias sensitivity window out')
+
+# 舵机映射规则：舵机ID -> (主分支, 反向分支 或 None)
+# 有反向分支时，比较两者的驱动值（乘灵敏度之前）：主分支大取主分支，否则取反向分支
+SERVO_RULES = {
+    # 左下眼皮（小闭大张）：0.5 - eyeBlink
+    1: (Branch(("eyeBlinkLeft",), -1.0, 0.5, "eyelid_left_close", (0, 0.5), ("min", "max")), None),
+    # 牙后左上（脸皮上下）
+    2: (Branch(("cheekSquintLeft",), 1.0, 0.0, "cheek_left_up", (0, 1), ("min", "max")), None),
+    # 牙后左下（脸皮前后）
+    3: (Branch(("mouthStretchLeft",), 1.0, 0.0, "cheek_left_forward", (0, 1), ("min", "max")), None),
+    # 下颚左
+    4: (Branch(("jawLeft",), 1.0, 0.0, "jaw_open", (0, 1), ("min", "max")), None),
+    # 上鄂左
+    5: (Branch(("jawOpen",), 1.0, 0.0, "jaw_open", (0, 1), ("min", "max")), None),
+    # 左嘴（和13必须相同）：jawOpen 0.01~0.8 → 0~58度，不受灵敏度影响
+    6: (Branch(("jawOpen",), 1.0, 0.0, None, (0.01, 0.8), ("min", "max")), None),
+    # 右后牙上（脸皮上下）
+    7: (Branch(("cheekSquintRight",), 1.0, 0.0, "cheek_right_up", (0, 1), ("min", "max")), None),
+    # 右后牙下（脸皮前后）
+    8: (Branch(("mouthStretchRight",), 1.0, 0.0, "cheek_right_forward", (0, 1), ("min", "max")), None),
+    # 下颚右
+    9: (Branch(("jawRight",), 1.0, 0.0, "jaw_open", (0, 1), ("min", "max")), None),
+    # 上鄂右
+    10: (Branch(("jawOpen",), 1.0, 0.0, "jaw_open", (0, 1), ("min", "max")), None),
+    # 眼球左右（左正右负）
+    11: (Branch(("eyeLookOutLeft", "eyeLookInRight"), 1.0, 0.0, "eye_left", (0, 1), (0, "max")),
+         Branch(("eyeLookOutRight", "eyeLookInLeft"), 1.0, 0.0, "eye_right", (0, 1), ("min", 0))),
+    # 眼球上下（上正下负）
+    12: (Branch(("eyeLookUpLeft", "eyeLookUpRight"), 1.0, 0.0, "eye_up", (0, 1), (0, "max")),
+         Branch(("eyeLookDownLeft", "eyeLookDownRight"), 1.0, 0.0, "eye_down", (0, 1), ("min", 0))),
+    # 右嘴（和6必须相同）
+    13: (Branch(("jawOpen",), 1.0, 0.0, None, (0.01, 0.8), ("min", "max")), None),
+    # 左上眼皮
+    14: (Branch(("eyeBlinkLeft",), -1.0, 0.5, "eyelid_left_close", (0, 0.5), ("min", "max")), None),
+    # 右上眼皮
+    15: (Branch(("eyeBlinkRight",), -1.0, 0.5, "eyelid_right_close", (0, 0.5), ("min", "max")), None),
+    # 右下眼皮
+    16: (Branch(("eyeBlinkRight",), -1.0, 0.5, "eyelid_right_close", (0, 0.5), ("min", "max")), None),
+    # 右眉头：browDownRight 下降 → 负角度
+    17: (Branch(("browDownRight",), 1.0, 0.0, "eyebrow_right_down", (0, 1), (0, "min")), None),
+    # 右眉尾：browOuterUpRight 上升 → 正角度
+    18: (Branch(("browOuterUpRight",), 1.0, 0.0, "eyebrow_right_up", (0, 1), (0, "max")), None),
+    # 左眉头：browDownLeft 下降 → 负角度
+    19: (Branch(("browDownLeft",), 1.0, 0.0, "eyebrow_left_down", (0, 1), (0, "min")), None),
+    # 左眉尾：browOuterUpLeft 上升 → 正角度
+    20: (Branch(("browOuterUpLeft",), 1.0, 0.0, "eyebrow_left_up", (0, 1), (0, "max")), None),
+}
+
+
+def blendshapes_to_vector(blendshapes, out=None):
+    """
+    把 BlendShape 转成固定顺序(BS_NAMES)的 float32 向量
+    支持 FaceLandmarker 返回的 Category 列表（按下标顺序）或 {名称: 值} 字典
+    """
+    if out is None:
+        out = np.zeros(NUM_BLENDSHAPES, dtype=np.float32)
+    if isinstance(blendshapes, dict):
+        for i, name in enumerate(BS_NAMES):
+            out[i] = blendshapes.get(name, 0)
+    else:
+        for i, c in enumerate(blendshapes):
+            out[i] = c.score
+    return out
+
+
+class ServoMapper:
+    """
+    编译后的映射引擎：规则在构造时编译成权重矩阵和参数数组，
+    每帧只需一次矩阵乘法加若干逐元素运算即可得到全部20个舵机角度
+    """
+
+    def __init__(self, rules=None, sensitivity=None, ranges=None):
+        rules = SERVO_RULES if rules is None else rules
+        sensitivity = SENSITIVITY if sensitivity is None else sensitivity
+        ranges = servo_ranges if ranges is None else ranges
+
+        # 每个分支占一列：前20列为主分支，后20列为反向分支
+        # 分支内有多个通道时，第 k 个通道放在第 k 层权重里，之后逐层取最大值
+        width = max(len(b.channels) for pair in rules.values() for b in pair if b)
+        cols = 2 * NUM_SERVOS
+        weights = np.zeros((width, cols, NUM_BLENDSHAPES), dtype=np.float32)
+        # 空分支的驱动值取一个极小的有限值，保证比较时总是输给主分支且不会产生 nan
+        bias = np.full((width, cols), -1e30, dtype=np.float32)
+        scale = np.zeros(cols, dtype=np.float32)
+        offset = np.zeros(cols, dtype=np.float32)
+        low = np.zeros(cols, dtype=np.float32)
+        high = np.zeros(cols, dtype=np.float32)
+
+        for servo_id in range(1, NUM_SERVOS + 1):
+            min_angle, max_angle = ranges[servo_id]
+            for b, branch in enumerate(rules.get(servo_id, (None, None))):
+                if branch is None:
+                    continue
+                col = b * NUM_SERVOS + servo_id - 1
+                for k in range(width):
+                    # 通道数不足 width 时重复最后一个通道，不影响取最大值
+                    name = branch.channels[min(k, len(branch.channels) - 1)]
+                    weights[k, col, BS_INDEX[name]] = branch.weight
+                    bias[k, col] = branch.bias
+                lo, hi = branch.window
+                ends = [min_angle if e == "min" else max_angle if e == "max" else e
+                        for e in branch.out]
+                gain = sensitivity[branch.sensitivity] if branch.sensitivity else 1.0
+                # 角度 = ends[0] + (clip(驱动值*灵敏度, lo, hi) - lo) * slope
+                #      = clip(驱动值*scale + offset, 两端点之间)
+                slope = (ends[1] - ends[0]) / (hi - lo)
+                scale[col] = gain * slope
+                offset[col] = ends[0] - lo * slope
+                low[col], high[col] = min(ends), max(ends)
+
+        self.width = width
+        self.weights = weights.reshape(width * cols, NUM_BLENDSHAPES)
+        self.bias = bias.reshape(width * cols)
+        self.scale, self.offset, self.low, self.high = scale, offset, low, high
+
+        # 预分配的中间缓冲区
+        self._terms = np.empty(width * cols, dtype=np.float32)
+        self._layers = self._terms.reshape(width, cols)
+        self._drive = np.empty(cols, dtype=np.float32)
+        self._angle = np.empty(cols, dtype=np.float32)
+        self._select = np.empty(NUM_SERVOS, dtype=bool)
+
+    def compute(self, bs_vector, out=None):
+        """
+        输入: 52维 float32 BlendShape 向量
+        返回: 20个舵机角度的 int16 数组，第 i 项对应舵机 i+1
+        """
+        terms, drive, angle, select = self._terms, self._drive, self._angle, self._select
+        np.dot(self.weights, bs_vector, out=terms)
+        terms += self.bias
+        drive[:] = self._layers[0]
+        for k in range(1, self.width):
+            np.maximum(drive, self._layers[k], out=drive)
+
+        np.multiply(drive, self.scale, out=angle)
+        angle += self.offset
+        np.maximum(angle, self.low, out=angle)
+        np.minimum(angle, self.high, out=angle)
+
+        # 主分支驱动值大于反向分支时取主分支（比较在乘灵敏度之前）
+        np.greater(drive[:NUM_SERVOS], drive[NUM_SERVOS:], out=select)
+        if out is None:
+            out = np.empty(NUM_SERVOS, dtype=np.int16)
+        # 直接写入 out（不生成临时数组），unsafe 转换即截断取整，与 int() 一致
+        np.copyto(out, angle[NUM_SERVOS:], casting='unsafe')
+        np.copyto(out, angle[:NUM_SERVOS], casting='unsafe', where=select)
+        return out
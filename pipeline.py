@@ -0,0 +1,168 @@
+# pipeline.py - 视频处理流水线：解码、推理、输出三级并行
+import queue
+import threading
+import time
+import cv2
+import mediapipe as mp
+
+# 队列结束标记
+END = None
+
+
+def put_until_stopped(q, item, stopped, timeout=0.1):
+    """阻塞放入队列，但在收到停止信号时放弃，避免下游退出后上游卡死"""
+    while not stopped.is_set():
+        try:
+            q.put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class FrameDecoder(threading.Thread):
+    """
+    解码线程：从 VideoCapture 预读帧并转成RGB，放入有界队列
+    队列元素为 (时间戳ms, rgb帧, 开始读取的时间 time.monotonic())，读完后放入 END
+    """
+
+    def __init__(self, cap, maxsize, stopped, profiler=None):
+        super().__init__(name='FrameDecoder', daemon=True)
+        self.cap = cap
+        self.output = queue.Queue(maxsize)
+        self.stopped = stopped
+        self.profiler = profiler
+
+    def run(self):
+        last_ts = -1
+        try:
+            while not self.stopped.is_set():
+                t_read = time.monotonic()
+                ret, frame_bgr = self.cap.read()
+                if not ret:
+                    break
+                if self.profiler:
+                    t = self.profiler.lap('capture', t_read)
+                # VIDEO 模式要求时间戳严格递增，容器时间戳异常时顺延1ms
+                timestamp_ms = int(self.cap.get(cv2.CAP_PROP_POS_MSEC))
+                if timestamp_ms <= last_ts:
+                    timestamp_ms = last_ts + 1
+                last_ts = timestamp_ms
+                rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+                if self.profiler:
+                    self.profiler.lap('convert', t)
+                if not put_until_stopped(self.output, (timestamp_ms, rgb, t_read), self.stopped):
+                    return
+        finally:
+            put_until_stopped(self.output, END, self.stopped)
+
+
+class InferenceWorker(threading.Thread):
+    """
+    推理线程：用 VIDEO 模式的检测器对每帧调用 detect_for_video
+    输入 (时间戳ms, rgb帧, 读取时间)，输出 (时间戳ms, rgb帧, 检测结果, 读取时间)
+    给定 roi (FaceRoi) 时只对人脸区域推理，结果中的关键点已换算回整帧坐标
+    给定 rate (AdaptiveRate) 时按视频时间抽帧：距上一个处理的帧不足 rate.interval 的帧直接跳过
+    """
+
+    def __init__(self, detector, source, maxsize, stopped, profiler=None, roi=None, rate=None):
+        super().__init__(name='InferenceWorker', daemon=True)
+        self.detector = detector
+        self.input = source
+        self.output = queue.Queue(maxsize)
+        self.stopped = stopped
+        self.profiler = profiler
+        self.roi = roi
+        self.rate = rate
+        self.error = None
+
+    def run(self):
+        next_ts = 0
+        try:
+            while not self.stopped.is_set():
+                try:
+                    item = self.input.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is END:
+                    break
+                timestamp_ms, rgb, t_read = item
+                if self.rate:
+                    # 跟不上时跳帧，保证视频时间和实际时间同步
+                    if timestamp_ms < next_ts:
+                        self.rate.skipped += 1
+                        continue
+                    next_ts = timestamp_ms + self.rate.interval * 1000 - 1
+                t = time.monotonic()
+                if self.roi:
+                    image, region = self.roi.prepare(rgb)
+                else:
+                    image = rgb
+                mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+                result = self.detector.detect_for_video(mp_image, timestamp_ms)
+                if self.roi:
+                    self.roi.update(result, region, (rgb.shape[1], rgb.shape[0]))
+                if self.rate:
+                    self.rate.record('detect', time.monotonic() - t)
+                if self.profiler:
+                    self.profiler.lap('detect', t)
+                if not put_until_stopped(self.output, (timestamp_ms, rgb, result, t_read), self.stopped):
+                    return
+        except Exception as e:
+            self.error = e
+        finally:
+            put_until_stopped(self.output, END, self.stopped)
+
+
+class LatestFrameCapture(threading.Thread):
+    """
+    采集线程：以摄像头自身的速度持续读取，只在单槽缓冲区里保留最新一帧
+    避免驱动内部缓冲堆积，主线程拿到的总是最新画面
+    """
+
+    def __init__(self, cap, stopped):
+        super().__init__(name='LatestFrameCapture', daemon=True)
+        self.cap = cap
+        self.stopped = stopped
+        self._cond = threading.Condition()
+        self._frame = None
+        self._capture_time = 0.0
+        self._seq = 0           # 最新帧序号
+        self._taken_seq = 0     # 主线程最近取走的帧序号
+        self._ended = False
+        # 统计: 采集帧数、未被取走就被覆盖的帧数
+        self.captured = 0
+        self.overwritten = 0
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                ret, frame_bgr = self.cap.read()
+                capture_time = time.monotonic()
+                if not ret:
+                    break
+                with self._cond:
+                    if self._seq > self._taken_seq:
+                        self.overwritten += 1
+                    self._frame = frame_bgr
+                    self._capture_time = capture_time
+                    self._seq += 1
+                    self.captured += 1
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._ended = True
+                self._cond.notify_all()
+
+    def read(self, last_seq=0, timeout=1.0):
+        """
+        取比 last_seq 更新的最新帧，没有则最多等待 timeout 秒
+        返回 (序号, 采集时间 time.monotonic(), bgr帧)；超时返回 None；采集已结束抛出 EOFError
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq or self._ended, timeout):
+                return None
+            if self._seq <= last_seq:
+                raise EOFError('摄像头采集已结束')
+            self._taken_seq = self._seq
+            return self._seq, self._capture_time, self._frame
@@ -0,0 +1,91 @@
+# prediction.py - 延迟补偿：按最近几帧估计每个 BlendShape 通道的速度，向前外推一段时间
+#
+# 舵机到位的时刻比人脸动作晚 “处理延迟 + 舵机移动时间”，外推同样长的时间可以抵消这段滞后。
+# 参数按通道分组配置（分组沿用 config.SMOOTHING_GROUPS，参数见 config.PREDICTION_PARAMS）:
+#   enabled   该组是否外推（眨眼动作固定、好预测；注视跳动没有规律，外推只会放大抖动）
+#   gain      外推量的比例，<1 时只补偿一部分延迟
+#   max_step  单帧外推量的上限（BlendShape 取值 0~1）
+import time
+import numpy as np
+from config import PREDICTION_WINDOW, PREDICTION_MAX_LEAD, PREDICTION_MAX_GAP, PREDICTION_PARAMS
+from smoothing import channel_params
+
+
+class Predictor:
+    """
+    每个通道对最近 window 帧做最小二乘直线拟合，斜率即速度 v，输出
+        y = clip(x + clip(gain·v·lead, ±max_step), 0, 1)
+    过冲抑制：
+    - 速度方向与上一帧相反（动作到头折返）时这一帧不外推，避免在峰值处冲过头
+    - 外推量限幅，结果限制在 [0, 1]
+    状态和中间结果全部预分配，与 smoothing.py 的滤波器一样原地处理 52 维向量
+    """
+
+    def __init__(self, size=None, window=PREDICTION_WINDOW, max_lead=PREDICTION_MAX_LEAD,
+                 max_gap=PREDICTION_MAX_GAP, params=PREDICTION_PARAMS):
+        enabled = channel_params('enabled', params=params)
+        size = len(enabled) if size is None else size
+        self.gain = (channel_params('gain', params=params) * (enabled > 0))[:size]
+        self.max_step = channel_params('max_step', params=params)[:size]
+        self.min_step = -self.max_step
+        self.max_lead = max_lead
+        self.max_gap = max_gap
+        self.values = np.zeros((window, size))   # 环形缓冲：最近 window 帧
+        self.times = np.zeros(window)
+        self.count = 0
+        self.velocity = np.zeros(size)
+        self.prev_velocity = np.zeros(size)
+        self._dt = np.zeros(window)
+        self._delta = np.zeros(size)
+        self._product = np.zeros(size)
+        self._same_direction = np.zeros(size, dtype=bool)
+
+    def reset(self):
+        self.count = 0
+
+    def __call__(self, x, t, lead, out):
+        """x 为当前帧（平滑后）的值，t 为帧时间（秒），lead 为外推时间（秒）；结果写入 out"""
+        window = len(self.times)
+        if self.count and t - self.times[(self.count - 1) % window] > self.max_gap:
+            self.count = 0  # 中断过久（暂停、丢脸）后旧的帧不再可信
+        i = self.count % window
+        self.values[i] = x
+        self.times[i] = t
+        self.count += 1
+        n = min(self.count, window)
+        if n < 2:
+            self.velocity[:] = 0
+            self.prev_velocity[:] = 0
+            out[:] = x
+            return out
+
+        # 斜率 = Σ(tᵢ - t̄)·xᵢ / Σ(tᵢ - t̄)²（Σ(tᵢ - t̄) = 0，所以不用先减 x̄）
+        dt, values = self._dt[:n], self.values[:n]
+        times = self.times[:n]
+        np.subtract(times, np.add.reduce(times) / n, out=dt)
+        denominator = np.dot(dt, dt)
+        self.prev_velocity, self.velocity = self.velocity, self.prev_velocity
+        if denominator <= 0:
+            self.velocity[:] = 0
+        else:
+            np.dot(dt, values, out=self.velocity)
+            self.velocity /= denominator
+
+        delta = self._delta
+        np.multiply(self.velocity, min(max(lead, 0.0), self.max_lead), out=delta)
+        delta *= self.gain
+        np.minimum(delta, self.max_step, out=delta)
+        np.maximum(delta, self.min_step, out=delta)
+        # 折返抑制：只在速度方向与上一帧一致时外推
+        np.multiply(self.velocity, self.prev_velocity, out=self._product)
+        np.greater(self._product, 0, out=self._same_direction)
+        delta *= self._same_direction
+        np.add(x, delta, out=out)
+        np.minimum(out, 1, out=out)
+        np.maximum(out, 0, out=out)
+        return out
+
+
+def predict(predictor, vector, lead, timestamp=None):
+    """对 52 维向量原地外推 lead 秒；timestamp 为秒，默认取 time.monotonic()"""
+    return predictor(vector, time.monotonic() if timestamp is None else timestamp, lead, vector)
@@ -0,0 +1,119 @@
+# profiler.py - 流水线分段计时：每段保留最近若干帧的耗时，输出 p50/p95/p99/max
+#
+# 用法: t = time.monotonic(); ...; t = profiler.lap('detect', t)
+# 每次记录只是一次 monotonic() 调用和一次数组写入，常开也不影响帧率；分位数只在显示/导出时计算
+import csv
+import json
+import os
+import time
+import cv2
+import numpy as np
+from config import PROFILE_WINDOW, PROFILE_DUMP_INTERVAL, PROFILE_DIR
+
+# 各模式共用的阶段名（英文，方便 cv2.putText 叠加显示）
+STAGES = ('capture', 'convert', 'detect', 'map', 'send', 'socket', 'draw', 'display', 'total')
+
+COLUMNS = ('count', 'p50', 'p95', 'p99', 'max')
+
+
+class RollingStats:
+    """环形缓冲区保存最近 size 个耗时样本（秒）"""
+
+    def __init__(self, size=PROFILE_WINDOW):
+        self.samples = np.zeros(size)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+
+    def percentiles(self):
+        """返回 (总样本数, p50, p95, p99, max)，单位 ms；没有样本返回 None"""
+        if not self.count:
+            return None
+        data = self.samples[:min(self.count, len(self.samples))] * 1000
+        p50, p95, p99 = np.percentile(data, [50, 95, 99])
+        return self.count, p50, p95, p99, data.max()
+
+
+class StageProfiler:
+    """
+    按阶段统计耗时；各阶段可以在不同线程里记录（每个阶段只应由一个线程写入）
+    dump_interval 秒导出一次：CSV 追加一行/阶段，JSON 覆盖为最新快照
+    """
+
+    def __init__(self, name, stages=STAGES, window=PROFILE_WINDOW,
+                 dump_interval=PROFILE_DUMP_INTERVAL, out_dir=PROFILE_DIR):
+        self.name = name
+        self.stats = {stage: RollingStats(window) for stage in stages}
+        self.dump_interval = dump_interval
+        self.out_dir = out_dir
+        self.csv_path = self.json_path = None
+        self._last_dump = time.monotonic()
+        self._overlay_lines = []
+        self._overlay_time = 0.0
+
+    def lap(self, stage, start):
+        """记录 stage 从 start(time.monotonic()) 到现在的耗时，返回现在的时间，便于串联下一阶段"""
+        now = time.monotonic()
+        self.stats[stage].add(now - start)
+        return now
+
+    def add(self, stage, seconds):
+        self.stats[stage].add(seconds)
+
+    def snapshot(self):
+        """{阶段: {count, p50, p95, p99, max}}，只包含有样本的阶段"""
+        result = {}
+        for stage, stats in self.stats.items():
+            values = stats.percentiles()
+            if values:
+                result[stage] = dict(zip(COLUMNS, (values[0],) + tuple(round(v, 3) for v in values[1:])))
+        return result
+
+    def report(self):
+        """多行文本汇总，模式结束时打印"""
+        lines = [f"{'stage':<12}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9} (ms)"]
+        for stage, row in self.snapshot().items():
+            lines.append(f"{stage:<12}{row['count']:>8}{row['p50']:>9.2f}{row['p95']:>9.2f}"
+                         f"{row['p99']:>9.2f}{row['max']:>9.2f}")
+        return "\n".join(lines)
+
+    def draw_overlay(self, image, refresh=0.5):
+        """在图像左上角叠加各阶段 p50/p95/max（每 refresh 秒重算一次分位数）"""
+        now = time.monotonic()
+        if now - self._overlay_time >= refresh:
+            self._overlay_time = now
+            self._overlay_lines = [f"{stage:<8} p50 {row['p50']:6.1f}  p95 {row['p95']:6.1f}  max {row['max']:6.1f} ms"
+                                   for stage, row in self.snapshot().items()]
+        for i, line in enumerate(self._overlay_lines):
+            cv2.putText(image, line, (10, 20 + 18 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1, cv2.LINE_AA)
+        return image
+
+    def maybe_dump(self):
+        """距上次导出超过 dump_interval 秒则导出一次；dump_interval 为 0 表示不定期导出"""
+        if self.dump_interval and time.monotonic() - self._last_dump >= self.dump_interval:
+            self.dump()
+
+    def dump(self):
+        """导出到 out_dir/<name>_<开始时间>.csv 和 .json"""
+        self._last_dump = time.monotonic()
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        try:
+            if self.csv_path is None:
+                os.makedirs(self.out_dir, exist_ok=True)
+                base = os.path.join(self.out_dir, time.strftime(f"{self.name}_%Y%m%d_%H%M%S"))
+                self.csv_path, self.json_path = base + '.csv', base + '.json'
+                with open(self.csv_path, 'w', newline='') as f:
+                    csv.writer(f).writerow(('time', 'stage') + COLUMNS)
+            now = time.time()
+            with open(self.csv_path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                for stage, row in snapshot.items():
+                    writer.writerow([f"{now:.3f}", stage] + [row[c] for c in COLUMNS])
+            with open(self.json_path, 'w') as f:
+                json.dump({'time': now, 'stages': snapshot}, f, indent=2)
+        except OSError as e:
+            print(f"\n导出耗时统计失败: {e}")
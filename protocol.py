@@ -0,0 +1,86 @@
+# protocol.py - 舵机命令的二进制帧格式（客户端与服务器共用）
+#
+# 连接建立后客户端先发送一行 HELLO，服务器支持则回复 OK 并把该连接切换为二进制帧，
+# 否则（旧服务器不回复）客户端超时后继续使用文本格式 "id,angle,time id,angle,time\n"
+#
+# 二进制帧 = 24字节帧头 + count 个 5字节舵机项，全部小端:
+#   帧头: 魔数 b'RF' | 版本 uint8 | 序号 uint32 | 采集时间戳 float64 | 发送时间戳 float64 | 舵机数 uint8
+#   两个时间戳都是 time.time() 秒：采集时间为该帧画面的采集时刻，发送时间在写入套接字之前填入，
+#   服务器据此分别统计 发送→接收（传输本身）和 采集→接收（端到端）的延迟
+#   舵机项: 舵机ID uint8 | 角度 int16 | 移动时间 uint16(ms)
+import struct
+import time
+import numpy as np
+
+MAGIC = b'RF'
+VERSION = 2
+
+HELLO = b'HELLO BIN%d\n' % VERSION
+HELLO_OK = b'OK BIN%d\n' % VERSION
+
+HEADER = struct.Struct('<2sBIddB')
+HEADER_SIZE = HEADER.size
+
+# 字段名与 parse_data 返回的字典键一致，解析结果可以直接按 cmd['angle'] 访问
+SERVO_DTYPE = np.dtype([('servo_id', 'u1'), ('angle', '<i2'), ('move_time', '<u2')])
+SERVO_SIZE = SERVO_DTYPE.itemsize
+
+MAX_SEQ = 0xFFFFFFFF
+
+
+class ProtocolError(ValueError):
+    """帧格式错误（魔数或版本不匹配）"""
+
+
+class FrameEncoder:
+    """
+    为固定的一组舵机预分配舵机项数组，每帧只填入角度和帧头
+    """
+
+    def __init__(self, servo_ids):
+        self.servo_ids = np.asarray(servo_ids, dtype=np.intp)
+        self._servos = np.zeros(len(self.servo_ids), dtype=SERVO_DTYPE)
+        self._servos['servo_id'] = self.servo_ids
+
+    def encode(self, seq, timestamp, angles, move_time, mask=None, sent=None):
+        """
+        angles 为20个舵机角度（第i项对应舵机i+1），返回完整的一帧 bytes
+        timestamp 为采集时间，sent 为发送时间（默认取当前时间，应在写入套接字之前才编码）
+        mask 为与 servo_ids 等长的布尔数组时只编码其中为 True 的舵机
+        """
+        self._servos['angle'] = angles[self.servo_ids - 1]
+        self._servos['move_time'] = move_time
+        servos = self._servos if mask is None else self._servos[mask]
+        sent = time.time() if sent is None else sent
+        return HEADER.pack(MAGIC, VERSION, seq & MAX_SEQ, timestamp, sent, len(servos)) + servos.tobytes()
+
+
+class TextEncoder:
+    """
+    文本格式编码，接口与 FrameEncoder 相同: "id,angle,time id,angle,time\n"
+    文本格式没有序号和时间戳，seq / timestamp / sent 参数被忽略
+    """
+
+    def __init__(self, servo_ids):
+        self.servo_ids = np.asarray(servo_ids, dtype=np.intp)
+        self._prefix = [f"{servo_id}," for servo_id in servo_ids]
+
+    def encode(self, seq, timestamp, angles, move_time, mask=None, sent=None):
+        suffix = f",{move_time}"
+        values = angles[self.servo_ids - 1].tolist()
+        parts = [p + str(v) + suffix for k, (p, v) in enumerate(zip(self._prefix, values))
+                 if mask is None or mask[k]]
+        return (" ".join(parts) + "\n").encode()
+
+
+def decode_header(buf, offset=0):
+    """解析帧头，返回 (序号, 采集时间戳, 发送时间戳, 舵机数, 整帧长度)"""
+    magic, version, seq, timestamp, sent, count = HEADER.unpack_from(buf, offset)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError(f'无效的帧头: magic={magic!r}, version={version}')
+    return seq, timestamp, sent, count, HEADER_SIZE + count * SERVO_SIZE
+
+
+def decode_servos(buf, offset, count):
+    """解析帧头之后的舵机项，返回结构化数组（字段 servo_id / angle / move_time）"""
+    return np.frombuffer(buf, dtype=SERVO_DTYPE, count=count, offset=offset + HEADER_SIZE)
@@ -0,0 +1,82 @@
+# recording.py - 会话录制格式：定长记录、追加写入、numpy.memmap 零拷贝读取
+#
+# 文件布局:
+#   64 字节文件头: 魔数 b'RFACEREC', 版本, BlendShape维数, 舵机数, 单条记录字节数, 创建时间
+#   之后每帧一条定长记录 (256 字节): 时间戳 float64(秒) + 52×float32 BlendShape + 20×int16 舵机角度
+import os
+import struct
+import time
+import numpy as np
+from mapping import NUM_BLENDSHAPES, NUM_SERVOS
+
+MAGIC = b'RFACEREC'
+VERSION = 1
+HEADER_FORMAT = '<8sHHHHd'
+HEADER_SIZE = 64
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('blendshapes', '<f4', (NUM_BLENDSHAPES,)),
+    ('servo_angles', '<i2', (NUM_SERVOS,)),
+])
+
+
+class RecordingWriter:
+    """追加写入录制文件，每帧调用一次 write"""
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+        self._record = np.zeros(1, dtype=RECORD_DTYPE)
+        self._file = open(path, 'wb')
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, NUM_BLENDSHAPES, NUM_SERVOS,
+                             RECORD_DTYPE.itemsize, time.time())
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+
+    def write(self, timestamp, blendshapes, servo_angles):
+        """写入一帧：timestamp 为秒，blendshapes 为52维向量，servo_angles 为20个舵机角度"""
+        rec = self._record[0]
+        rec['timestamp'] = timestamp
+        rec['blendshapes'] = blendshapes
+        rec['servo_angles'] = servo_angles
+        self._file.write(self._record.data)
+        self.frames += 1
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def read_header(path):
+    """读取并校验文件头，返回 (版本, 创建时间)"""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f'不是有效的录制文件: {path}')
+    magic, version, num_bs, num_servos, record_size, created = struct.unpack_from(HEADER_FORMAT, raw)
+    if magic != MAGIC:
+        raise ValueError(f'不是有效的录制文件: {path}')
+    if version != VERSION or num_bs != NUM_BLENDSHAPES or num_servos != NUM_SERVOS \
+            or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f'录制文件版本或格式不兼容: {path} (v{version})')
+    return version, created
+
+
+def open_recording(path):
+    """
+    以 memmap 方式打开录制文件，返回结构化数组（只读、不拷贝）
+    rec[i] 即第 i 帧，rec['servo_angles'] 为 (N,20) 视图；写到一半的末尾记录会被忽略
+    """
+    read_header(path)
+    frames = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if frames <= 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(frames,))
+
+
+def find_frame(rec, seconds):
+    """按相对录制开始的时间(秒)定位帧号"""
+    if len(rec) == 0:
+        return 0
+    return int(np.searchsorted(rec['timestamp'], rec[0]['timestamp'] + seconds))
@@ -0,0 +1,92 @@
+# roi.py - 人脸区域跟踪：用上一帧的关键点框裁剪并缩小输入，推理后把关键点换算回整帧坐标
+import cv2
+import numpy as np
+from config import ROI_PADDING, ROI_TARGET_SIZE, ROI_FALLBACK_SIZE, ROI_MAX_MISSES
+
+
+class FaceRoi:
+    """
+    prepare() 返回送去推理的图像和换算参数；update() 把结果里的关键点换算回整帧并更新下一帧的区域
+    - 有上一帧人脸：以关键点外接框为中心取边长 padding 倍的正方形区域，超过 target_size 时缩小
+    - 没有人脸（第一帧或跟丢）：整帧推理，fallback_size 不为 None 时缩小到长边不超过该值
+    VIDEO / LIVE_STREAM 模式的检测器会沿用上一帧的关键点位置做跟踪，从整帧切换到区域的第一帧
+    坐标系对不上、常常检测不到；所以区域里丢脸后先在同一区域重试 max_misses 帧，再退回整帧
+    同一个 FaceRoi 只能用于一路按顺序处理的画面
+    """
+
+    def __init__(self, padding=ROI_PADDING, target_size=ROI_TARGET_SIZE, fallback_size=ROI_FALLBACK_SIZE,
+                 max_misses=ROI_MAX_MISSES):
+        self.padding = padding
+        self.target_size = target_size
+        self.fallback_size = fallback_size
+        self.max_misses = max_misses
+        self.box = None     # 上一帧人脸区域 (x0, y0, x1, y1)，整帧像素坐标
+        self.misses = 0     # 在当前区域里连续检测不到的帧数
+        # 统计
+        self.cropped = 0
+        self.full = 0
+        self.lost = 0
+
+    def prepare(self, rgb):
+        """返回 (推理输入 rgb, 区域 (x0, y0, 宽, 高))；区域为整帧时关键点不需要换算"""
+        height, width = rgb.shape[:2]
+        if self.box is None:
+            self.full += 1
+            if self.fallback_size is None:
+                return rgb, (0, 0, width, height)
+            region = (0, 0, width, height)
+            image = rgb
+            limit = self.fallback_size
+        else:
+            self.cropped += 1
+            x0, y0, x1, y1 = self.box
+            region = (x0, y0, x1 - x0, y1 - y0)
+            image = rgb[y0:y1, x0:x1]
+            limit = self.target_size
+        scale = limit / max(image.shape[:2])
+        if scale < 1:
+            size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        else:
+            image = np.ascontiguousarray(image)
+        return image, region
+
+    def update(self, result, region, frame_size):
+        """
+        把 result 中的关键点从区域坐标换算回整帧归一化坐标（原地修改），并据此确定下一帧的区域
+        frame_size 为整帧 (宽, 高)
+        """
+        width, height = frame_size
+        if not result.face_landmarks:
+            if self.box is not None:
+                self.misses += 1
+                if self.misses > self.max_misses:
+                    self.lost += 1
+                    self.box = None
+            return result
+        self.misses = 0
+        x0, y0, w, h = region
+        if (x0, y0, w, h) != (0, 0, width, height):
+            sx, sy, ox, oy = w / width, h / height, x0 / width, y0 / height
+            for face_landmarks in result.face_landmarks:
+                for landmark in face_landmarks:
+                    landmark.x = ox + landmark.x * sx
+                    landmark.y = oy + landmark.y * sy
+                    landmark.z = landmark.z * sx
+        self.box = self._next_box(result.face_landmarks[0], width, height)
+        return result
+
+    def _next_box(self, face_landmarks, width, height):
+        """关键点外接框放大 padding 倍的正方形区域，裁剪到画面内"""
+        xy = np.array([(landmark.x, landmark.y) for landmark in face_landmarks]).reshape(-1, 2) * (width, height)
+        (left, top), (right, bottom) = xy.min(axis=0), xy.max(axis=0)
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        half = max(right - left, bottom - top) * self.padding / 2
+        x0, y0 = max(0, int(cx - half)), max(0, int(cy - half))
+        x1, y1 = min(width, int(np.ceil(cx + half))), min(height, int(np.ceil(cy + half)))
+        if x1 - x0 < 16 or y1 - y0 < 16:
+            return None
+        return x0, y0, x1, y1
+
+    def stats(self):
+        return f"区域推理 {self.cropped} 帧, 整帧推理 {self.full} 帧, 跟丢 {self.lost} 次"
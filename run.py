@@ -1,28 +1,43 @@
 # run.py - 主程序
-import sys, cv2, time, os
+import sys, cv2, time, os, threading
 import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-from vs import draw_landmarks_on_image, plot_face_blendshapes_bar_graph
+import numpy as np
+from vs import LandmarkRenderer, draw_landmarks_on_image, plot_face_blendshapes_bar_graph
 from config import *
 from tools import *
+from landmarker import create_detector, RunningMode
+from pipeline import FrameDecoder, InferenceWorker, LatestFrameCapture, END
+from batch import extract_blendshapes, extract_images
+from profiler import StageProfiler
+from roi import FaceRoi
+from adaptive import AdaptiveRate
+from faces import FaceTracker, face_center
+from recording import open_recording, find_frame, RecordingWriter
+from mapping import blendshapes_to_vector, NUM_SERVOS
+from calibration import calibrate, print_summary, profile_path
+from detection_cache import DetectionCache, cached_detect
 
 def blendshapes_to_dict(blendshapes):
     """把 FaceLandmarker 返回的 list 转成 dict"""
     return {b.category_name: b.score for b in blendshapes}
 
 # ------------------ 构造检测器 ------------------
-try:
-    base_options = python.BaseOptions(model_asset_path=MODEL_PATH)
-    options = vision.FaceLandmarkerOptions(
-        base_options=base_options,
-        output_face_blendshapes=True,
-        output_facial_transformation_matrixes=True,
-        num_faces=1)
-    detector = vision.FaceLandmarker.create_from_options(options)
-except Exception as e:
-    print(f"创建检测器失败: {str(e)}")
-    sys.exit(1)
+def build_detector(running_mode=RunningMode.IMAGE, result_callback=None, num_faces=1):
+    """按运行模式创建检测器，失败直接退出"""
+    try:
+        return create_detector(running_mode, num_faces=num_faces, result_callback=result_callback)
+    except Exception as e:
+        print(f"创建检测器失败: {str(e)}")
+        sys.exit(1)
+
+
+def detect_once(image):
+    """创建 IMAGE 模式检测器检测一张图，用完即关闭"""
+    detector = build_detector()
+    try:
+        return detector.detect(image)
+    finally:
+        detector.close()
 
 # ------------------ 模式1：静态图片 ------------------
 def mode_static(img_path):
@@ -37,7 +52,11 @@ def mode_static(img_path):
         print(f"读取图片失败: {str(e)}")
         return
     
-    result = detector.detect(image)
+    # 同一张图之前检测过则直接用缓存结果，检测器（模型）只在未命中时才创建
+    cache = DetectionCache() if DETECTION_CACHE_ENABLED else None
+    t0 = time.perf_counter()
+    result, hit = cached_detect(img_path, lambda: detect_once(image), cache)
+    print(f"{'检测结果来自缓存' if hit else '检测'}，耗时 {(time.perf_counter() - t0) * 1000:.1f} ms")
     if not result.face_landmarks:
         print('未检测到人脸')
         return
@@ -52,8 +71,8 @@ def mode_static(img_path):
         # 处理blendshapes并控制舵机
         if result.face_blendshapes:
             bs_dict = blendshapes_to_dict(result.face_blendshapes[0])
-            commands = process_all_servos(bs_dict)
-            send_servo_commands(commands)
+            angles = process_all_servos(bs_dict)
+            send_servo_commands(angles)
             
             # 显示blendshapes图表
             plot_face_blendshapes_bar_graph(result.face_blendshapes[0])
@@ -67,70 +86,181 @@ def mode_static(img_path):
         # 确保关闭连接
         close_socket_connection()
 
-# ------------------ 模式2：24 FPS 实时摄像头 ------------------
+# ------------------ 模式2：实时摄像头（LIVE_STREAM 异步推理） ------------------
 def mode_camera():
+    """
+    LIVE_STREAM 模式：detect_async 异步推理，结果回调里直接发送舵机命令
+    采集线程只保留最新一帧；同一时刻最多只有一帧在推理，推理期间到达的旧帧被新帧覆盖
+    耗时统计中 capture 为帧龄（采集完成到提交推理），total 为采集完成到舵机命令入队
+    """
     print(f'[Mode2] 打开摄像头，{FPS} FPS 实时推理（按 q 退出）')
+    
+    idle = threading.Event()   # 置位表示当前没有帧在推理
+    idle.set()
+    lock = threading.Lock()
+    in_flight = {}             # 正在推理的帧 {时间戳: (rgb, 采集时间, 提交时间, 推理区域)}
+    latest = [None]            # 最近一次完成的 (rgb, result)，供主线程显示
+    stopped = threading.Event()
+    profiler = StageProfiler('camera')
+    renderer = LandmarkRenderer()
+    # 人脸区域跟踪：主线程提交时裁剪，回调里换算回整帧（同一时刻只有一帧在推理，顺序不会乱）
+    roi = FaceRoi() if ROI_ENABLED else None
+    # 自适应帧率：推理（含颜色转换）和主线程绘制显示分别计时，按较慢的一方决定提交间隔
+    rate = track_rate(AdaptiveRate()) if ADAPTIVE_RATE else None
+    
+    def on_result(result, output_image, timestamp_ms):
+        """推理完成回调（MediaPipe 线程）：立即映射并发送，再交给主线程显示"""
+        try:
+            with lock:
+                frame = in_flight.pop(timestamp_ms, None)
+            if frame is not None:
+                rgb, t_capture, t_submit, region = frame
+                t = profiler.lap('detect', t_submit)
+                if rate:
+                    rate.record('detect', t - t_submit)
+                if roi:
+                    roi.update(result, region, (rgb.shape[1], rgb.shape[0]))
+            # 处理blendshapes并控制舵机
+            if result.face_blendshapes:
+                bs_dict = blendshapes_to_dict(result.face_blendshapes[0])
+                latency = time.monotonic() - t_capture if frame is not None else 0.0
+                angles = process_all_servos(bs_dict, timestamp=timestamp_ms / 1000, latency=latency)
+                if frame is not None:
+                    t = profiler.lap('map', t)
+                send_servo_commands(angles)
+                if frame is not None:
+                    t = profiler.lap('send', t)
+                    profiler.add('total', t - t_capture)
+            if frame is not None:
+                with lock:
+                    latest[0] = (rgb, result)
+        except Exception as e:
+            print(f" | 结果回调出错: {e}")
+        finally:
+            idle.set()
+    
+    detector = build_detector(RunningMode.LIVE_STREAM, result_callback=on_result)
     # 初始化socket连接
-    init_socket_connection()
+    init_socket_connection(profiler)
+    if RECORD_ENABLED:
+        start_recording()
     try:
         cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
         if not cap.isOpened():
             print('错误: 摄像头打开失败，请检查设备连接')
             return
+        # 驱动缓冲尽量只留1帧（部分后端不支持，忽略返回值）
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        # 采集线程持续读取摄像头，这里只取最新一帧
+        capture = LatestFrameCapture(cap, stopped)
+        capture.start()
 
-        # 控制帧率
-        interval = 1/FPS
+        # 控制帧率：只决定何时提交推理，等待交给 waitKey，不空转
+        # 自适应时每次按当前可持续的帧率取间隔；推理期间到达的帧被新帧覆盖，相当于跳帧
+        # 帧率上限可能被配置热加载改掉，所以每次重新取
         t_last = 0
+        t0 = time.monotonic()
+        last_ts = -1
+        seq = 0
 
         while True:
-            ret, frame_bgr = cap.read()
-            if not ret:
-                print("错误: 无法从摄像头读取帧")
-                break
-            # 限帧
-            t = time.time()
-            if t - t_last < interval:
-                continue
-            t_last = t
+            t = time.monotonic()
+            interval = rate.interval if rate else frame_interval()
+            if idle.is_set() and t - t_last >= interval:
+                try:
+                    frame = capture.read(seq, timeout=interval)
+                except EOFError:
+                    print("错误: 无法从摄像头读取帧")
+                    break
+                if frame is not None:
+                    seq, t_capture, frame_bgr = frame
+                    t_last = profiler.lap('capture', t_capture)
 
-            # BGR→RGB→MediaPipe Image
-            rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
-            result = detector.detect(mp_image)
+                    # 使用采集时间作时间戳，必须严格递增
+                    timestamp_ms = max(int((t_capture - t0) * 1000), last_ts + 1)
+                    last_ts = timestamp_ms
 
-            # 画关键点
-            annotated = draw_landmarks_on_image(rgb, result)
-            
-            # 处理blendshapes并控制舵机
-            if result.face_blendshapes:
-                bs_dict = blendshapes_to_dict(result.face_blendshapes[0])
-                commands = process_all_servos(bs_dict)
-                send_servo_commands(commands)
-            
-            cv2.imshow(WIN_NAME, cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR))
+                    # BGR→RGB→MediaPipe Image
+                    rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+                    image, region = roi.prepare(rgb) if roi else (rgb, None)
+                    t_submit = profiler.lap('convert', t_last)
+                    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+                    with lock:
+                        in_flight[timestamp_ms] = (rgb, t_capture, t_submit, region)
+                    idle.clear()
+                    try:
+                        detector.detect_async(mp_image, timestamp_ms)
+                    except Exception:
+                        with lock:
+                            in_flight.pop(timestamp_ms, None)
+                        idle.set()
+                        raise
+
+            # 有新结果才重新绘制显示
+            with lock:
+                shown, latest[0] = latest[0], None
+            if shown is not None:
+                rgb, result = shown
+                t = t_shown = time.monotonic()
+                # 推理已完成，这一帧不再被使用，直接画在上面
+                annotated = renderer.draw(rgb, result)
+                t = profiler.lap('draw', t)
+                display = cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR)
+                if PROFILE_OVERLAY:
+                    profiler.draw_overlay(display)
+                cv2.imshow(WIN_NAME, display)
+                t_done = profiler.lap('display', t)
+                if rate:
+                    rate.record('main', t_done - t_shown)
+            profiler.maybe_dump()
 
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
 
+        print(f'\n{profiler.report()}')
+        print(f'采集帧数: {capture.captured}, 未处理即被新帧覆盖: {capture.overwritten}')
+        if roi:
+            print(f'人脸区域: {roi.stats()}')
+        if rate:
+            # 摄像头模式跳过的帧就是未处理即被覆盖的帧
+            rate.skipped = capture.overwritten
+            print(f'自适应帧率: {rate.stats()}')
+        stopped.set()
+        capture.join()
         cap.release()
         cv2.destroyAllWindows()
     except Exception as e:
         print(f"摄像头处理过程中出错: {str(e)}")
     finally:
+        stopped.set()
+        detector.close()
         # 确保关闭连接
         close_socket_connection()
+        stop_recording()
+        profiler.dump()
 
 # ------------------ 模式3：视频文件处理 ------------------
 def mode_video(video_path):
+    """
+    流水线处理视频：解码线程预读帧 → 推理线程(VIDEO模式) → 主线程绘制/发送/显示
+    """
     if not os.path.exists(video_path):
         print(f"错误: 视频路径不存在 - {video_path}")
         return
     
     print(f'[Mode3] 处理视频文件: {video_path} (按 q 退出)')
     
+    # 各阶段耗时：capture/convert 在解码线程，detect 在推理线程，其余在主线程
+    profiler = StageProfiler('video')
+    renderer = LandmarkRenderer()
     # 初始化socket连接
-    init_socket_connection()
+    init_socket_connection(profiler)
+    if RECORD_ENABLED:
+        start_recording()
     
+    stopped = threading.Event()
+    cap = detector = decoder = worker = None
     try:
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
@@ -141,41 +271,65 @@ def mode_video(video_path):
         # 获取视频原始帧率
         original_fps = cap.get(cv2.CAP_PROP_FPS)
         print(f'视频原始帧率: {original_fps:.2f} FPS')
-        print(f'目标处理帧率: {FPS} FPS')
+        print(f'目标处理帧率: {FPS} FPS' + (f' (自适应，最低 {FPS_MIN} FPS)' if ADAPTIVE_RATE else ''))
         
         # 计算每帧应该显示的时间（秒）
-        frame_delay = 1 / FPS
+        # 自适应时推理线程按视频时间抽帧，每帧显示到下一个被处理帧的视频时间，保持实时
+        frame_delay = frame_interval()
+        rate = track_rate(AdaptiveRate()) if ADAPTIVE_RATE else None
+        last_ts = None
+        
+        # 解码、推理各自在线程中运行，通过有界队列衔接
+        detector = build_detector(RunningMode.VIDEO)
+        decoder = FrameDecoder(cap, PIPELINE_QUEUE_SIZE, stopped, profiler)
+        roi = FaceRoi() if ROI_ENABLED else None
+        worker = InferenceWorker(detector, decoder.output, PIPELINE_QUEUE_SIZE, stopped, profiler, roi, rate)
+        decoder.start()
+        worker.start()
         
         frame_count = 0
         start_time = time.time()
+        frame_start = start_time
         
         while True:
-            # 记录帧开始时间
-            frame_start = time.time()
-            
-            ret, frame_bgr = cap.read()
-            if not ret:
+            item = worker.output.get()
+            if item is END:
+                if worker.error:
+                    print(f"\n推理出错: {worker.error}")
                 print("\n视频处理完成")
                 break
+            timestamp_ms, rgb, result, t_read = item
+            if rate and last_ts is not None:
+                frame_delay = (timestamp_ms - last_ts) / 1000
+            elif not rate:
+                frame_delay = frame_interval()
+            last_ts = timestamp_ms
             
-            # BGR→RGB→MediaPipe Image
-            rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
-            result = detector.detect(mp_image)
-            
-            # 画关键点
-            annotated = draw_landmarks_on_image(rgb, result)
+            # 画关键点（解码线程每帧都是新数组，可直接在上面绘制）
+            t = t_item = time.monotonic()
+            annotated = renderer.draw(rgb, result)
+            t = profiler.lap('draw', t)
             
             # 处理blendshapes并控制舵机
             if result.face_blendshapes:
                 bs_dict = blendshapes_to_dict(result.face_blendshapes[0])
-                commands = process_all_servos(bs_dict)
-                send_servo_commands(commands)
+                angles = process_all_servos(bs_dict, timestamp=timestamp_ms / 1000, latency=t - t_read)
+                t = profiler.lap('map', t)
+                send_servo_commands(angles)
+                t = profiler.lap('send', t)
+                profiler.add('total', t - t_read)
             
             # 显示处理后的帧
-            cv2.imshow(WIN_NAME, cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR))
+            display = cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR)
+            if PROFILE_OVERLAY:
+                profiler.draw_overlay(display)
+            cv2.imshow(WIN_NAME, display)
+            t = profiler.lap('display', t)
+            if rate:
+                rate.record('main', t - t_item)
+            profiler.maybe_dump()
             
-            # 计算处理时间并调整显示延迟
+            # 计算处理时间并调整显示延迟（解码和推理已在后台并行，这里只等剩余时间）
             processing_time = time.time() - frame_start
             remaining_time = max(0.001, frame_delay - processing_time)  # 至少1ms
             
@@ -183,6 +337,7 @@ def mode_video(video_path):
             if cv2.waitKey(int(remaining_time * 1000)) & 0xFF == ord('q'):
                 print("\n用户中断处理")
                 break
+            frame_start = time.time()
             
             frame_count += 1
         
@@ -193,15 +348,284 @@ def mode_video(video_path):
         print(f'\n实际处理帧率: {actual_fps:.2f} FPS')
         print(f'总处理帧数: {frame_count}')
         print(f'总耗时: {total_time:.2f} 秒')
-        
-        cap.release()
+        print(profiler.report())
+        if roi:
+            print(f'人脸区域: {roi.stats()}')
+        if rate:
+            print(f'自适应帧率: {rate.stats()}')
         cv2.destroyAllWindows()
     except Exception as e:
         print(f"视频处理过程中出错: {str(e)}")
+    finally:
+        # 出错时也要停掉解码/推理线程并释放检测器和视频文件
+        stopped.set()
+        for thread in (decoder, worker):
+            if thread is not None and thread.is_alive():
+                thread.join()
+        if detector is not None:
+            detector.close()
+        if cap is not None:
+            cap.release()
+        # 确保关闭连接
+        close_socket_connection()
+        stop_recording()
+        profiler.dump()
+
+# ------------------ 模式5：回放录制文件 ------------------
+def mode_replay(rec_path, speed=1.0, start_frame=0, start_seconds=None):
+    """
+    按原始节奏（或 speed 倍速）把录制文件里的舵机角度发送给服务器
+    文件以 memmap 方式打开，任意帧可直接定位，不需要整体载入内存
+    start_seconds 不为 None 时从录制开始后该时间处的帧开始（忽略 start_frame）
+    """
+    if speed <= 0:
+        print(f"错误: 回放速度必须大于 0 - {speed}")
+        return
+    if not os.path.exists(rec_path):
+        print(f"错误: 录制文件不存在 - {rec_path}")
+        return
+    try:
+        rec = open_recording(rec_path)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return
+    if start_seconds is not None:
+        start_frame = find_frame(rec, start_seconds)
+    
+    duration = rec[-1]['timestamp'] - rec[0]['timestamp'] if len(rec) else 0
+    print(f'[Mode5] 回放 {rec_path}: {len(rec)} 帧, {duration:.1f} 秒, {speed}x 速度, 从第 {start_frame} 帧开始 (Ctrl+C 停止)')
+    
+    # 初始化socket连接
+    init_socket_connection()
+    try:
+        if start_frame < len(rec):
+            t_start = rec[start_frame]['timestamp']
+            wall_start = time.monotonic()
+            for i in range(start_frame, len(rec)):
+                frame = rec[i]
+                # 等到该帧相对起点的时间再发送
+                delay = (frame['timestamp'] - t_start) / speed - (time.monotonic() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+                send_servo_commands(frame['servo_angles'])
+        print("\n回放完成")
+    except KeyboardInterrupt:
+        print("\n用户中断回放")
     finally:
         # 确保关闭连接
         close_socket_connection()
 
+# ------------------ 模式6：多人脸驱动多个机器人头 ------------------
+def mode_multi(video_path=None):
+    """
+    一个画面里的多张人脸分别驱动 HEADS 中的多个机器人头（不指定视频时使用摄像头）
+    FaceTracker 给每张脸一个稳定的槽位，槽位 i 对应 HEADS[i]，各自有平滑状态和持久连接
+    """
+    source = video_path or '摄像头'
+    print(f'[Mode6] 多人脸模式: {source}, {len(HEADS)} 个机器人头 (按 q 退出)')
+    if video_path and not os.path.exists(video_path):
+        print(f"错误: 视频路径不存在 - {video_path}")
+        return
+    
+    detector = build_detector(RunningMode.VIDEO, num_faces=len(HEADS))
+    tracker = FaceTracker(len(HEADS))
+    heads = init_head_connections(HEADS)
+    renderer = LandmarkRenderer()
+    stopped = threading.Event()
+    try:
+        cap = cv2.VideoCapture(video_path) if video_path else cv2.VideoCapture(0, cv2.CAP_DSHOW)
+        if not cap.isOpened():
+            print(f'错误: 无法打开 {source}')
+            return
+        # 摄像头只取最新一帧；视频按 FPS 逐帧处理
+        capture = None
+        if not video_path:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            capture = LatestFrameCapture(cap, stopped)
+            capture.start()
+        
+        t0 = time.monotonic()
+        last_ts = -1
+        seq = 0
+        frame_count = 0
+        while True:
+            frame_start = time.monotonic()
+            interval = frame_interval()
+            if capture:
+                try:
+                    frame = capture.read(seq, timeout=1.0)
+                except EOFError:
+                    print("错误: 无法从摄像头读取帧")
+                    break
+                if frame is None:
+                    continue
+                seq, t_capture, frame_bgr = frame
+            else:
+                ret, frame_bgr = cap.read()
+                if not ret:
+                    print("\n视频处理完成")
+                    break
+                t_capture = frame_start
+            timestamp_ms = max(int((t_capture - t0) * 1000), last_ts + 1)
+            last_ts = timestamp_ms
+            capture_time = time.time() - (time.monotonic() - t_capture)
+            
+            rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+            result = detector.detect_for_video(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb), timestamp_ms)
+            
+            # 每张脸找到自己的槽位（机器人头），新出现的人先清空该头的平滑状态
+            slots = tracker.update(result.face_landmarks)
+            for slot in tracker.new_slots:
+                heads[slot].reset()
+            for face_idx, slot in enumerate(slots):
+                if slot >= 0 and face_idx < len(result.face_blendshapes):
+                    heads[slot].process(blendshapes_to_dict(result.face_blendshapes[face_idx]), capture_time,
+                                        timestamp_ms / 1000, time.monotonic() - t_capture)
+            
+            # 显示：关键点和每张脸对应的头编号
+            annotated = renderer.draw(rgb, result)
+            height, width = annotated.shape[:2]
+            for face_idx, slot in enumerate(slots):
+                cx, cy = face_center(result.face_landmarks[face_idx])
+                cv2.putText(annotated, f'head {slot}' if slot >= 0 else 'no head', (int(cx * width), int(cy * height)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 0), 2, cv2.LINE_AA)
+            cv2.imshow(WIN_NAME, cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR))
+            frame_count += 1
+            
+            wait = 1 if capture else max(1, int((interval - (time.monotonic() - frame_start)) * 1000))
+            if cv2.waitKey(wait) & 0xFF == ord('q'):
+                break
+        
+        print(f'\n处理帧数: {frame_count}, 当前跟踪人脸: {int(tracker.active.sum())}')
+        stopped.set()
+        if capture:
+            capture.join()
+        cap.release()
+        cv2.destroyAllWindows()
+    except Exception as e:
+        print(f"多人脸处理过程中出错: {str(e)}")
+    finally:
+        stopped.set()
+        detector.close()
+        close_head_connections()
+
+# ------------------ 模式7：演员校准 ------------------
+# 两个阶段：(名称, 时长, 控制台提示, 画面提示)
+CALIBRATION_PHASES = [
+    ('neutral', CALIBRATION_NEUTRAL_SECONDS, '保持放松的中性表情，直视镜头', 'NEUTRAL: relax, look at camera'),
+    ('extreme', CALIBRATION_EXTREME_SECONDS, '把每个表情做到最大：张嘴、闭眼、挑眉、皱眉、微笑、撇嘴、左右上下看',
+     'EXTREME: open jaw, blink, raise/lower brows, smile, look around'),
+]
+
+def mode_calibrate(performer, video_path=None):
+    """
+    录制中性表情和夸张表情两段（不指定视频时使用摄像头），求出每个通道的基线和峰值，
+    编译成查找表保存到 CALIBRATION_DIR/<演员名>.npz；两段原始 BlendShape 同时保存为录制文件，可用 calibration.py 重新编译
+    视频文件按视频内时间划分两个阶段
+    """
+    source = video_path or '摄像头'
+    print(f'[Mode7] 校准演员 {performer}: {source} (按 q 中止)')
+    if video_path and not os.path.exists(video_path):
+        print(f"错误: 视频路径不存在 - {video_path}")
+        return
+    
+    os.makedirs(CALIBRATION_DIR, exist_ok=True)
+    detector = build_detector(RunningMode.VIDEO)
+    renderer = LandmarkRenderer(level='contours')
+    stopped = threading.Event()
+    writers = {}
+    sessions = {name: [] for name, *_ in CALIBRATION_PHASES}
+    try:
+        cap = cv2.VideoCapture(video_path) if video_path else cv2.VideoCapture(0, cv2.CAP_DSHOW)
+        if not cap.isOpened():
+            print(f'错误: 无法打开 {source}')
+            return
+        capture = None
+        if not video_path:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            capture = LatestFrameCapture(cap, stopped)
+            capture.start()
+        
+        for name, *_ in CALIBRATION_PHASES:
+            writers[name] = RecordingWriter(os.path.join(CALIBRATION_DIR, f'{performer}_{name}.rfrec'))
+        phase = 0
+        print(f'[{CALIBRATION_PHASES[0][0]}] {CALIBRATION_PHASES[0][2]}')
+        t0 = time.monotonic()
+        phase_start = 0.0
+        last_ts = -1
+        seq = 0
+        angles = np.zeros(NUM_SERVOS, dtype=np.int16)
+        completed = False
+        while True:
+            if capture:
+                try:
+                    frame = capture.read(seq, timeout=1.0)
+                except EOFError:
+                    print("错误: 无法从摄像头读取帧")
+                    break
+                if frame is None:
+                    continue
+                seq, t_capture, frame_bgr = frame
+                now = t_capture - t0
+            else:
+                ret, frame_bgr = cap.read()
+                if not ret:
+                    break
+                now = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            timestamp_ms = max(int(now * 1000), last_ts + 1)
+            last_ts = timestamp_ms
+            
+            name, duration, _, overlay = CALIBRATION_PHASES[phase]
+            if now - phase_start >= duration:
+                phase += 1
+                if phase == len(CALIBRATION_PHASES):
+                    completed = True
+                    break
+                phase_start = now
+                name, duration, prompt, overlay = CALIBRATION_PHASES[phase]
+                print(f'[{name}] {prompt}')
+            
+            rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+            result = detector.detect_for_video(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb), timestamp_ms)
+            if result.face_blendshapes:
+                vector = blendshapes_to_vector(result.face_blendshapes[0])
+                sessions[name].append(vector)
+                writers[name].write(now, vector, servo_mapper.compute(vector, out=angles))
+            
+            annotated = renderer.draw(rgb, result)
+            cv2.putText(annotated, f'{overlay}  {duration - (now - phase_start):.0f}s', (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2, cv2.LINE_AA)
+            cv2.imshow(WIN_NAME, cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR))
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+        
+        stopped.set()
+        if capture:
+            capture.join()
+        cap.release()
+        cv2.destroyAllWindows()
+        for writer in writers.values():
+            writer.close()
+        
+        counts = {name: len(rows) for name, rows in sessions.items()}
+        print(f"\n有效帧数: {counts}")
+        # 视频提前结束时只要两段都有帧也照常编译
+        if not completed and not video_path:
+            print("校准中止，未生成校准文件")
+            return
+        lut, path, covered = calibrate(performer, sessions['neutral'], sessions['extreme'], profile_path(performer))
+        print_summary(lut, covered)
+        print(f"校准文件已保存: {path}（在 config.py 中设置 CALIBRATION_PROFILE = '{path}' 使用）")
+    except ValueError as e:
+        print(f"校准失败: {e}")
+    except Exception as e:
+        print(f"校准过程中出错: {str(e)}")
+    finally:
+        stopped.set()
+        for writer in writers.values():
+            writer.close()
+        detector.close()
+
 # ------------------ main ------------------
 if __name__ == '__main__':
     # 设置默认路径
@@ -213,6 +637,11 @@ if __name__ == '__main__':
         print('  python run.py 1 [image_path]   # 静态图模式 ')
         print('  python run.py 2                # 实时摄像头模式')
         print('  python run.py 3 [video_path]   # 视频文件模式 ')
+        print('  python run.py 4 <video_or_dir> [out_dir] [workers]   # 离线批量提取BlendShape（无窗口）')
+        print('  python run.py 5 <recording> [speed] [start_frame | --at SECONDS]   # 回放录制文件')
+        print('  python run.py 6 [video_path]   # 多人脸驱动多个机器人头（config.py 中 HEADS），不指定视频则用摄像头')
+        print('  python run.py 7 <performer> [video_path]   # 演员校准：录制中性/夸张表情，生成查找表')
+        print("  python run.py 8 <image_dir_or_glob> [out.npz] [workers]   # 批量处理图片集（无窗口），输出 BlendShape 和舵机角度")
         sys.exit(1)
     
     mode = sys.argv[1]
@@ -229,7 +658,43 @@ if __name__ == '__main__':
         if len(sys.argv) >= 3:
             video_path = sys.argv[2]
         mode_video(video_path)
+    elif mode == '4':
+        if len(sys.argv) < 3:
+            print('错误: 请指定视频文件或目录')
+            sys.exit(1)
+        out_dir = sys.argv[3] if len(sys.argv) >= 4 else BATCH_OUTPUT_DIR
+        workers = int(sys.argv[4]) if len(sys.argv) >= 5 else None
+        extract_blendshapes(sys.argv[2], out_dir, workers)
+    elif mode == '5':
+        if len(sys.argv) < 3:
+            print('错误: 请指定录制文件')
+            sys.exit(1)
+        speed = float(sys.argv[3]) if len(sys.argv) >= 4 else 1.0
+        if speed <= 0:
+            print('错误: 回放速度必须大于 0')
+            print('Usage: python run.py 5 <recording> [speed] [start_frame | --at SECONDS]')
+            sys.exit(1)
+        start_frame, start_seconds = 0, None
+        if len(sys.argv) >= 6 and sys.argv[4] == '--at':
+            start_seconds = float(sys.argv[5])
+        elif len(sys.argv) >= 5:
+            start_frame = int(sys.argv[4])
+        mode_replay(sys.argv[2], speed, start_frame, start_seconds)
+    elif mode == '6':
+        mode_multi(sys.argv[2] if len(sys.argv) >= 3 else None)
+    elif mode == '7':
+        if len(sys.argv) < 3:
+            print('错误: 请指定演员名')
+            sys.exit(1)
+        mode_calibrate(sys.argv[2], sys.argv[3] if len(sys.argv) >= 4 else None)
+    elif mode == '8':
+        if len(sys.argv) < 3:
+            print('错误: 请指定图片目录或通配符')
+            sys.exit(1)
+        out_path = sys.argv[3] if len(sys.argv) >= 4 else None
+        workers = int(sys.argv[4]) if len(sys.argv) >= 5 else None
+        extract_images(sys.argv[2], out_path, workers)
     else:
         print('错误: 无效的模式选择')
-        print('可用模式: 1 (静态图), 2 (摄像头), 3 (视频文件)')
+        print('可用模式: 1 (静态图), 2 (摄像头), 3 (视频文件), 4 (批量提取), 5 (回放), 6 (多人脸), 7 (校准), 8 (批量图片)')
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,254 @@
+# sender.py - 舵机命令发送线程：有界队列、断线自动重连，视觉循环永远不会被网络阻塞
+import collections
+import socket
+import threading
+import time
+import numpy as np
+from config import (PROTOCOL, TRANSPORT, NEGOTIATE_TIMEOUT, DEADBAND_ENABLED, DEADBAND_DEGREES, KEYFRAME_INTERVAL,
+                    SEND_QUEUE_SIZE, RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY, CONNECT_TIMEOUT)
+from protocol import FrameEncoder, TextEncoder, HELLO, HELLO_OK
+
+
+def negotiate_binary(sock, timeout=NEGOTIATE_TIMEOUT):
+    """
+    发送 HELLO 并等待服务器确认，成功返回 True
+    旧服务器不认识 HELLO，不会回复，超时后退回文本格式
+    """
+    reply = b""
+    try:
+        sock.sendall(HELLO)
+        sock.settimeout(timeout)
+        while not reply.endswith(b"\n") and len(reply) < len(HELLO_OK):
+            data = sock.recv(len(HELLO_OK) - len(reply))
+            if not data:
+                break
+            reply += data
+    except socket.timeout:
+        pass
+    finally:
+        sock.settimeout(None)
+    return reply == HELLO_OK
+
+
+class DeadbandFilter:
+    """
+    死区过滤：记录每个舵机上次发送的角度，只发送变化超过 deadband 的舵机
+    每隔 keyframe_interval 帧（或 request_keyframe 之后）发送一次全量关键帧，保证服务器状态不会漂移
+    """
+
+    def __init__(self, servo_ids, deadband=DEADBAND_DEGREES, keyframe_interval=KEYFRAME_INTERVAL):
+        self.index = np.asarray(servo_ids, dtype=np.intp) - 1
+        self.deadband = deadband
+        self.keyframe_interval = keyframe_interval
+        self.last_sent = np.zeros(len(self.index), dtype=np.int32)
+        self.frames_since_keyframe = 0
+        self.force_keyframe = True
+        # 统计
+        self.sent = 0
+        self.suppressed = 0
+        self.keyframes = 0
+
+    def request_keyframe(self):
+        """下一帧强制发送全量关键帧（例如重连之后）"""
+        self.force_keyframe = True
+
+    def select(self, angles):
+        """返回本帧需要发送的舵机掩码（与 servo_ids 对应），关键帧返回 None"""
+        current = angles[self.index]
+        if self.force_keyframe or self.frames_since_keyframe >= self.keyframe_interval:
+            self.force_keyframe = False
+            self.frames_since_keyframe = 0
+            self.keyframes += 1
+            self.last_sent[:] = current
+            self.sent += len(current)
+            return None
+        self.frames_since_keyframe += 1
+        mask = np.abs(current - self.last_sent) > self.deadband
+        self.last_sent[mask] = current[mask]
+        moved = int(np.count_nonzero(mask))
+        self.sent += moved
+        self.suppressed += len(current) - moved
+        return mask
+
+    def stats(self):
+        total = self.sent + self.suppressed
+        ratio = self.suppressed / total * 100 if total else 0
+        return f"发送 {self.sent}, 抑制 {self.suppressed} ({ratio:.1f}%), 关键帧 {self.keyframes}"
+
+
+class ServoSender(threading.Thread):
+    """
+    后台发送线程
+    - submit() 只把一帧放进有界队列就返回；队列满时丢弃最旧的帧
+    - 发送使用 sendall + TCP_NODELAY，不会截断命令
+    - 连接断开后按指数退避重连，重连成功先发送一帧最新的全量状态
+    - transport='udp' 时每帧一个数据报，始终是带序号的全量二进制帧（不做死区过滤，丢包不会造成状态漂移）
+    """
+
+    def __init__(self, host, port, servo_ids, protocol=PROTOCOL, queue_size=SEND_QUEUE_SIZE,
+                 deadband=DEADBAND_ENABLED, transport=TRANSPORT, profiler=None, verbose=True):
+        super().__init__(name=f'ServoSender-{host}:{port}', daemon=True)
+        self.host = host
+        self.port = port
+        self.servo_ids = list(servo_ids)
+        self.protocol = protocol
+        self.transport = transport
+        self.use_deadband = deadband and transport == 'tcp'
+        self.verbose = verbose
+        self.profiler = profiler    # 记录编码+发送耗时（'socket' 阶段）
+        self.sock = None
+        self.use_binary = False
+        self.encoder = None
+        self.deadband = DeadbandFilter(self.servo_ids)
+        self._queue = collections.deque(maxlen=queue_size)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._latest = None     # 最近一次提交的 (angles, capture_time, move_time)，重连后作为全量状态发送
+        self._seq = 0
+        # 统计
+        self.submitted = 0
+        self.dropped = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.connects = 0
+        self.send_errors = 0
+
+    # ---------- 视觉线程调用 ----------
+    def submit(self, angles, move_time, capture_time=None):
+        """提交一帧舵机角度（会复制一份），不阻塞"""
+        item = (np.array(angles, dtype=np.int16), time.time() if capture_time is None else capture_time, move_time)
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(item)
+            self._latest = item
+            self.submitted += 1
+            self._cond.notify()
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def stats(self):
+        text = (f"提交 {self.submitted}, 发送 {self.frames_sent} 帧/{self.bytes_sent} 字节, "
+                f"队列 {self.queue_depth}, 丢弃 {self.dropped}, 连接 {self.connects} 次, 发送失败 {self.send_errors}")
+        if self.use_deadband:
+            text += f", 舵机更新: {self.deadband.stats()}"
+        return text
+
+    def close(self, timeout=1.0):
+        """停止线程：已连接时先把队列里剩余的帧发完"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self.is_alive():
+            self.join(timeout)
+        self._disconnect()
+
+    # ---------- 发送线程 ----------
+    def run(self):
+        backoff = RECONNECT_MIN_DELAY
+        while True:
+            if self.sock is None:
+                with self._cond:
+                    if self._stopped:
+                        return
+                if not self._connect():
+                    # 指数退避，等待期间收到 close() 立即退出
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._stopped, backoff)
+                    backoff = min(backoff * 2, RECONNECT_MAX_DELAY)
+                    continue
+                backoff = RECONNECT_MIN_DELAY
+                # 断线期间排队的帧已经过期，只发送最新的全量状态
+                with self._cond:
+                    self._queue.clear()
+                    snapshot = self._latest
+                self.deadband.request_keyframe()
+                if snapshot is not None:
+                    self._send(*snapshot)
+                continue
+
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._stopped, 0.5)
+                item = self._queue.popleft() if self._queue else None
+                if item is None and self._stopped:
+                    return
+            if item is not None:
+                self._send(*item)
+
+    def _connect(self):
+        if self.transport == 'udp':
+            return self._connect_udp()
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.use_binary = self.protocol == 'binary' and negotiate_binary(sock)
+        except OSError as e:
+            if self.verbose:
+                print(f"\n连接失败: {self.host}:{self.port} - {e}")
+            return False
+        encoder_cls = FrameEncoder if self.use_binary else TextEncoder
+        self.encoder = encoder_cls(self.servo_ids)
+        self.sock = sock
+        self.connects += 1
+        if self.verbose:
+            print(f"\n已连接到舵机控制服务器: {self.host}:{self.port}, 通讯格式: {'二进制帧' if self.use_binary else '文本'}")
+        return True
+
+    def _connect_udp(self):
+        """UDP 没有握手，connect 只是固定目标地址，直接使用二进制帧"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect((self.host, self.port))
+        except OSError as e:
+            if self.verbose:
+                print(f"\n创建UDP套接字失败: {self.host}:{self.port} - {e}")
+            return False
+        self.use_binary = True
+        self.encoder = FrameEncoder(self.servo_ids)
+        self.sock = sock
+        self.connects += 1
+        if self.verbose:
+            print(f"\n舵机命令通过UDP发送到: {self.host}:{self.port}")
+        return True
+
+    def _disconnect(self):
+        sock, self.sock = self.sock, None
+        if sock:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _send(self, angles, capture_time, move_time):
+        # 死区过滤：只发送变化超过死区的舵机，mask 为 None 表示关键帧（全部发送）
+        mask = self.deadband.select(angles) if self.use_deadband else None
+        if mask is not None and not mask.any():
+            return
+        t = time.monotonic()
+        self._seq += 1
+        # 发送时间戳在写入套接字前一刻填入，服务器由它统计纯传输延迟（不含排队）
+        data = self.encoder.encode(self._seq, capture_time, angles, move_time, mask, sent=time.time())
+        try:
+            self.sock.sendall(data)
+        except OSError as e:
+            self.send_errors += 1
+            if self.transport == 'udp':
+                # 服务器未启动时会收到 ICMP 端口不可达，丢掉这一帧即可，无需重建套接字
+                return
+            if self.verbose:
+                print(f" | 命令发送失败: {e}，准备重连", end='', flush=True)
+            self._disconnect()
+            return
+        if self.profiler:
+            self.profiler.lap('socket', t)
+        self.frames_sent += 1
+        self.bytes_sent += len(data)
+        if self.verbose:
+            print(f"\r  | 已发送 #{self._seq} ({len(data)} 字节)    ", end='', flush=True)
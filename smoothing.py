@@ -0,0 +1,217 @@
+# smoothing.py - 数组化的 BlendShape 时序滤波：52 个通道一次向量运算，状态和中间结果全部预分配
+#
+# 三种滤波器，参数按通道分组配置（config.SMOOTHING_GROUPS / SMOOTHING_PARAMS）:
+#   ema      指数平滑，alpha 越小越平滑
+#   one_euro One Euro 滤波：静止时按 min_cutoff 强平滑，变化越快截止频率越高（beta），眨眼跟得上、注视不抖
+#   kalman   匀速模型卡尔曼滤波：q 为加速度过程噪声，r 为测量噪声方差
+import math
+import time
+import numpy as np
+from config import BS_NAMES, SMOOTHING_FILTER, SMOOTHING_GROUPS, SMOOTHING_PARAMS
+
+
+def channel_params(key, groups=SMOOTHING_GROUPS, params=SMOOTHING_PARAMS):
+    """
+    按分组展开成 52 维参数数组：通道名以分组前缀开头则用该组参数，否则用 default
+    某组没有配置 key 时同样退回 default
+    """
+    default = params['default'][key]
+    values = np.full(len(BS_NAMES), default, dtype=np.float64)
+    for i, name in enumerate(BS_NAMES):
+        for group, prefixes in groups.items():
+            if name.startswith(tuple(prefixes)):
+                values[i] = params.get(group, {}).get(key, default)
+                break
+    return values
+
+
+class _Filter:
+    """滤波器公共部分：参数由 compile_params 预先展开成 52 维数组，set_params 只做替换，运行中可随时换参数而不丢状态"""
+
+    def set_params(self, compiled):
+        for key, values in compiled.items():
+            setattr(self, key, values[:self.size])
+
+
+class EmaFilter(_Filter):
+    """指数平滑: y += alpha * (x - y)"""
+
+    @staticmethod
+    def compile_params(groups=SMOOTHING_GROUPS, params=SMOOTHING_PARAMS):
+        return {'alpha': channel_params('alpha', groups, params)}
+
+    def __init__(self, size=len(BS_NAMES), compiled=None):
+        self.size = size
+        self.set_params(compiled or self.compile_params())
+        self.y = np.zeros(size)
+        self._tmp = np.zeros(size)
+        self.initialized = False
+
+    def reset(self):
+        self.initialized = False
+
+    def __call__(self, x, t, out):
+        if not self.initialized:
+            self.y[:] = x
+            self.initialized = True
+        else:
+            np.subtract(x, self.y, out=self._tmp)
+            self._tmp *= self.alpha
+            self.y += self._tmp
+        out[:] = self.y
+        return out
+
+
+class OneEuroFilter(_Filter):
+    """
+    One Euro 滤波（Casiez 2012），所有通道共用同一时间戳:
+        dx = (x - x_prev) / dt，先以 d_cutoff 平滑
+        cutoff = min_cutoff + beta * |dx|，a = 1 / (1 + 1 / (2π·cutoff·dt))，y += a * (x - y)
+    """
+
+    @staticmethod
+    def compile_params(groups=SMOOTHING_GROUPS, params=SMOOTHING_PARAMS):
+        return {
+            'min_cutoff': channel_params('min_cutoff', groups, params),
+            'beta': channel_params('beta', groups, params),
+            # d_cutoff 对应的时间常数 τ = 1 / (2π·d_cutoff)
+            'tau_d': 1 / (2 * math.pi * channel_params('d_cutoff', groups, params)),
+        }
+
+    def __init__(self, size=len(BS_NAMES), compiled=None):
+        self.size = size
+        self.set_params(compiled or self.compile_params())
+        self.y = np.zeros(size)
+        self.dy = np.zeros(size)
+        self._a = np.zeros(size)
+        self._tmp = np.zeros(size)
+        self.t_prev = None
+
+    def reset(self):
+        self.t_prev = None
+
+    def __call__(self, x, t, out):
+        if self.t_prev is None or t <= self.t_prev:
+            if self.t_prev is None:
+                self.y[:] = x
+                self.dy[:] = 0
+                self.t_prev = t
+            out[:] = self.y
+            return out
+        dt = t - self.t_prev
+        self.t_prev = t
+        a, tmp = self._a, self._tmp
+        # 导数及其平滑: a_d = 1 / (1 + τ_d / dt)
+        np.subtract(x, self.y, out=tmp)
+        tmp /= dt
+        np.divide(self.tau_d, dt, out=a)
+        a += 1
+        np.reciprocal(a, out=a)
+        tmp -= self.dy
+        tmp *= a
+        self.dy += tmp
+        # 自适应截止频率: a = 1 / (1 + 1 / (2π·cutoff·dt))
+        np.abs(self.dy, out=a)
+        a *= self.beta
+        a += self.min_cutoff
+        a *= 2 * math.pi * dt
+        np.reciprocal(a, out=a)
+        a += 1
+        np.reciprocal(a, out=a)
+        np.subtract(x, self.y, out=tmp)
+        tmp *= a
+        self.y += tmp
+        out[:] = self.y
+        return out
+
+
+class KalmanFilter(_Filter):
+    """
+    每个通道一个 [位置, 速度] 匀速模型卡尔曼滤波，协方差用三个数组 (P00, P01, P11) 表示
+    过程噪声 Q = q·[[dt⁴/4, dt³/2], [dt³/2, dt²]]，测量噪声 R = r
+    """
+
+    @staticmethod
+    def compile_params(groups=SMOOTHING_GROUPS, params=SMOOTHING_PARAMS):
+        return {'q': channel_params('q', groups, params), 'r': channel_params('r', groups, params)}
+
+    def __init__(self, size=len(BS_NAMES), compiled=None):
+        self.size = size
+        self.set_params(compiled or self.compile_params())
+        self.p = np.zeros(size)
+        self.v = np.zeros(size)
+        self.p00 = np.zeros(size)
+        self.p01 = np.zeros(size)
+        self.p11 = np.zeros(size)
+        self._k0 = np.zeros(size)
+        self._k1 = np.zeros(size)
+        self._innovation = np.zeros(size)
+        self._tmp = np.zeros(size)
+        self.t_prev = None
+
+    def reset(self):
+        self.t_prev = None
+
+    def __call__(self, x, t, out):
+        if self.t_prev is None or t <= self.t_prev:
+            if self.t_prev is None:
+                self.p[:] = x
+                self.v[:] = 0
+                self.p00[:] = self.r
+                self.p01[:] = 0
+                self.p11[:] = 1.0
+                self.t_prev = t
+            out[:] = self.p
+            return out
+        dt = t - self.t_prev
+        self.t_prev = t
+        k0, k1, tmp = self._k0, self._k1, self._tmp
+        # 预测: p += v·dt；P = F P Fᵀ + Q
+        np.multiply(self.v, dt, out=tmp)
+        self.p += tmp
+        np.multiply(self.p11, dt, out=tmp)          # P00 += dt·(2·P01 + dt·P11) + q·dt⁴/4
+        tmp += self.p01
+        tmp += self.p01
+        tmp *= dt
+        self.p00 += tmp
+        np.multiply(self.q, dt ** 4 / 4, out=tmp)
+        self.p00 += tmp
+        np.multiply(self.p11, dt, out=tmp)          # P01 += dt·P11 + q·dt³/2
+        self.p01 += tmp
+        np.multiply(self.q, dt ** 3 / 2, out=tmp)
+        self.p01 += tmp
+        np.multiply(self.q, dt ** 2, out=tmp)       # P11 += q·dt²
+        self.p11 += tmp
+        # 更新: S = P00 + r，K = [P00, P01] / S
+        np.add(self.p00, self.r, out=tmp)
+        np.divide(self.p00, tmp, out=k0)
+        np.divide(self.p01, tmp, out=k1)
+        innovation = self._innovation
+        np.subtract(x, self.p, out=innovation)
+        np.multiply(k0, innovation, out=tmp)
+        self.p += tmp
+        np.multiply(k1, innovation, out=tmp)
+        self.v += tmp
+        # P11 -= K1·P01 要用更新前的 P01；之后 P00、P01 都乘以 (1 - K0)
+        np.multiply(k1, self.p01, out=tmp)
+        self.p11 -= tmp
+        np.subtract(1, k0, out=tmp)
+        self.p01 *= tmp
+        self.p00 *= tmp
+        out[:] = self.p
+        return out
+
+
+FILTERS = {'ema': EmaFilter, 'one_euro': OneEuroFilter, 'kalman': KalmanFilter}
+
+
+def create_smoother(kind=SMOOTHING_FILTER, compiled=None):
+    """按名称创建滤波器，每张脸一个实例；compiled 为该滤波器 compile_params 的结果，默认取 config"""
+    if kind not in FILTERS:
+        raise ValueError(f'未知的平滑滤波器: {kind}，可选 {list(FILTERS)}')
+    return FILTERS[kind](compiled=compiled)
+
+
+def smooth(smoother, vector, timestamp=None):
+    """对 52 维向量原地滤波；timestamp 为秒，默认取 time.monotonic()"""
+    return smoother(vector, time.monotonic() if timestamp is None else timestamp, vector)
@@ -1,14 +1,26 @@
 # tools.py - 工具函数和舵机控制函数
-import socket
+import os
 import random
 import time
 import numpy as np
 import cv2
 from config import *
-
-# 全局socket连接
-client_socket = None
+from mapping import blendshapes_to_vector, NUM_BLENDSHAPES, NUM_SERVOS
+from recording import RecordingWriter
+from sender import ServoSender
+from adaptive import MoveTimeEstimator
+from smoothing import create_smoother, smooth
+from prediction import Predictor, predict
+from calibration import load_mapper, LutMapper
+from live_config import LiveConfig
+
+# 全局发送线程（负责连接、重连和发送）
+servo_sender = None
+# 当前帧率上限，配置热加载时会改变
+target_fps = FPS
 intervaltime = int(1/FPS * 1000)
+# 舵机移动时间跟随实际的命令间隔（初始为 intervaltime）
+move_timer = MoveTimeEstimator(intervaltime)
 
 # 调试模式开关
 DEBUG_MODE = False  # 设置为True启用详细调试信息
@@ -16,42 +28,195 @@ DEBUG_MODE = False  # 设置为True启用详细调试信息
 # 用于存储上次舵机角度值，用于检测变化
 last_servo_angles = {}
 
-# 用于平滑的全局变量：存储每个BlendShape的上一次平滑值
-blendshapes_smoothed = {}
-
-def init_socket_connection():
-    """初始化socket连接"""
-    global client_socket
-    try:
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect((ip, port))
-        print(f"已连接到舵机控制服务器: {ip}:{port}")
-    except Exception as e:
-        print(f"连接失败: {e}")
-        client_socket = None
+# 平滑滤波器（状态保存在预分配数组中；多人脸时每张脸一个）
+smoother = create_smoother()
+# 延迟补偿（平滑之后、映射之前）
+predictor = Predictor()
+
+# 参与控制的舵机
+# ACTIVE_SERVOS = list(range(1, 21))  #全部
+# ACTIVE_SERVOS = [1,11,12,14,15,16] #眼球，眼皮
+# ACTIVE_SERVOS = [6,13] #左右嘴（下巴）
+# ACTIVE_SERVOS = [4,5,9,10] # 上下颚?
+ACTIVE_SERVOS = [17,18,19,20] #眉毛
+# ACTIVE_SERVOS = [2,3,7,8] #脸颊 （牙后）
+
+# 编译好的映射引擎及每帧复用的缓冲区（设置了 CALIBRATION_PROFILE 时为该演员的查找表）
+servo_mapper = load_mapper(CALIBRATION_PROFILE)
+_bs_vector = np.zeros(NUM_BLENDSHAPES, dtype=np.float32)
+_servo_angles = np.zeros(NUM_SERVOS, dtype=np.int16)
+
+# 平滑开关和滤波器类型（配置热加载时会改变）
+smoothing_enabled = SMOOTHING_ENABLED
+smoothing_filter = SMOOTHING_FILTER
+smoothing_compiled = None   # None 即 config 中的参数
+
+# 配置热加载（LIVE_CONFIG_ENABLED 时由 start_live_config 启动）；各模式的自适应帧率登记在这里，帧率上限随配置更新
+live_config = None
+_rates = []
+
+# 会话录制（RECORD_ENABLED 时由 start_recording 打开）
+recorder = None
+_raw_bs_vector = np.zeros(NUM_BLENDSHAPES, dtype=np.float32)
+
+def init_socket_connection(profiler=None):
+    """
+    启动发送线程：连接、协商通讯格式和断线重连都在后台完成，不阻塞视觉循环
+    profiler: 可选的 StageProfiler，记录发送线程里编码+发送的耗时
+    """
+    global servo_sender
+    start_live_config()
+    servo_sender = ServoSender(ip, port, ACTIVE_SERVOS, profiler=profiler)
+    servo_sender.start()
 
 def close_socket_connection():
-    """关闭socket连接"""
-    global client_socket
-    if client_socket:
-        client_socket.close()
-        client_socket = None
+    """关闭发送线程和连接"""
+    global servo_sender
+    if servo_sender:
+        servo_sender.close()
+        print(f" \n 发送统计: {servo_sender.stats()}")
+        servo_sender = None
+    stop_live_config()
     print(" \n 已关闭舵机控制连接")
 
-def send_servo_commands(commands):
-    """发送舵机控制命令"""
-    if not client_socket:
-        print(" | 未连接到舵机服务器，跳过发送", end='', flush=True)
-        return
-    
+class HeadChannel:
+    """多人脸模式下的一个机器人头：独立的发送线程（持久连接、断线重连）、平滑和外推状态、移动时间"""
+
+    def __init__(self, host, port):
+        self.sender = ServoSender(host, port, ACTIVE_SERVOS)
+        self.smoother = create_smoother(smoothing_filter, smoothing_compiled)
+        self.predictor = Predictor()
+        self.angles = np.zeros(NUM_SERVOS, dtype=np.int16)
+        self.move_timer = MoveTimeEstimator(intervaltime)
+
+    def reset(self):
+        """换了一个人：清空平滑和外推状态，避免从上一个人的表情渐变过来"""
+        self.smoother.reset()
+        self.predictor.reset()
+
+    def process(self, blendshapes_dict, capture_time=None, timestamp=None, latency=0.0):
+        """映射并发送这张脸的舵机角度；timestamp、latency 的含义同 process_all_servos"""
+        angles = process_all_servos(blendshapes_dict, self, timestamp, latency)
+        move_time = self.move_timer.update() if ADAPTIVE_RATE else intervaltime
+        self.sender.submit(angles, move_time, capture_time)
+        return angles
+
+# 多人脸模式的机器人头连接池，下标即 FaceTracker 的槽位
+head_channels = []
+
+def init_head_connections(heads=HEADS):
+    """为每个机器人头启动一个发送线程"""
+    global head_channels
+    start_live_config()
+    head_channels = [HeadChannel(host, head_port) for host, head_port in heads]
+    for head in head_channels:
+        head.sender.start()
+    return head_channels
+
+def close_head_connections():
+    """关闭所有机器人头的连接"""
+    global head_channels
+    for i, head in enumerate(head_channels):
+        head.sender.close()
+        print(f" \n 头 {i} ({head.sender.host}:{head.sender.port}) 发送统计: {head.sender.stats()}")
+    head_channels = []
+    stop_live_config()
+
+def start_recording(path=None):
+    """开始录制本次会话，默认写到 RECORD_DIR/session_时间.rfrec"""
+    global recorder
+    if path is None:
+        os.makedirs(RECORD_DIR, exist_ok=True)
+        path = os.path.join(RECORD_DIR, time.strftime("session_%Y%m%d_%H%M%S.rfrec"))
     try:
-        command_str = " ".join(commands)  # 添加换行符
-        # if DEBUG_MODE:
-        print(f"\r  | 已发送命令: {command_str}    ", end='', flush=True)
-        command_str += "\n"  # 添加换行符
-        client_socket.send(command_str.encode())
+        recorder = RecordingWriter(path)
+        print(f"开始录制: {path}")
     except Exception as e:
-        print(f" | 命令发送失败: {e}", end='', flush=True)
+        print(f"创建录制文件失败: {e}")
+        recorder = None
+
+def stop_recording():
+    """结束录制"""
+    global recorder
+    if recorder:
+        recorder.close()
+        print(f" \n 录制结束: {recorder.path} ({recorder.frames} 帧)")
+        recorder = None
+
+def use_profile(path=None):
+    """切换演员：读取校准文件并替换映射引擎（下一帧生效），path 为空时恢复固定规则"""
+    global servo_mapper
+    mapper = load_mapper(path)
+    if live_config:
+        # 热加载的参数要套用在新演员的查找表上：交给监视线程重新编译，处理线程随后在帧间切换
+        live_config.set_profile(mapper if isinstance(mapper, LutMapper) else None)
+    else:
+        servo_mapper = mapper
+    return mapper
+
+def start_live_config(path=LIVE_CONFIG_PATH):
+    """启动配置热加载；文件已存在时立即加载，第一帧就生效"""
+    global live_config
+    if not LIVE_CONFIG_ENABLED or live_config:
+        return
+    live_config = LiveConfig(path, servo_mapper if isinstance(servo_mapper, LutMapper) else None)
+    live_config.start()
+
+def stop_live_config():
+    global live_config
+    if live_config:
+        live_config.stop()
+        print(f" \n 配置热加载: {live_config.stats()}")
+        live_config = None
+    _rates.clear()
+
+def track_rate(rate):
+    """登记自适应帧率，帧率上限随热加载的 fps 更新"""
+    if rate:
+        rate.set_max_fps(target_fps)
+        _rates.append(rate)
+    return rate
+
+def frame_interval():
+    """当前目标帧间隔（秒）"""
+    return 1 / target_fps
+
+def apply_live_settings(settings):
+    """在处理线程中、两帧之间整体换上新配置（映射引擎、平滑参数、帧率）"""
+    global servo_mapper, smoothing_enabled, smoothing_filter, smoothing_compiled, smoother, target_fps, intervaltime
+    t0 = time.perf_counter()
+    servo_mapper = settings.mapper
+    smoothing_enabled = settings.smoothing_enabled
+    # 同一种滤波器只换参数、保留状态；换了滤波器则新建（从下一帧重新开始）
+    filters = [smoother] + [head.smoother for head in head_channels]
+    if settings.smoothing_filter == smoothing_filter:
+        for f in filters:
+            f.set_params(settings.smoothing_compiled)
+    else:
+        smoothing_filter = settings.smoothing_filter
+        smoother = create_smoother(smoothing_filter, settings.smoothing_compiled)
+        for head in head_channels:
+            head.smoother = create_smoother(smoothing_filter, settings.smoothing_compiled)
+    smoothing_compiled = settings.smoothing_compiled
+    if settings.fps != target_fps:
+        target_fps = settings.fps
+        intervaltime = int(1000 / target_fps)
+        for rate in _rates:
+            rate.set_max_fps(target_fps)
+    print(f"\n[配置] v{settings.version} 已生效，切换耗时 {(time.perf_counter() - t0) * 1000:.3f} ms")
+
+def send_servo_commands(angles, capture_time=None):
+    """
+    发送舵机控制命令（放入发送队列后立即返回）
+    angles: 20个舵机角度（第i项对应舵机i+1），只发送 ACTIVE_SERVOS
+    capture_time: 该帧的采集时间(time.time())，写入二进制帧头，默认取当前时间
+    移动时间取实际的命令间隔，帧率变化时舵机动作仍然首尾相接
+    """
+    if not servo_sender:
+        print(" | 未连接到舵机服务器，跳过发送", end='', flush=True)
+        return
+    move_time = move_timer.update() if ADAPTIVE_RATE else intervaltime
+    servo_sender.submit(angles, move_time, capture_time)
 
 def map_value(value, from_min, from_max, to_min, to_max):
     """
@@ -79,292 +244,47 @@ def debug_servo_angle(servo_id, angle):
         print(f"\n舵机 {servo_id:2d}: {angle:6.1f}°", end='', flush=True)
         last_servo_angles[servo_id] = angle
 
-def smooth_blendshapes(blendshapes_dict):
-    """
-    对BlendShape值进行指数平滑
-    """
-    global blendshapes_smoothed
-    smoothed_dict = {}
-    for name, value in blendshapes_dict.items():
-        if name in blendshapes_smoothed:
-            # 指数平滑公式: smoothed_value = alpha * current + (1 - alpha) * previous
-            smoothed_value = SMOOTHING_ALPHA * value + (1 - SMOOTHING_ALPHA) * blendshapes_smoothed[name]
-        else:
-            smoothed_value = value
-        blendshapes_smoothed[name] = smoothed_value
-        smoothed_dict[name] = smoothed_value
-    return smoothed_dict
-
-
-# 舵机控制函数
-def control_servo_1(bs):
-    """左下眼皮控制"""
-    value = max(0,0.5-bs.get("eyeBlinkLeft", 0)) * SENSITIVITY["eyelid_left_close"]
-    min_angle, max_angle = servo_ranges[1]
-    angle = map_value(value, 0, 0.5, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(1, angle)
-    return f"1,{int(angle)},{intervaltime}"
-
-def control_servo_2(bs):
-    """牙后左上控制（脸皮上下）"""
-    value = bs.get("cheekSquintLeft", 0) * SENSITIVITY["cheek_left_up"]
-    min_angle, max_angle = servo_ranges[2]
-    angle = map_value(value, 0, 1, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(2, angle)
-    return f"2,{int(angle)},{intervaltime}"
-
-def control_servo_3(bs):
-    """牙后左下控制（脸皮前后）"""
-    # 使用嘴巴拉伸动作控制脸皮前后
-    value = bs.get("mouthStretchLeft", 0) * SENSITIVITY["cheek_left_forward"]  # 暂时使用jaw_open灵敏度
-    min_angle, max_angle = servo_ranges[3]
-    angle = map_value(value, 0, 1, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(3, angle)
-    return f"3,{int(angle)},{intervaltime}"
-
-
-def control_servo_4(bs):
-    """下颚颚左控制"""
-    value = bs.get("jawLeft", 0) * SENSITIVITY["jaw_open"]
-    min_angle, max_angle = servo_ranges[4]
-    angle = map_value(value, 0, 1, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(4, angle)
-    return f"4,{int(angle)},{intervaltime}"
-
-def control_servo_5(bs):
-    """上鄂左控制"""
-    value = bs.get("jawOpen", 0) * SENSITIVITY["jaw_open"]
-    min_angle, max_angle = servo_ranges[5]
-    angle = map_value(value, 0, 1, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(5, angle)
-    return f"5,{int(angle)},{intervaltime}"
-
-def control_servo_6(bs):
-    """左嘴控制 - 使用jawOpen数据"""
-    # 获取jawOpen值，范围0.0-1.0
-    jaw_open = bs.get("jawOpen", 0)
-    
-    # 将jawOpen值映射到舵机角度
-    # 当jawOpen=0.01时，角度=0度；当jawOpen=0.8时，角度=58度
-    min_jaw = 0.01
-    max_jaw = 0.8
-    min_angle = 0
-    max_angle = 58
-    
-    # 确保jawOpen在有效范围内
-    jaw_open = max(min(jaw_open, max_jaw), min_jaw)
-    
-    # 线性映射
-    angle = min_angle + (jaw_open - min_jaw) * (max_angle - min_angle) / (max_jaw - min_jaw)
-    
-    if DEBUG_MODE: debug_servo_angle(6, angle)
-    return f"6,{int(angle)},{intervaltime}"
-
-def control_servo_7(bs):
-    """右后牙上控制（脸皮上下）"""
-    value = bs.get("cheekSquintRight", 0) * SENSITIVITY["cheek_right_up"]
-    min_angle, max_angle = servo_ranges[7]
-    angle = map_value(value, 0, 1, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(7, angle)
-    return f"7,{int(angle)},{intervaltime}"
-
-def control_servo_8(bs):
-    """右后牙下控制（脸皮前后）"""
-    # 使用嘴巴拉伸动作控制脸皮前后
-    value = bs.get("mouthStretchRight", 0) * SENSITIVITY["cheek_right_forward"] 
-    min_angle, max_angle = servo_ranges[8]
-    angle = map_value(value, 0, 1, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(8, angle)
-    return f"8,{int(angle)},{intervaltime}"
-
-
-def control_servo_9(bs):
-    """下颚颚右控制"""
-    value = bs.get("jawRight", 0) * SENSITIVITY["jaw_open"]
-    min_angle, max_angle = servo_ranges[9]
-    angle = map_value(value, 0, 1, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(9, angle)
-    return f"9,{int(angle)},{intervaltime}"
-
-def control_servo_10(bs):
-    """上鄂右控制"""
-    value = bs.get("jawOpen", 0) * SENSITIVITY["jaw_open"]
-    min_angle, max_angle = servo_ranges[10]
-    angle = map_value(value, 0, 1, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(10, angle)
-    return f"10,{int(angle)},{intervaltime}"
-
-def control_servo_11(bs):
-    """眼球左右控制"""
-    left = max(bs.get("eyeLookOutLeft", 0), bs.get("eyeLookInRight", 0))
-    right = max(bs.get("eyeLookOutRight", 0), bs.get("eyeLookInLeft", 0))
-    
-    if left > right:
-        value = left * SENSITIVITY["eye_left"]
-        min_angle, max_angle = servo_ranges[11]
-        angle = map_value(value, 0, 1, 0, max_angle)  # 向左为正
-    else:
-        value = right * SENSITIVITY["eye_right"]
-        min_angle, max_angle = servo_ranges[11]
-        angle = map_value(value, 0, 1, min_angle, 0)  # 向右为负
-    
-    if DEBUG_MODE: debug_servo_angle(11, angle)
-    return f"11,{int(angle)},{intervaltime}"
-
-def control_servo_12(bs):
-    """眼球上下控制"""
-    up = max(bs.get("eyeLookUpLeft", 0), bs.get("eyeLookUpRight", 0))
-    down = max(bs.get("eyeLookDownLeft", 0), bs.get("eyeLookDownRight", 0))
-    
-    if up > down:
-        value = up * SENSITIVITY["eye_up"]
-        min_angle, max_angle = servo_ranges[12]
-        angle = map_value(value, 0, 1, 0, max_angle)  # 向上为正
-    else:
-        value = down * SENSITIVITY["eye_down"]
-        min_angle, max_angle = servo_ranges[12]
-        angle = map_value(value, 0, 1, min_angle, 0)  # 向下为负
-    
-    if DEBUG_MODE: debug_servo_angle(12, angle)
-    return f"12,{int(angle)},{intervaltime}"
-
-def control_servo_13(bs):
-    """右嘴控制 - 使用jawOpen数据"""
-    # 获取jawOpen值，范围0.0-1.0
-    jaw_open = bs.get("jawOpen", 0)
-    # 将jawOpen值映射到舵机角度
-    min_jaw = 0.01
-    max_jaw = 0.8
-    min_angle = 0
-    max_angle = 58
-    # 确保jawOpen在有效范围内
-    jaw_open = max(min(jaw_open, max_jaw), min_jaw)
-    
-    # 线性映射
-    angle = min_angle + (jaw_open - min_jaw) * (max_angle - min_angle) / (max_jaw - min_jaw)
-    
-    if DEBUG_MODE: debug_servo_angle(13, angle)
-    return f"13,{int(angle)},{intervaltime}"
-
-def control_servo_14(bs):
-    """左上眼皮控制"""
-    # value = (1.0-bs.get("eyeBlinkLeft", 0)) * SENSITIVITY["eyelid_left_close"]
-    # min_angle, max_angle = servo_ranges[14]
-    # angle = map_value(value, 0, 1, min_angle, max_angle)
-    value = max(0,0.5-bs.get("eyeBlinkLeft", 0)) * SENSITIVITY["eyelid_left_close"]
-    min_angle, max_angle = servo_ranges[14]
-    angle = map_value(value, 0, 0.5, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(14, angle)
-    return f"14,{int(angle)},{intervaltime}"
-
-def control_servo_15(bs):
-    """右上眼皮控制"""
-    # value = (1.0-bs.get("eyeBlinkRight", 0)) * SENSITIVITY["eyelid_right_close"]
-    # min_angle, max_angle = servo_ranges[15]
-    # angle = map_value(value, 0, 1, min_angle, max_angle)
-    value = max(0,0.5-bs.get("eyeBlinkRight", 0)) * SENSITIVITY["eyelid_right_close"]
-    min_angle, max_angle = servo_ranges[15]
-    angle = map_value(value, 0, 0.5, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(15, angle)
-    return f"15,{int(angle)},{intervaltime}"
-
-def control_servo_16(bs):
-    """右下眼皮控制"""
-    # value = (1.0-bs.get("eyeBlinkRight", 0)) * SENSITIVITY["eyelid_right_close"]
-    # min_angle, max_angle = servo_ranges[16]
-    # angle = map_value(value, 0, 1, min_angle, max_angle)
-    value = max(0,0.5-bs.get("eyeBlinkRight", 0)) * SENSITIVITY["eyelid_right_close"]
-    min_angle, max_angle = servo_ranges[16]
-    angle = map_value(value, 0, 0.5, min_angle, max_angle)
-    if DEBUG_MODE: debug_servo_angle(16, angle)
-    return f"16,{int(angle)},{intervaltime}"
-
-def control_servo_17(bs):
-    """右眉头控制 - 对应browDownRight(右眉头下降)"""
-    # 右眉头下降，舵机角度应向负方向运动
-    value = bs.get("browDownRight", 0) * SENSITIVITY["eyebrow_right_down"]
-    min_angle, max_angle = servo_ranges[17]
-    # 注意：正上负下，所以眉头下降应映射到负角度
-    angle = map_value(value, 0, 1, 0, min_angle)  # 从0到min_angle(负值)
-    if DEBUG_MODE: debug_servo_angle(17, angle)
-    return f"17,{int(angle)},{intervaltime}"
-
-def control_servo_18(bs):
-    """右眉尾控制 - 对应browOuterUpRight(右眉尾上升)"""
-    # 右眉尾上升，舵机角度应向正方向运动
-    value = bs.get("browOuterUpRight", 0) * SENSITIVITY["eyebrow_right_up"]
-    min_angle, max_angle = servo_ranges[18]
-    # 注意：正上负下，所以眉尾上升应映射到正角度
-    angle = map_value(value, 0, 1, 0, max_angle)  # 从0到max_angle(正值)
-    if DEBUG_MODE: debug_servo_angle(18, angle)
-    return f"18,{int(angle)},{intervaltime}"
-
-def control_servo_19(bs):
-    """左眉头控制 - 对应browDownLeft(左眉头下降)"""
-    # 左眉头下降，舵机角度应向负方向运动
-    value = bs.get("browDownLeft", 0) * SENSITIVITY["eyebrow_left_down"]
-    min_angle, max_angle = servo_ranges[19]
-    # 注意：正上负下，所以眉头下降应映射到负角度
-    angle = map_value(value, 0, 1, 0, min_angle)  # 从0到min_angle(负值)
-    if DEBUG_MODE: debug_servo_angle(19, angle)
-    return f"19,{int(angle)},{intervaltime}"
-
-def control_servo_20(bs):
-    """左眉尾控制 - 对应browOuterUpLeft(左眉尾上升)"""
-    # 左眉尾上升，舵机角度应向正方向运动
-    value = bs.get("browOuterUpLeft", 0) * SENSITIVITY["eyebrow_left_up"]
-    min_angle, max_angle = servo_ranges[20]
-    # 注意：正上负下，所以眉尾上升应映射到正角度
-    angle = map_value(value, 0, 1, 0, max_angle)  # 从0到max_angle(正值)
-    if DEBUG_MODE: debug_servo_angle(20, angle)
-    return f"20,{int(angle)},{intervaltime}"
-
-def process_all_servos(blendshapes_dict):
+def process_all_servos(blendshapes_dict, face=None, timestamp=None, latency=0.0):
     """
     处理所有舵机控制的总入口函数
-    返回: 舵机命令列表
+    face: 多人脸时为这张脸的 HeadChannel（各自的滤波器、外推、移动时间和角度缓冲区），默认用全局的一份
+    timestamp: 该帧的时间（秒），平滑和外推按它计算帧间隔，默认取当前时间
+    latency: 从采集到现在已经过的时间（秒），外推时间 = latency + 舵机移动时间
+    返回: 20个舵机角度的 int16 数组（第i项对应舵机i+1，每帧复用同一缓冲区）
     """
-    global blendshapes_smoothed
-        # 如果启用平滑，则对BlendShape值进行平滑处理
-    if SMOOTHING_ENABLED:
-        blendshapes_dict = smooth_blendshapes(blendshapes_dict)
+    # 有新编译好的配置则在这一帧开始前换上
+    if live_config and live_config.pending is not None:
+        settings = live_config.take()
+        if settings:
+            apply_live_settings(settings)
+    blendshapes_to_vector(blendshapes_dict, out=_bs_vector)
+    # 录制只针对单人脸（全局状态），保存平滑前的原始值，方便之后换参数重新映射
+    record = recorder and face is None
+    if record:
+        _raw_bs_vector[:] = _bs_vector
+    # 如果启用平滑，则对BlendShape向量原地滤波
+    if smoothing_enabled:
+        smooth(smoother if face is None else face.smoother, _bs_vector, timestamp)
+    # 如果启用外推，按舵机到位还需要的时间把各通道往前推
+    if PREDICTION_ENABLED:
+        timer = move_timer if face is None else face.move_timer
+        move_time = timer.interval_ms if ADAPTIVE_RATE else intervaltime
+        predict(predictor if face is None else face.predictor, _bs_vector, latency + move_time / 1000, timestamp)
     
-    commands = []
+    # 一次向量运算得到全部20个舵机角度
+    angles = servo_mapper.compute(_bs_vector, out=_servo_angles if face is None else face.angles)
     
     # 打印头部
     if DEBUG_MODE:
         print("\n" + "="*80)
         print("舵机角度调试信息:")
         print("="*80)
-    
-    # 调用每个舵机的控制函数
-    # for servo_id in range(1, 21):  #全部
-    # for servo_id in [1,11,12,14,15,16,0]: #眼球，眼皮
-    # for servo_id in [6,13,0]: #左右嘴（下巴）
-    # for servo_id in [4,5,9,10,0]: # 上下颚?
-    for servo_id in [17,18,19,20,0]: #眉毛
-    # for servo_id in [2,3,7,8,0]: #脸颊 （牙后）
-        try:
-            # 获取舵机控制函数
-            control_func = globals().get(f"control_servo_{servo_id}")
-            if control_func:
-                cmd = control_func(blendshapes_dict)
-                if cmd:
-                    commands.append(cmd)
-        except Exception as e:
-            print(f" | 舵机{servo_id}控制出错: {e}")
-    
-    # # 打印眼球位置信息
-    # eye_v_cmd = next((c for c in commands if c.startswith("12,")), None)
-    # eye_h_cmd = next((c for c in commands if c.startswith("11,")), None)
-    # if eye_v_cmd and eye_h_cmd:
-    #     v_angle = eye_v_cmd.split(",")[1]
-    #     h_angle = eye_h_cmd.split(",")[1]
-    #     print(f"\r眼球垂直: {v_angle}° | 水平: {h_angle}°    ", end='', flush=True)
-    
-    # 打印分隔线
-    if DEBUG_MODE:
+        for servo_id in ACTIVE_SERVOS:
+            debug_servo_angle(servo_id, angles[servo_id - 1])
         print('\n')
         print("="*80)
     
-    return commands
\ No newline at end of file
+    if record:
+        recorder.write(time.time(), _raw_bs_vector, angles)
+    
+    return angles
@@ -1,65 +1,92 @@
 #vs.py
 import mediapipe as mp
 from mediapipe import solutions
-from mediapipe.framework.formats import landmark_pb2
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
-from config import BS_CN
+from config import BS_CN, RENDER_LEVEL, RENDER_EVERY
 import cv2
 rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS']  # 支持中文的字体
 rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
 
 
-def draw_landmarks_on_image(rgb_image, detection_result):
+def _group_connections(connections, style):
     """
-    在图像上绘制人脸关键点
+    按 (颜色, 线宽) 把连线分组，每组的端点下标合成一个 (E,2) 数组，只在导入时计算一次
+    style 为 DrawingSpec（所有连线相同）或 {连线: DrawingSpec}
     """
-    face_landmarks_list = detection_result.face_landmarks
-    annotated_image = np.copy(rgb_image)
+    groups = {}
+    for connection in connections:
+        spec = style[connection] if isinstance(style, dict) else style
+        groups.setdefault((spec.color, spec.thickness), []).append(connection)
+    return [(color, thickness, np.array(sorted(pairs), dtype=np.intp))
+            for (color, thickness), pairs in groups.items()]
 
-    # 如果没有检测到人脸，直接返回原图
-    if not face_landmarks_list:
-        return annotated_image
+# 与 solutions.drawing_utils 默认样式相同的颜色/线宽，按绘制顺序: 网格 → 轮廓 → 虹膜
+_TESSELATION = _group_connections(solutions.face_mesh.FACEMESH_TESSELATION,
+                                  solutions.drawing_styles.get_default_face_mesh_tesselation_style())
+_CONTOURS = _group_connections(solutions.face_mesh.FACEMESH_CONTOURS,
+                               solutions.drawing_styles.get_default_face_mesh_contours_style())
+_IRISES = _group_connections(solutions.face_mesh.FACEMESH_IRISES,
+                             solutions.drawing_styles.get_default_face_mesh_iris_connections_style())
 
-    # 循环检测到的每个人脸
-    for idx in range(len(face_landmarks_list)):
-        face_landmarks = face_landmarks_list[idx]
+# 绘制级别: none 不画，contours 轮廓+虹膜，full 再加三角网格
+RENDER_GROUPS = {
+    'none': [],
+    'contours': _CONTOURS + _IRISES,
+    'full': _TESSELATION + _CONTOURS + _IRISES,
+}
 
-        # 绘制人脸关键点
-        face_landmarks_proto = landmark_pb2.NormalizedLandmarkList()
-        face_landmarks_proto.landmark.extend([
-            landmark_pb2.NormalizedLandmark(x=landmark.x, y=landmark.y, z=landmark.z) for landmark in face_landmarks
-        ])
 
-        # 绘制网格
-        solutions.drawing_utils.draw_landmarks(
-            image=annotated_image,
-            landmark_list=face_landmarks_proto,
-            connections=mp.solutions.face_mesh.FACEMESH_TESSELATION,
-            landmark_drawing_spec=None,
-            connection_drawing_spec=mp.solutions.drawing_styles
-            .get_default_face_mesh_tesselation_style())
-        
-        # 绘制轮廓
-        solutions.drawing_utils.draw_landmarks(
-            image=annotated_image,
-            landmark_list=face_landmarks_proto,
-            connections=mp.solutions.face_mesh.FACEMESH_CONTOURS,
-            landmark_drawing_spec=None,
-            connection_drawing_spec=mp.solutions.drawing_styles
-            .get_default_face_mesh_contours_style())
-        
-        # 绘制虹膜
-        solutions.drawing_utils.draw_landmarks(
-            image=annotated_image,
-            landmark_list=face_landmarks_proto,
-            connections=mp.solutions.face_mesh.FACEMESH_IRISES,
-            landmark_drawing_spec=None,
-            connection_drawing_spec=mp.solutions.drawing_styles
-            .get_default_face_mesh_iris_connections_style())
+def landmarks_to_pixels(face_landmarks, width, height):
+    """
+    归一化关键点 → 像素坐标 (N,2) int32，以及是否在画面内 (N,)
+    换算方式与 drawing_utils 相同: floor(x*w)，不超过 w-1；画面外的点不画
+    """
+    xy = np.array([(landmark.x, landmark.y) for landmark in face_landmarks], dtype=np.float64).reshape(-1, 2)
+    valid = ((xy >= 0) & (xy <= 1)).all(axis=1)
+    pixels = np.floor(xy * (width, height)).astype(np.int32)
+    np.minimum(pixels, (width - 1, height - 1), out=pixels)
+    return pixels, valid
+
+
+class LandmarkRenderer:
+    """
+    向量化的关键点绘制：每组连线一次 cv2.polylines 调用
+    level 为 none / contours / full；every=N 时每 N 帧画一次，其余帧原样返回
+    """
 
-    return annotated_image
+    def __init__(self, level=RENDER_LEVEL, every=RENDER_EVERY):
+        if level not in RENDER_GROUPS:
+            raise ValueError(f'未知的绘制级别: {level}，可选 {list(RENDER_GROUPS)}')
+        self.level = level
+        self.groups = RENDER_GROUPS[level]
+        self.every = max(1, int(every))
+        self.frame = 0
+
+    def draw(self, image, detection_result, copy=False):
+        """在 image 上绘制（copy=False 时直接画在传入的缓冲区里），返回绘制后的图像"""
+        self.frame += 1
+        if copy:
+            image = np.copy(image)
+        if not self.groups or (self.frame - 1) % self.every:
+            return image
+        height, width = image.shape[:2]
+        for face_landmarks in detection_result.face_landmarks:
+            pixels, valid = landmarks_to_pixels(face_landmarks, width, height)
+            all_valid = valid.all()
+            for color, thickness, connections in self.groups:
+                if not all_valid:
+                    connections = connections[valid[connections].all(axis=1)]
+                cv2.polylines(image, pixels[connections], False, color, thickness)
+        return image
+
+
+def draw_landmarks_on_image(rgb_image, detection_result, level='full'):
+    """
+    在图像副本上绘制人脸关键点（网格、轮廓、虹膜）
+    """
+    return LandmarkRenderer(level).draw(rgb_image, detection_result, copy=True)
 
 def display_image_with_matplotlib(image, title="人脸关键点检测结果"):
     """
@@ -1,108 +1,402 @@
-import socket
+import asyncio
+import struct
 import time
+import numpy as np
+from config import servo_ranges
+from protocol import HELLO, HELLO_OK, HEADER_SIZE, MAX_SEQ, ProtocolError, decode_header, decode_servos
 
 # 服务器配置
 HOST = '0.0.0.0'  # 监听所有网络接口
 PORT = 8888       # 监听端口
+VERBOSE = True    # 是否逐条打印收到的数据
+DEBUG_MOTION = False  # 是否打印每个控制周期变化的舵机位置（CONTROL_RATE 次/秒，只用于调试）
+STATS_INTERVAL = 5  # 统计打印间隔（秒）
+CONTROL_RATE = 200  # 运动控制频率（Hz）
+COUPLED_SERVOS = [(6, 13)]  # 必须保持相同角度的舵机对（左右嘴）
+SEQ_RESTART_WINDOW = 1000  # UDP 序号回退超过这么多帧视为客户端重启，而不是迟到的旧帧
+
+# 有效的舵机ID（servo_ranges 中的）；按ID查表，二进制舵机项的ID是 uint8，表长 256
+VALID_SERVO = np.zeros(256, dtype=bool)
+VALID_SERVO[[i for i in servo_ranges if 0 <= i < 256]] = True
+
+def valid_servo_id(servo_id):
+    return 0 <= servo_id < len(VALID_SERVO) and VALID_SERVO[servo_id]
+
+def valid_servos(servos):
+    """去掉舵机项数组中ID无效的项，返回 (有效的舵机项, 丢弃个数)"""
+    keep = VALID_SERVO[servos['servo_id']]
+    if keep.all():
+        return servos, 0
+    return servos[keep], int(len(keep) - np.count_nonzero(keep))
 
 def parse_data(data):
-    """解析接收到的舵机控制数据"""
+    """解析接收到的舵机控制数据，返回 (命令列表, 无效命令数)"""
     commands = []
+    invalid = 0
     # 按空格分割成单个舵机命令
     parts = data.strip().split()
     for part in parts:
         try:
             # 每个命令格式为 "舵机ID,角度,移动时间"
             servo_id, angle, move_time = part.split(',')
+            if not valid_servo_id(int(servo_id)):
+                raise ValueError(f'无效的舵机ID {servo_id}')
             commands.append({
                 'servo_id': int(servo_id),
                 'angle': int(angle),
                 'move_time': int(move_time)
             })
         except Exception as e:
+            invalid += 1
             print(f"解析错误: {part} - {e}")
-    return commands
-
-def simulate_servo_control(commands):
-    """模拟舵机控制（实际应用中替换为硬件控制）"""
-    print(f"执行 {len(commands)} 个舵机命令:")
-    for cmd in commands:
-        print(f"舵机 {cmd['servo_id']:2d}: 角度={cmd['angle']:3d}, 时间={cmd['move_time']}ms")
-        # 这里可以添加实际的舵机控制代码
-        # 例如: control_servo(cmd['servo_id'], cmd['angle'], cmd['move_time'])
-    
-    # 模拟执行时间
-    time.sleep(0.01)
+    return commands, invalid
 
-def main():
-    # 创建TCP socket
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    
-    # 设置端口重用选项
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    
-    try:
-        # 绑定到指定地址和端口
-        server_socket.bind((HOST, PORT))
-        print(f"服务器启动，监听 {HOST}:{PORT}")
-        
-        # 开始监听，最多5个等待连接
-        server_socket.listen(5)
+def parse_frames(buffer):
+    """
+    从缓冲区中解析所有完整的二进制帧，ID无效的舵机项被丢弃
+    返回: (帧列表[(序号, 采集时间戳, 发送时间戳, 舵机项数组, 丢弃的舵机项数)], 剩余未完整的字节)
+    """
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= HEADER_SIZE:
+        seq, timestamp, sent, count, size = decode_header(buffer, offset)
+        if len(buffer) - offset < size:
+            break
+        frames.append((seq, timestamp, sent, *valid_servos(decode_servos(buffer, offset, count))))
+        offset += size
+    return frames, buffer[offset:]
+
+def drive_servos(positions, changed):
+    """
+    把舵机位置输出到硬件（实际应用中替换为硬件控制）
+    positions: 20个舵机的当前角度（第i项对应舵机i+1），changed: 本周期角度有变化的舵机掩码
+    """
+    # 这里可以添加实际的舵机控制代码
+    # 例如: for servo_id in np.flatnonzero(changed) + 1: control_servo(servo_id, positions[servo_id - 1])
+    if DEBUG_MOTION:
+        moved = np.flatnonzero(changed)
+        print("舵机位置: " + " ".join(f"{i + 1}:{positions[i]}" for i in moved))
+
+class MotionScheduler:
+    """
+    固定频率的运动调度：每个控制周期把全部20个舵机从当前位置按 move_time 线性插值到最新目标
+    目标角度限制在 servo_ranges 内，舵机6和13（左右嘴）始终保持相同
+    """
+
+    def __init__(self, ranges=servo_ranges):
+        ids = sorted(ranges)
+        self.low = np.array([ranges[i][0] for i in ids], dtype=np.float64)
+        self.high = np.array([ranges[i][1] for i in ids], dtype=np.float64)
+        n = len(ids)
+        self.position = np.zeros(n)      # 当前角度（初始值均为0）
+        self.start = np.zeros(n)         # 本段运动的起点
+        self.target = np.zeros(n)        # 目标角度
+        self.t_start = np.zeros(n)       # 本段运动开始时间
+        self.duration = np.zeros(n)      # 本段运动时长（秒）
+        self.output = np.zeros(n, dtype=np.int16)
+        self._ids = np.zeros(n, dtype=np.intp)
+        self._angles = np.zeros(n)
+        self._times = np.zeros(n)
+
+    def set_targets(self, commands, now):
+        """设置新目标：从当前位置出发，在 move_time 内到达"""
+        count = len(commands)
+        if not count:
+            return
+        ids, angles, times = self._ids[:count], self._angles[:count], self._times[:count]
+        for k, cmd in enumerate(commands):
+            ids[k] = cmd['servo_id'] - 1
+            angles[k] = cmd['angle']
+            times[k] = cmd['move_time']
+        self.start[ids] = self.position[ids]
+        self.target[ids] = np.clip(angles, self.low[ids], self.high[ids])
+        self.t_start[ids] = now
+        self.duration[ids] = times / 1000.0
+        # 联动舵机：本批命令中最后出现的那个为准，另一个完全复制它的运动
+        for a, b in COUPLED_SERVOS:
+            hits = [cmd['servo_id'] for cmd in commands if cmd['servo_id'] in (a, b)]
+            if hits:
+                src = hits[-1] - 1
+                dst = (b if hits[-1] == a else a) - 1
+                for arr in (self.position, self.start, self.target, self.t_start, self.duration):
+                    arr[dst] = arr[src]
+
+    def step(self, now):
+        """推进一个控制周期，返回 (整数角度, 变化掩码)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            progress = (now - self.t_start) / self.duration
+        # move_time 为0（或已到时间）直接到位
+        progress = np.where(self.duration > 0, np.clip(progress, 0.0, 1.0), 1.0)
+        self.position = self.start + (self.target - self.start) * progress
+        output = np.rint(self.position).astype(np.int16)
+        changed = output != self.output
+        self.output = output
+        return output, changed
+
+class PendingTargets:
+    """
+    每个舵机只保留最新的待执行目标：一个控制周期内收到的多个目标只保留最后一个（合并），
+    不会形成积压
+    """
+
+    def __init__(self):
+        self.pending = {}             # servo_id -> 命令
+        # 统计
+        self.received = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.invalid = 0
+
+    def submit(self, commands, invalid=0):
+        """提交一批命令；invalid 为解析时已丢弃的无效命令数，ID无效的命令在这里也会被丢弃"""
+        self.invalid += invalid
+        self.received += invalid
+        for cmd in commands:
+            servo_id = int(cmd['servo_id'])
+            if not valid_servo_id(servo_id):
+                self.invalid += 1
+                continue
+            if servo_id in self.pending:
+                self.coalesced += 1
+            self.pending[servo_id] = {
+                'servo_id': servo_id,
+                'angle': int(cmd['angle']),
+                'move_time': int(cmd['move_time'])
+            }
+        self.received += len(commands)
+
+    def take(self):
+        """取出全部待执行目标（按舵机ID排序）"""
+        batch = [self.pending[k] for k in sorted(self.pending)]
+        self.pending = {}
+        self.applied += len(batch)
+        return batch
+
+    def stats(self):
+        return f"接收 {self.received}, 执行 {self.applied}, 合并丢弃过期命令 {self.coalesced}, 无效 {self.invalid}"
+
+class LatencyStats:
+    """
+    记录最近 size 帧的延迟样本（秒）:
+    transport 为 发送→接收，只含传输本身，用于比较不同传输方式的尾延迟；end_to_end 为 采集→接收
+    """
+
+    def __init__(self, size=4096):
+        self.transport = np.zeros(size)
+        self.end_to_end = np.zeros(size)
+        self.count = 0
+
+    def add(self, captured, sent, now=None):
+        now = time.time() if now is None else now
+        i = self.count % len(self.transport)
+        self.transport[i] = now - sent
+        self.end_to_end[i] = now - captured
+        self.count += 1
+
+    def recent(self, samples):
+        return samples[:min(self.count, len(samples))]
+
+    @staticmethod
+    def _format(samples):
+        data = samples * 1000
+        p50, p95, p99 = np.percentile(data, [50, 95, 99])
+        return f"p50 {p50:.2f}ms, p95 {p95:.2f}ms, p99 {p99:.2f}ms, max {data.max():.2f}ms"
+
+    def summary(self):
+        if not self.count:
+            return "无数据"
+        return (f"发送→接收 {self._format(self.recent(self.transport))}; "
+                f"采集→接收 {self._format(self.recent(self.end_to_end))}")
+
+class UdpServoProtocol(asyncio.DatagramProtocol):
+    """
+    UDP 接收：每个数据报是一整帧二进制命令
+    每个来源只执行序号比已执行帧更新的数据报，迟到（乱序）或重复的直接丢弃
+    """
+
+    def __init__(self, targets, latency):
+        self.targets = targets
+        self.latency = latency
+        self.last_seq = {}   # 来源地址 -> 已执行的最大序号
+        # 统计
+        self.accepted = 0
+        self.lost = 0        # 序号跳过的帧数（其中迟到的之后会从这里扣除）
+        self.reordered = 0   # 迟到或重复而被丢弃的帧数
+        self.invalid = 0
+
+    def datagram_received(self, data, addr):
+        try:
+            seq, timestamp, sent, count, size = decode_header(data)
+            if len(data) < size:
+                raise ProtocolError(f'数据报不完整: {len(data)}/{size} 字节')
+            commands, dropped = valid_servos(decode_servos(data, 0, count))
+        except (ProtocolError, struct.error) as e:
+            self.invalid += 1
+            if VERBOSE:
+                print(f"无效数据报 {addr[0]}:{addr[1]}: {e}")
+            return
         
+        last = self.last_seq.get(addr)
+        if last is not None:
+            ahead = (seq - last) & MAX_SEQ
+            if ahead == 0 or ahead > MAX_SEQ // 2:
+                behind = (last - seq) & MAX_SEQ
+                if behind < SEQ_RESTART_WINDOW:
+                    # 比已执行的帧旧：迟到或重复，丢弃
+                    self.reordered += 1
+                    if 0 < behind and self.lost > 0:
+                        self.lost -= 1
+                    return
+                # 序号大幅回退，视为客户端重启
+            else:
+                self.lost += ahead - 1
+        self.last_seq[addr] = seq
+        self.accepted += 1
+        self.latency.add(timestamp, sent)
+        if VERBOSE:
+            print(f"接收UDP帧 #{seq}: {len(commands)} 个舵机, 传输延迟 {(time.time() - sent) * 1000:.1f}ms")
+        self.targets.submit(commands, dropped)
+
+    def stats(self):
+        return f"UDP 接收 {self.accepted}, 丢失 {self.lost}, 乱序丢弃 {self.reordered}, 无效 {self.invalid}"
+
+async def handle_client(reader, writer, targets, latency):
+    """处理单个客户端：数据到达即解析，解析结果交给 targets 合并"""
+    addr = writer.get_extra_info('peername')
+    print(f"客户端已连接: {addr[0]}:{addr[1]}")
+    # 接收数据缓冲区
+    buffer = b""
+    binary = False  # 客户端握手后切换为二进制帧
+    try:
         while True:
-            print("等待客户端连接...")
-            client_socket, addr = server_socket.accept()
-            print(f"客户端已连接: {addr[0]}:{addr[1]}")
+            # 接收数据
+            data = await reader.read(4096)
+            if not data:
+                break
             
-            try:
-                # 接收数据缓冲区
-                buffer = b""
+            # 添加到缓冲区
+            buffer += data
+            
+            while buffer:
+                if binary:
+                    # 解析所有完整的二进制帧，不完整的留到下次
+                    frames, buffer = parse_frames(buffer)
+                    for seq, timestamp, sent, commands, dropped in frames:
+                        latency.add(timestamp, sent)
+                        if VERBOSE:
+                            print(f"接收帧 #{seq}: {len(commands)} 个舵机, 传输延迟 {(time.time() - sent) * 1000:.1f}ms")
+                        targets.submit(commands, dropped)
+                    break
+                
+                # 检查是否包含换行符（表示完整命令）
+                if b"\n" not in buffer:
+                    break
+                # 分割出第一个完整命令
+                line, buffer = buffer.split(b"\n", 1)
+                
+                # 握手：客户端请求二进制帧格式，之后的数据都按二进制帧解析
+                if line + b"\n" == HELLO:
+                    writer.write(HELLO_OK)
+                    await writer.drain()
+                    binary = True
+                    print(f"客户端 {addr[0]}:{addr[1]} 使用二进制帧格式")
+                    continue
                 
-                while True:
-                    # 接收数据
-                    data = client_socket.recv(1024)
-                    if not data:
-                        break
-                    
-                    # 添加到缓冲区
-                    buffer += data
-                    
-                    # 检查是否包含换行符（表示完整命令）
-                    while b"\n" in buffer:
-                        # 分割出第一个完整命令
-                        line, buffer = buffer.split(b"\n", 1)
-                        
-                        # 解码为字符串
-                        try:
-                            data_str = line.decode('utf-8')
-                        except UnicodeDecodeError:
-                            print("解码错误，跳过数据")
-                            continue
-                        
-                        print(f"接收数据: {data_str}")
-                        
-                        # 解析数据
-                        commands = parse_data(data_str)
-                        
-                        # 模拟舵机控制
-                        simulate_servo_control(commands)
+                # 解码为字符串
+                try:
+                    data_str = line.decode('utf-8')
+                except UnicodeDecodeError:
+                    print("解码错误，跳过数据")
+                    continue
                 
-                print("客户端断开连接")
-            except ConnectionResetError:
-                print("客户端强制断开连接")
-            except Exception as e:
-                print(f"处理客户端时出错: {e}")
-            finally:
-                client_socket.close()
-                print("客户端连接已关闭")
+                if VERBOSE:
+                    print(f"接收数据: {data_str}")
                 
+                # 解析数据
+                targets.submit(*parse_data(data_str))
+        
+        print(f"客户端断开连接: {addr[0]}:{addr[1]}")
+    except ConnectionResetError:
+        print("客户端强制断开连接")
+    except ProtocolError as e:
+        print(f"二进制帧格式错误，断开连接: {e}")
+    except Exception as e:
+        print(f"处理客户端时出错: {e}")
+    finally:
+        writer.close()
+        print("客户端连接已关闭")
+
+async def control_loop(targets, scheduler, rate=CONTROL_RATE):
+    """
+    固定频率控制循环：每个周期取出最新目标交给调度器，再一次性更新全部舵机位置
+    舵机运动只取决于控制频率和 move_time，与视觉帧到达的节奏无关
+    """
+    loop = asyncio.get_running_loop()
+    period = 1.0 / rate
+    next_tick = loop.time()
+    while True:
+        now = time.monotonic()
+        # 单个周期出错（例如某条命令异常）只跳过这一周期，不能让控制循环退出、所有舵机停止
+        try:
+            if targets.pending:
+                scheduler.set_targets(targets.take(), now)
+            positions, changed = scheduler.step(now)
+            if changed.any():
+                drive_servos(positions, changed)
+        except Exception as e:
+            print(f"控制周期出错，已跳过: {e}")
+        # 按绝对时间排下一个周期，避免误差累积
+        next_tick += period
+        delay = next_tick - loop.time()
+        if delay < 0:
+            # 落后超过一个周期就不再追赶
+            next_tick = loop.time()
+            delay = 0
+        await asyncio.sleep(delay)
+
+def print_stats(targets, tcp_latency, udp, udp_latency):
+    print(f"[统计] {targets.stats()}")
+    print(f"[统计] TCP 延迟: {tcp_latency.summary()}")
+    print(f"[统计] {udp.stats()}, 延迟: {udp_latency.summary()}")
+
+async def report(interval, *args):
+    """定期打印统计"""
+    while True:
+        await asyncio.sleep(interval)
+        print_stats(*args)
+
+async def serve():
+    targets = PendingTargets()
+    tcp_latency, udp_latency = LatencyStats(), LatencyStats()
+    server = await asyncio.start_server(
+        lambda r, w: handle_client(r, w, targets, tcp_latency), HOST, PORT, reuse_address=True)
+    # 同一端口同时接收 UDP 数据报
+    loop = asyncio.get_running_loop()
+    udp_transport, udp = await loop.create_datagram_endpoint(
+        lambda: UdpServoProtocol(targets, udp_latency), local_addr=(HOST, PORT))
+    print(f"服务器启动，监听 {HOST}:{PORT} (TCP + UDP)")
+    scheduler = MotionScheduler()
+    stats_args = (targets, tcp_latency, udp, udp_latency)
+    tasks = [asyncio.create_task(control_loop(targets, scheduler)),
+             asyncio.create_task(report(STATS_INTERVAL, *stats_args))]
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+        udp_transport.close()
+        print_stats(*stats_args)
+
+def main():
+    try:
+        asyncio.run(serve())
     except KeyboardInterrupt:
         print("\n服务器关闭中...")
     except Exception as e:
         print(f"服务器错误: {e}")
     finally:
-        server_socket.close()
         print("服务器已关闭")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()